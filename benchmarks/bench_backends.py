@@ -0,0 +1,249 @@
+"""Проверка совместимости и бенчмарк бэкендов хранилища из start.py.
+
+Для каждого бэкенда (SQLite бота, хранилище в памяти, DB-API с sqlite3 в роли
+локальной замены сетевой базы) сначала прогоняется общий набор проверок поведения,
+затем замеряются задержка, пропускная способность и пиковая память операций.
+Результаты пишутся в JSON в том же формате, что и у bench_storage.py.
+
+Запуск из корня проекта (нужен cfg.py с настройками бота):
+
+    python benchmarks/bench_backends.py --users 10000 --output bench_storage_backends.json
+    python benchmarks/bench_backends.py --dbapi-module psycopg --dbapi-dsn "dbname=bot" --dialect postgres
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib
+import json
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import UTC, datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import start  # noqa: E402
+from bench_storage import _git_revision, compare, measure  # noqa: E402
+
+
+def check_conformance(storage: start.Storage) -> list[str]:
+    """Прогнать общие проверки поведения хранилища; вернуть список нарушений (пустой — всё верно).
+
+    Хранилище должно быть пустым: проверки рассчитаны на чистую базу.
+    """
+
+    failures = []
+
+    def expect(condition: bool, message: str) -> None:
+        if not condition:
+            failures.append(message)
+
+    expect(storage.save_user(1) is True, "save_user: новый пользователь должен вернуть True")
+    expect(storage.save_user(1) is False, "save_user: повторное сохранение должно вернуть False")
+
+    expect(storage.get_balance(2) is None, "get_balance: без записи должен вернуть None")
+    storage.set_balance(2, 16.0, rollup={"credited": 16.0})
+    expect(storage.get_balance(2) == 16.0, "set_balance: баланс не сохранился")
+    storage.set_balance(2, 0.0)
+    expect(storage.get_balance(2) == 0.0, "set_balance: нулевой баланс должен читаться как 0.0, а не None")
+    expect(storage.save_user(2) is False, "set_balance: пользователь должен создаваться вместе с балансом")
+    expect(storage.add_balance(2, 5.5) == 5.5, "add_balance: прибавка к нулевому балансу")
+    expect(storage.add_balance(6, 3.0, rollup={"credited": 3.0}) == 3.0, "add_balance: баланс без записи считается нулём")
+    expect(storage.get_balance(6) == 3.0, "add_balance: баланс не сохранился")
+    expect(storage.save_user(6) is False, "add_balance: пользователь должен создаваться вместе с балансом")
+    expect(storage.hold_balance(6, 5.0) is None, "hold_balance: баланс меньше минимума не удерживается")
+    expect(storage.hold_balance(7, 0.0) is None, "hold_balance: без записи о балансе удерживать нечего")
+    expect(storage.hold_balance(2, 5.0) == 5.5, "hold_balance: должен вернуть удержанную сумму")
+    expect(storage.get_balance(2) == 0.0, "hold_balance: после удержания баланс должен быть 0.0")
+    storage.touch_user(1, "2025-01-01T00:00:00+00:00")
+
+    storage.save_user(3)
+    storage.save_user(4)
+    expect(storage.count_user_posts(3) == 0, "count_user_posts: у нового пользователя 0 постов")
+    for index in range(3):
+        storage.add_history(3, "@user", "anon", f"пост {index}", "2025-01-01 00:00:00 UTC")
+    storage.add_history(4, "—", "non_anon", "чужой пост", "2025-01-01 00:00:00 UTC")
+    expect(storage.count_user_posts(3) == 3, "count_user_posts: неверное число постов")
+
+    expect(storage.count_pending_submissions() == 0, "count_pending_submissions: в пустой базе 0 заявок")
+    first = storage.create_submission(5, "📨 Анонимное сообщение", "anon", "text", "привет")
+    second = storage.create_submission(5, "👤 От A", "non_anon", "photo", "", "file-1", 42, "media/a.jpg")
+    expect(second > first, "create_submission: номера заявок должны расти")
+    expect(storage.count_pending_submissions() == 2, "count_pending_submissions: должно быть 2 заявки")
+
+    fresh, expired = "2000-01-01T00:00:00+00:00", "9999-01-01T00:00:00+00:00"
+    expect(storage.claim_submission(first, 100, fresh) is None, "claim_submission: свободная заявка закрепляется")
+    expect(storage.claim_submission(first, 200, fresh) == 100, "claim_submission: должен вернуть держателя")
+    expect(
+        storage.set_submission_status(first, "approved", 200, "pending", fresh) is False,
+        "set_submission_status: чужое закрепление должно мешать решению",
+    )
+    expect(
+        storage.set_submission_status(first, "approved", 200, "pending", expired) is True,
+        "set_submission_status: просроченное закрепление не должно мешать решению",
+    )
+    expect(
+        storage.set_submission_status(first, "rejected", 100, "pending", expired) is False,
+        "set_submission_status: решение принимается только из ожидаемого статуса",
+    )
+    expect(storage.count_pending_submissions() == 1, "set_submission_status: решённая заявка не должна ждать")
+    expect(storage.get_submission(first)["status"] == "approved", "set_submission_status: статус не сохранился")
+    expect(storage.claim_submission(first, 100, fresh) is None, "claim_submission: решённую заявку не закрепить")
+
+    row = storage.get_submission(second)
+    expect(row is not None, "get_submission: заявка не найдена")
+    if row is not None:
+        for key, value in {
+            "id": second,
+            "user_id": 5,
+            "mode": "non_anon",
+            "msg_type": "photo",
+            "text": "",
+            "file_id": "file-1",
+            "message_id": 42,
+            "media_path": "media/a.jpg",
+            "status": "pending",
+        }.items():
+            expect(row[key] == value, f"get_submission: поле {key} = {row[key]!r}, ожидалось {value!r}")
+    expect(storage.get_submission(10**9) is None, "get_submission: несуществующая заявка должна вернуть None")
+    return failures
+
+
+def _backends(args: argparse.Namespace) -> dict:
+    """Собрать бэкенды для проверки: имя -> фабрика хранилища в указанном каталоге.
+
+    Сетевая база из --dbapi-dsn одна на оба этапа, поэтому для проверок она должна быть пустой.
+    """
+
+    def sqlite_backend(directory: Path) -> start.Storage:
+        start.DEFAULT_TENANT.data_dir = directory
+        start.DEFAULT_TENANT.storage = start.SQLiteStorage()
+        start.DEFAULT_TENANT.prepare()
+        return start.DEFAULT_TENANT.storage
+
+    def memory_backend(directory: Path) -> start.Storage:
+        return start.MemoryStorage()
+
+    def dbapi_backend(directory: Path) -> start.Storage:
+        if args.dbapi_module:
+            driver = importlib.import_module(args.dbapi_module)
+            storage = start.DBAPIStorage(lambda: driver.connect(args.dbapi_dsn), driver, dialect=args.dialect)
+        else:
+            directory.mkdir(parents=True, exist_ok=True)
+            storage = start.DBAPIStorage(lambda: sqlite3.connect(directory / "dbapi.db"), sqlite3, dialect="sqlite")
+        storage.init()
+        return storage
+
+    return {"sqlite": sqlite_backend, "memory": memory_backend, "dbapi": dbapi_backend}
+
+
+def _operations(storage: start.Storage, users: int, rng: random.Random) -> dict:
+    """Замеряемые операции над заранее заполненным хранилищем."""
+
+    next_new_user = iter(range(users + 1, users * 2 + 10**6))
+    return {
+        "save_user": lambda: storage.save_user(next(next_new_user) if rng.random() < 0.5 else rng.randint(1, users)),
+        "get_balance": lambda: storage.get_balance(rng.randint(1, users)),
+        "set_balance": lambda: storage.set_balance(rng.randint(1, users), float(rng.randint(0, 500))),
+        "add_balance": lambda: storage.add_balance(rng.randint(1, users), 16.0),
+        "add_history": lambda: storage.add_history(
+            rng.randint(1, users), "@bench", "anon", "Пост из бенчмарка", "2025-01-01 00:00:00 UTC"
+        ),
+        "count_user_posts": lambda: storage.count_user_posts(rng.randint(1, users)),
+        "create_submission": lambda: storage.create_submission(rng.randint(1, users), "📨", "anon", "text", "пост"),
+        "count_pending_submissions": lambda: storage.count_pending_submissions(),
+    }
+
+
+def _fill(storage: start.Storage, users: int, history_per_user: float, rng: random.Random) -> None:
+    """Заполнить хранилище синтетическими данными через его же интерфейс."""
+
+    for user_id in range(1, users + 1):
+        storage.save_user(user_id)
+        if rng.random() < 0.5:
+            storage.set_balance(user_id, float(rng.randint(1, 500)))
+    for index in range(int(users * history_per_user)):
+        storage.add_history(rng.randint(1, users), f"@user{index}", "anon", f"Пост №{index}", "2025-01-01 00:00:00 UTC")
+
+
+def run(args: argparse.Namespace) -> tuple[list[dict], bool]:
+    """Проверить и замерить все бэкенды; вернуть результаты и признак успешных проверок."""
+
+    results, conformant = [], True
+    with tempfile.TemporaryDirectory(prefix="bench_backends_") as tmp:
+        for name, factory in _backends(args).items():
+            if args.only and name not in args.only.split(","):
+                continue
+            storage = factory(Path(tmp) / name / "check")
+            failures = check_conformance(storage)
+            storage.close()
+            conformant = conformant and not failures
+            print(f"{'✅' if not failures else '❌'} {name}: проверки {'пройдены' if not failures else 'не пройдены'}")
+            for failure in failures:
+                print(f"    - {failure}")
+            if failures and not args.force:
+                continue
+
+            storage = factory(Path(tmp) / name / "bench")
+            rng = random.Random(args.users)
+            fill_started = time.perf_counter()
+            _fill(storage, args.users, args.history_per_user, rng)
+            print(f"  📦 {args.users} пользователей загружено за {time.perf_counter() - fill_started:.1f} c")
+            for op_name, operation in _operations(storage, args.users, rng).items():
+                result = {"size": args.users, **measure(f"{name}.{op_name}", operation, args.ops, args.budget)}
+                results.append(result)
+                print(
+                    f"  {op_name:<26} {result['mean_ms']:>9.3f} мс  p95 {result['p95_ms']:>9.3f} мс  "
+                    f"{result['ops_per_sec']:>10.1f} оп/с  пик {result['peak_kib']:>9.1f} КиБ"
+                )
+            storage.close()
+    return results, conformant
+
+
+def main() -> None:
+    """Разобрать аргументы, проверить бэкенды, замерить их и сохранить результаты."""
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000, help="сколько пользователей загрузить перед замерами")
+    parser.add_argument("--history-per-user", type=float, default=3.0, help="строк истории на пользователя")
+    parser.add_argument("--ops", type=int, default=500, help="максимум операций на функцию")
+    parser.add_argument("--budget", type=float, default=5.0, help="максимум секунд на функцию")
+    parser.add_argument("--only", help="проверить только эти бэкенды, через запятую (sqlite,memory,dbapi)")
+    parser.add_argument("--force", action="store_true", help="замерять бэкенд, даже если проверки не пройдены")
+    parser.add_argument("--dbapi-module", help="модуль драйвера DB-API сетевой базы (по умолчанию sqlite3)")
+    parser.add_argument("--dbapi-dsn", default="", help="строка подключения для драйвера")
+    parser.add_argument("--dialect", default="postgres", help="диалект SQL сетевой базы")
+    parser.add_argument("--output", type=Path, default=ROOT / "bench_storage_backends.json", help="куда записать JSON")
+    parser.add_argument("--compare", type=Path, help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимое замедление (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    results, conformant = run(args)
+    report = {
+        "meta": {
+            "revision": _git_revision(),
+            "created_at": datetime.now(UTC).isoformat(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "history_per_user": args.history_per_user,
+            "dbapi_module": args.dbapi_module or "sqlite3",
+        },
+        "results": results,
+    }
+    args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\n💾 Результаты сохранены в {args.output}")
+
+    regressions_ok = not args.compare or compare(results, args.compare, args.threshold)
+    if not conformant or not regressions_ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Микробенчмарк: разбор нажатий кнопок цепочкой regex-хэндлеров и единым роутером.
+
+Запуск из корня проекта (нужен cfg.py с настройками бота):
+
+    python benchmarks/bench_callbacks.py [--rounds 20000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from telegram import CallbackQuery, Update, User  # noqa: E402
+from telegram.ext import CallbackQueryHandler  # noqa: E402
+
+import start  # noqa: E402
+
+# Цепочка хэндлеров в том виде, в каком она регистрировалась до появления роутера.
+LEGACY_PATTERNS = [
+    "^back_to_menu$",
+    "^(anon|non_anon)$",
+    "^(text|photo|video|audio)$",
+    "^(confirm_send|cancel_send)$",
+    "^post_channel",
+    "^add_caption$",
+    "^profile$",
+    "^withdraw$",
+    "^withdraw_(confirm|cancel)$",
+    "^links$",
+    "^delete_post$",
+    "^delete_(confirm|cancel)$",
+    "^admin_panel$",
+    "^broadcast_start$",
+    "^sync_db$",
+]
+
+# Нажатия для замера: (старый callback_data, имя действия, аргументы).
+SAMPLES = [
+    ("back_to_menu", "back_to_menu", ()),
+    ("anon", "anon", ()),
+    ("photo", "photo", ()),
+    ("confirm_send", "confirm_send", ()),
+    ("post_channel:123456789", "mod_approve", (123456789,)),
+    ("profile", "profile", ()),
+    ("withdraw_confirm", "withdraw_confirm", ()),
+    ("delete_cancel", "delete_cancel", ()),
+    ("broadcast_start", "broadcast_start", ()),
+    ("sync_db", "sync_db", ()),
+]
+
+
+def _make_update(data: str) -> Update:
+    """Собрать Update с нажатием кнопки."""
+
+    user = User(1, "bench", False)
+    return Update(1, callback_query=CallbackQuery("1", user, "chat", data=data))
+
+
+async def _noop(*_args) -> None:
+    """Пустой обработчик для регистрации хэндлеров."""
+
+
+def bench_legacy(updates: list[Update], rounds: int) -> float:
+    """Среднее время (мкс) поиска хэндлера перебором regex-цепочки."""
+
+    handlers = [CallbackQueryHandler(_noop, pattern=pattern) for pattern in LEGACY_PATTERNS]
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for update in updates:
+            for handler in handlers:
+                if handler.check_update(update):
+                    break
+    return (time.perf_counter() - started) / (rounds * len(updates)) * 1e6
+
+
+def bench_router(updates: list[Update], rounds: int) -> float:
+    """Среднее время (мкс) проверки единого хэндлера и разбора callback_data роутером."""
+
+    handler = CallbackQueryHandler(start.callback_router)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for update in updates:
+            if handler.check_update(update):
+                start.decode_callback(update.callback_query.data)
+    return (time.perf_counter() - started) / (rounds * len(updates)) * 1e6
+
+
+def bench_rejects(rounds: int) -> float:
+    """Среднее время (мкс) отклонения устаревших и поддельных данных."""
+
+    valid = start.cb("mod_approve", 123456789)
+    samples = ["post_channel:123456789", "0a.AAAAAAAA", valid[:-1] + ("A" if valid[-1] != "A" else "B")]
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for data in samples:
+            assert start.decode_callback(data) is None
+    return (time.perf_counter() - started) / (rounds * len(samples)) * 1e6
+
+
+def main() -> None:
+    """Запустить замеры и вывести таблицу результатов."""
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20000, help="сколько раз прогнать набор нажатий")
+    args = parser.parse_args()
+
+    legacy_updates = [_make_update(legacy) for legacy, _, _ in SAMPLES]
+    router_updates = [_make_update(start.cb(name, *cb_args)) for _, name, cb_args in SAMPLES]
+
+    legacy = bench_legacy(legacy_updates, args.rounds)
+    router = bench_router(router_updates, args.rounds)
+    rejects = bench_rejects(args.rounds)
+
+    print(f"regex-цепочка ({len(LEGACY_PATTERNS)} хэндлеров): {legacy:.2f} мкс/нажатие")
+    print(f"роутер (словарь + подпись):       {router:.2f} мкс/нажатие")
+    print(f"отклонение устаревших/поддельных: {rejects:.2f} мкс/нажатие")
+    print(f"ускорение: x{legacy / router:.2f}")
+
+
+if __name__ == "__main__":
+    main()
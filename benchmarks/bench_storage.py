@@ -0,0 +1,232 @@
+"""Бенчмарк функций хранения из start.py на синтетических данных разного размера.
+
+Для каждого размера генерируется набор пользователей, балансов и истории сразу
+в SQLite и в текстовых файлах, после чего замеряются задержка, пропускная
+способность и пиковая память (tracemalloc) функций хранения. Результаты
+пишутся в JSON, который можно сравнить с прошлым прогоном.
+
+Запуск из корня проекта (нужен cfg.py с настройками бота):
+
+    python benchmarks/bench_storage.py --sizes 10000,100000 --output bench_storage.json
+    python benchmarks/bench_storage.py --compare bench_storage_old.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import UTC, datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import start  # noqa: E402
+
+# Доля пользователей с ненулевым балансом в синтетических данных.
+BALANCE_SHARE = 0.5
+# Сколько операций подряд замерять под tracemalloc (он сильно замедляет код).
+MEMORY_OPS = 5
+
+
+class _SilentBot:
+    """Бот-заглушка: принимает отправку сообщений и ничего не делает."""
+
+    async def send_message(self, *_args, **_kwargs) -> None:
+        return None
+
+
+def generate_fixture(directory: Path, users: int, history_per_user: float, seed: int = 42) -> None:
+    """Сгенерировать синтетические данные в SQLite и текстовых файлах start.py."""
+
+    rng = random.Random(seed)
+    now = start._utc_now_iso()
+    stamp = datetime.now(UTC).strftime("%Y-%m-%d %H:%M:%S UTC")
+    history_rows = int(users * history_per_user)
+
+    _point_storage(directory)
+    start._init_db()
+    conn = sqlite3.connect(start.tenant().db_path)
+    conn.executemany(
+        "INSERT INTO users(user_id, created_at) VALUES (?, ?);", ((uid, now) for uid in range(1, users + 1))
+    )
+    balances = [(uid, float(rng.randint(1, 500))) for uid in range(1, users + 1) if rng.random() < BALANCE_SHARE]
+    conn.executemany(
+        "INSERT INTO balances(user_id, balance, updated_at) VALUES (?, ?, ?);",
+        ((uid, balance, now) for uid, balance in balances),
+    )
+    history = [
+        (rng.randint(1, users), f"@user{i}", rng.choice(("anon", "non_anon")), f"Синтетический пост №{i}", stamp)
+        for i in range(history_rows)
+    ]
+    conn.executemany(
+        "INSERT INTO history(user_id, username, mode, content, created_at) VALUES (?, ?, ?, ?, ?);", history
+    )
+    conn.commit()
+    conn.close()
+
+    start._write_lines(start.tenant().users_file, [str(uid) for uid in range(1, users + 1)])
+    start._write_lines(start.tenant().balance_file, [f"{uid} {balance}" for uid, balance in balances])
+    start._write_lines(
+        start.tenant().history_file,
+        [
+            f"{uid} | {name} | {'Анонимное' if mode == 'anon' else 'Не анонимное'} | {content} | {created}"
+            for uid, name, mode, content, created in history
+        ],
+    )
+
+
+def _point_storage(directory: Path) -> None:
+    """Перенаправить пути хранения start.py в каталог с данными бенчмарка."""
+
+    start.DEFAULT_TENANT.data_dir = directory
+
+
+def _operations(users: int, rng: random.Random) -> dict:
+    """Собрать замеряемые операции: имя -> функция без аргументов."""
+
+    context = SimpleNamespace(bot=_SilentBot())
+    loop = asyncio.new_event_loop()
+    next_new_user = iter(range(users + 1, users * 2 + 10**6))
+
+    def author():
+        return SimpleNamespace(id=rng.randint(1, users), username="bench")
+
+    return {
+        "save_user": lambda: start.save_user(
+            next(next_new_user) if rng.random() < 0.5 else rng.randint(1, users)
+        ),
+        "get_balance": lambda: start.get_balance(rng.randint(1, users)),
+        "set_balance": lambda: start.set_balance(rng.randint(1, users), float(rng.randint(0, 500))),
+        "credit_user": lambda: loop.run_until_complete(start.credit_user(rng.randint(1, users), 16.0, context)),
+        "log_history": lambda: start.log_history(author(), "anon", "Пост из бенчмарка"),
+        "count_user_posts": lambda: start.count_user_posts(rng.randint(1, users)),
+        # Полная синхронизация тяжёлая и перезаписывает всё, поэтому идёт последней.
+        "sync_db_from_files": start.sync_db_from_files,
+    }
+
+
+def measure(name: str, operation, ops: int, budget: float) -> dict:
+    """Замерить задержку и пропускную способность операции, затем её пиковую память."""
+
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < ops and time.perf_counter() - started < budget:
+        op_started = time.perf_counter()
+        operation()
+        latencies.append(time.perf_counter() - op_started)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    for _ in range(min(MEMORY_OPS, len(latencies))):
+        operation()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "function": name,
+        "ops": len(latencies),
+        "mean_ms": statistics.fmean(latencies) * 1e3,
+        "p50_ms": latencies[len(latencies) // 2] * 1e3,
+        "p95_ms": latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1e3,
+        "ops_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "peak_kib": peak / 1024,
+    }
+
+
+def run(sizes: list[int], history_per_user: float, ops: int, budget: float) -> list[dict]:
+    """Прогнать все операции на всех размерах данных."""
+
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix=f"bench_{size}_") as tmp:
+            fixture_started = time.perf_counter()
+            generate_fixture(Path(tmp), size, history_per_user)
+            print(f"📦 {size} пользователей: данные готовы за {time.perf_counter() - fixture_started:.1f} c")
+            rng = random.Random(size)
+            for name, operation in _operations(size, rng).items():
+                op_count = 1 if name == "sync_db_from_files" else ops
+                result = {"size": size, **measure(name, operation, op_count, budget)}
+                results.append(result)
+                print(
+                    f"  {name:<20} {result['mean_ms']:>10.3f} мс  p95 {result['p95_ms']:>10.3f} мс  "
+                    f"{result['ops_per_sec']:>10.1f} оп/с  пик {result['peak_kib']:>10.1f} КиБ"
+                )
+    return results
+
+
+def _git_revision() -> str:
+    """Вернуть текущий коммит репозитория (если git доступен)."""
+
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: list[dict], baseline_path: Path, threshold: float) -> bool:
+    """Сравнить прогон с прошлым; вернуть True, если регрессий больше порога нет."""
+
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    previous = {(row["size"], row["function"]): row for row in baseline["results"]}
+    ok = True
+    print(f"\nСравнение с {baseline_path} (коммит {baseline['meta'].get('revision', '?')}):")
+    for row in results:
+        old = previous.get((row["size"], row["function"]))
+        if old is None or not old["mean_ms"]:
+            continue
+        ratio = row["mean_ms"] / old["mean_ms"]
+        marker = "🔴" if ratio > 1 + threshold else "🟢" if ratio < 1 - threshold else "⚪"
+        ok = ok and ratio <= 1 + threshold
+        print(f"  {marker} {row['size']:>8} {row['function']:<20} x{ratio:.2f}")
+    return ok
+
+
+def main() -> None:
+    """Разобрать аргументы, запустить замеры и сохранить результаты."""
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000", help="размеры через запятую, например 10000,100000,1000000")
+    parser.add_argument("--history-per-user", type=float, default=3.0, help="строк истории на пользователя")
+    parser.add_argument("--ops", type=int, default=200, help="максимум операций на функцию")
+    parser.add_argument("--budget", type=float, default=10.0, help="максимум секунд на функцию")
+    parser.add_argument("--output", type=Path, default=ROOT / "bench_storage.json", help="куда записать JSON")
+    parser.add_argument("--compare", type=Path, help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимое замедление (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    results = run(sizes, args.history_per_user, args.ops, args.budget)
+    report = {
+        "meta": {
+            "revision": _git_revision(),
+            "created_at": datetime.now(UTC).isoformat(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "history_per_user": args.history_per_user,
+        },
+        "results": results,
+    }
+    args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\n💾 Результаты сохранены в {args.output}")
+
+    if args.compare and not compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
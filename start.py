@@ -1,18 +1,56 @@
 from __future__ import annotations
 
+import argparse
+import asyncio
+import base64
+import bisect
+import contextvars
+import cProfile
+import csv
+import functools
+import gzip
+import hashlib
+import hmac
+import importlib.util
+import io
+import json
+import pstats
+import random
+import re
+import shutil
+import signal
 import sqlite3
-from datetime import UTC, datetime
+import tempfile
+import threading
+import time
+import tracemalloc
+import unicodedata
+import weakref
+from abc import ABC, abstractmethod
+from array import array
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import UTC, date, datetime, timedelta
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
 
+# Момент начала импорта тяжёлых зависимостей и настроек — для отчёта о времени запуска.
+_IMPORT_STARTED = time.perf_counter()
+
+import httpx
 from telegram import (
     InlineKeyboardButton,
     InlineKeyboardMarkup,
     InputFile,
     Update,
 )
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+from telegram.request import BaseRequest, HTTPXRequest
 from telegram.ext import (
+    Application,
     ApplicationBuilder,
+    BaseUpdateProcessor,
     CallbackQueryHandler,
     CommandHandler,
     ContextTypes,
@@ -29,8 +67,6 @@ TOKEN = TG_TOKEN
 PRIMARY_ADMIN_ID = MAIN_ADMIN
 # Дополнительный администратор, получающий копии обращений.
 SECONDARY_ADMIN_ID = SECOND_ADMIN
-# Список всех администраторов, которым пересылаются заявки.
-ADMIN_IDS = sorted({PRIMARY_ADMIN_ID, SECONDARY_ADMIN_ID})
 # Идентификатор канала для публикации одобренных постов.
 CHANNEL_ID = CHANNEL_FOR_PODPISKA
 
@@ -44,32 +80,197 @@ def _project_path(*parts: str) -> Path:
     return BASE_DIR.joinpath(*parts)
 
 
-# Каталог для хранения данных пользователей.
+# Каталог бота по умолчанию: users.txt, history.txt, balance.txt, база bot.db и снимки backups/.
 DATA_DIR = _project_path("data")
-DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 # Каталог для сохранения всех входящих медиафайлов.
 MEDIA_DIR = _project_path("media_daun")
-MEDIA_DIR.mkdir(parents=True, exist_ok=True)
 
-# Пути к файлам с пользователями, историей и балансами.
-USERS_FILE = _project_path("data", "users.txt")
-HISTORY_FILE = _project_path("data", "history.txt")
-BALANCE_FILE = _project_path("data", "balance.txt")
 # Путь к резервному видео, если пост без медиа.
 VIDEO_FALLBACK_PATH = _project_path("youra.mp4")
-# Путь к базе данных SQLite, где дублируются данные из текстовых файлов.
-DB_PATH = _project_path("data", "bot.db")
+# Дублировать ли каждую запись в users.txt, balance.txt и history.txt (устарело: есть снимки базы).
+TEXT_MIRROR_ENABLED = False
+
+# Интервал (сек) между автоматическими снимками базы; 0 — только вручную.
+BACKUP_INTERVAL = 6 * 3600
+# Сколько последних снимков хранить.
+BACKUP_KEEP = 14
+# Сжимать ли снимки gzip.
+BACKUP_COMPRESS = True
+# Сколько страниц базы копировать за один шаг онлайн-бэкапа.
+BACKUP_PAGES_PER_STEP = 256
+# Пауза (сек) между шагами онлайн-бэкапа, чтобы не мешать записи бота.
+BACKUP_STEP_SLEEP = 0.01
+
+# Сколько обновлений от разных пользователей обрабатывается одновременно.
+MAX_CONCURRENT_UPDATES = 32
+# Сколько обновлений может ждать своей очереди, прежде чем приём новых притормозит.
+MAX_PENDING_UPDATES = 1024
+# Порог ожидания в очереди (сек), после которого обновление попадает в лог.
+SLOW_QUEUE_WAIT = 1.0
+
+# Версия формата callback_data: после её смены старые кнопки считаются устаревшими.
+CALLBACK_VERSION = "1"
+
+# Через сколько дней повторно пробовать писать пользователям, которые заблокировали бота.
+BROADCAST_REPROBE_DAYS = 30
+# Сколько дней пользователь считается активным для сегмента рассылки.
+BROADCAST_ACTIVE_DAYS = 7
+# Как часто (сек) обновлять отметку последней активности пользователя в базе.
+LAST_SEEN_WRITE_INTERVAL = 3600
+# Сегменты аудитории рассылки и их подписи на кнопках.
+BROADCAST_SEGMENTS = {
+    "all": "👥 Все пользователи",
+    "active": f"🔥 Активные за {BROADCAST_ACTIVE_DAYS} дн.",
+    "balance": "💰 С балансом",
+    "posters": "📝 Присылали посты",
+}
+# Статусы доставки, после которых пользователь исключается из рассылок до перепроверки.
+DEAD_DELIVERY_STATUSES = ("forbidden", "not_found")
+
+# Классы событий для уведомлений админов и их названия в настройках и сводках.
+NOTIFY_EVENT_CLASSES = {
+    "submission": "📥 Новые заявки",
+    "credit": "💰 Начисления авторам",
+    "withdraw": "💸 Запросы на вывод",
+    "delete": "🗑 Запросы на удаление",
+    "warning": "⚠️ Предупреждения",
+}
+# Классы, которые по умолчанию приходят сразу; остальные собираются в сводку.
+NOTIFY_IMMEDIATE_DEFAULT = {"submission", "delete", "warning"}
+# Интервал (сек) между сводками уведомлений.
+NOTIFY_DIGEST_INTERVAL = 600
+# Сколько строк одного класса показывать в сводке.
+NOTIFY_DIGEST_LINES = 10
+# Сколько секунд заявка остаётся закреплённой за администратором, открывшим её.
+MODERATION_CLAIM_TTL = 600
+# Окно (часы), в котором повторно присланный пост считается дублем.
+DUPLICATE_WINDOW_HOURS = 72
+# Тексты короче стольких символов (после нормализации) на дубли не проверяются.
+DUPLICATE_MIN_TEXT = 20
+# Искать ли почти одинаковые тексты (MinHash по шинглам из слов), а не только точные совпадения.
+DUPLICATE_NEAR_ENABLED = True
+# Сколько слов в одном шингле.
+DUPLICATE_SHINGLE_WORDS = 3
+# Число хэш-функций MinHash и число полос LSH (хэш-функции делятся на полосы поровну).
+DUPLICATE_MINHASH_PERMUTATIONS = 32
+DUPLICATE_LSH_BANDS = 8
+# Оценка сходства Жаккара, начиная с которой текст считается почти дублем.
+DUPLICATE_NEAR_THRESHOLD = 0.7
+# Статусы заявок, повтор которых считается дублем (отклонённые и отменённые можно прислать снова).
+DUPLICATE_LIVE_STATUSES = ("pending", "approved", "published")
+# Как часто (сек) удалять отпечатки постов, вышедшие за окно поиска дублей.
+DUPLICATE_PRUNE_INTERVAL = 3600
+# Показатели статистики и их подписи на панели (в порядке вывода).
+ROLLUP_METRICS = {
+    "new_users": "👥 Новые пользователи",
+    "submissions": "📥 Заявки",
+    "submissions_anon": "   🕵️ анонимные",
+    "submissions_non_anon": "   👤 с именем",
+    "type_text": "   📝 текст",
+    "type_photo": "   📷 фото",
+    "type_video": "   🎥 видео",
+    "type_audio": "   🎵 аудио",
+    "published": "📢 Опубликовано",
+    "credited": "💰 Начислено, руб.",
+    "withdrawn": "💸 Выведено, руб.",
+}
+# Сколько дней хранить почасовую статистику (дневная и общая хранятся всегда).
+ROLLUP_HOURLY_KEEP_DAYS = 14
+# Как часто (сек) удалять устаревшую почасовую статистику.
+ROLLUP_PRUNE_INTERVAL = 24 * 3600
+# Сколько записей за раз учитывать при фоновом восстановлении статистики после обновления.
+ROLLUP_BACKFILL_CHUNK = 2000
+# Минимальная сумма (руб.) для запроса на вывод.
+WITHDRAW_MIN = 200
+# Сколько строк читать из базы за раз при выгрузке партии выплат в CSV.
+WITHDRAW_EXPORT_CHUNK = 500
+# Сколько неоплаченных партий показывать на экране выплат.
+WITHDRAW_BATCHES_SHOWN = 5
+# Сколько записей истории показывать на одной странице просмотра.
+HISTORY_PAGE_SIZE = 8
+# Сколько символов текста записи показывать при просмотре истории.
+HISTORY_PREVIEW_CHARS = 150
+# Сколько строк читать из базы за раз при выгрузке истории.
+HISTORY_EXPORT_CHUNK = 1000
+# Максимальный размер (байт) выгрузки истории: больше бот отправить в Telegram не может.
+HISTORY_EXPORT_MAX_BYTES = 50 * 1024 * 1024
+# Минимальный интервал (сек) между публикациями в канал.
+PUBLISH_INTERVAL = 300
+# Слоты публикаций "ЧЧ:ММ" по местному времени; пустой список — публиковать с интервалом PUBLISH_INTERVAL.
+PUBLISH_SLOTS: list[str] = []
+# Смещение местного времени от UTC (часы) для слотов публикаций и дней в статистике.
+PUBLISH_UTC_OFFSET_HOURS = 3
+# Как часто (сек) планировщик проверяет очередь публикаций.
+PUBLISH_TICK = 15
+# Базовая пауза (сек) перед повтором неудачной публикации; удваивается с каждой попыткой.
+PUBLISH_RETRY_BASE = 30
+# После стольких неудачных попыток публикация помечается как failed.
+PUBLISH_MAX_ATTEMPTS = 6
+# Сколько публикаций показывать на одной странице очереди.
+PUBLISH_PAGE_SIZE = 5
+# Канал, подписка на который нужна для работы с ботом.
+SUBSCRIBE_CHANNEL = "@Mind4Not0Found4"
+# Ссылки на чат и канал для раздела «Ссылки» и подписи публикаций.
+CHAT_URL = "https://t.me/+joXHChzNX542ZjZi"
+CHANNEL_URL = "https://t.me/+MRaBuj3Cx8gzZjEy"
+# Username бота, который указывается в подписи публикаций.
+BOT_USERNAME = "@School99InfBot"
+
+# Число потоков общего пула для тяжёлых операций с базой (снимки, синхронизация).
+DB_EXECUTOR_WORKERS = 4
+# Интервал (сек) между отчётами о нагрузке ботов в режиме нескольких токенов.
+TENANT_REPORT_INTERVAL = 300
+
+# Размеры пулов HTTP-соединений: долгий опрос getUpdates, обычные вызовы Bot API, загрузка и скачивание файлов.
+# В режиме нескольких ботов пулы вызовов и файлов общие для всех ботов процесса.
+HTTP_POOL_SIZES = {"poll": 1, "api": 64, "media": 8}
+# Таймауты (сек) по классам запросов: подключение, чтение, запись, ожидание свободного соединения.
+HTTP_TIMEOUTS = {
+    "poll": {"connect": 5.0, "read": 10.0, "write": 5.0, "pool": 1.0},
+    "api": {"connect": 5.0, "read": 10.0, "write": 10.0, "pool": 3.0},
+    "media": {"connect": 10.0, "read": 60.0, "write": 120.0, "pool": 30.0},
+}
+# Сколько секунд держать простаивающее соединение открытым для повторного использования.
+HTTP_KEEPALIVE_EXPIRY = 30.0
+# Использовать HTTP/2 для вызовов и файлов, если установлен пакет h2 (pip install "httpx[http2]").
+HTTP2_ENABLED = True
+# Сколько раз повторять безопасный запрос после сетевой ошибки.
+HTTP_RETRY_ATTEMPTS = 3
+# Базовая и максимальная пауза (сек) перед повтором; пауза случайная в пределах растущего окна.
+HTTP_RETRY_BASE = 0.5
+HTTP_RETRY_MAX = 8.0
+
+# Порт HTTP-проверки готовности (GET /ready и GET /health); 0 — не запускать.
+HEALTH_PORT = 0
+# Адрес, на котором слушает проверка готовности.
+HEALTH_HOST = "127.0.0.1"
+# Время запуска (сек) до начала приёма обновлений, после которого в лог пишется предупреждение.
+STARTUP_BUDGET = 1.0
+
+# Длительность (сек) снятия профиля CPU и трассировки памяти из админ-панели.
+PROFILE_SECONDS = 10
+# Сколько строк оставлять в отчётах профилировщика.
+PROFILE_TOP = 40
+
+# Сколько действий в секунду в среднем разрешено одному пользователю.
+FLOOD_RATE = 2.0
+# Сколько действий подряд пользователь может сделать без паузы.
+FLOOD_BURST = 8
+# Окно (сек), в котором повторное нажатие той же кнопки считается дублем.
+DUPLICATE_PRESS_WINDOW = 1.0
+# Глубина очереди обновлений, при которой бот перестаёт выполнять второстепенные действия.
+OVERLOAD_QUEUE_DEPTH = 200
+# Действия кнопок, которые можно пропустить при перегрузке.
+NON_CRITICAL_ACTIONS = {"profile", "links"}
 
-# Состояния пользователей во время диалога с ботом.
-user_states: Dict[int, Dict] = {}
 
 
 # ======================== УТИЛИТЫ ========================
 def _get_db_connection() -> sqlite3.Connection:
     """Создать подключение к SQLite с включённой поддержкой внешних ключей."""
 
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(tenant().db_path)
     conn.execute("PRAGMA foreign_keys = ON;")
     return conn
 
@@ -110,16 +311,182 @@ def _init_db() -> None:
         );
         """
     )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS deliveries (
+            user_id INTEGER PRIMARY KEY,
+            status TEXT NOT NULL,
+            error TEXT,
+            failures INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT NOT NULL,
+            last_ok_at TEXT
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS submissions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            author TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            msg_type TEXT NOT NULL,
+            text TEXT NOT NULL DEFAULT '',
+            file_id TEXT,
+            message_id INTEGER,
+            media_path TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            claimed_by INTEGER,
+            claimed_at TEXT,
+            decided_by INTEGER,
+            decided_at TEXT,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY(user_id) REFERENCES users(user_id)
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS publications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            submission_id INTEGER NOT NULL UNIQUE,
+            position INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TEXT NOT NULL,
+            last_error TEXT,
+            published_at TEXT,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY(submission_id) REFERENCES submissions(id)
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS admin_notify_prefs (
+            admin_id INTEGER NOT NULL,
+            event_class TEXT NOT NULL,
+            immediate INTEGER NOT NULL,
+            PRIMARY KEY(admin_id, event_class)
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS fingerprints (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            submission_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            value TEXT NOT NULL,
+            signature TEXT,
+            created_at TEXT NOT NULL
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS withdrawal_batches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            status TEXT NOT NULL DEFAULT 'exported',
+            created_by INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            paid_by INTEGER,
+            paid_at TEXT
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS withdrawals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            username TEXT,
+            amount REAL NOT NULL,
+            details TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            batch_id INTEGER,
+            created_at TEXT NOT NULL,
+            decided_by INTEGER,
+            decided_at TEXT,
+            FOREIGN KEY(user_id) REFERENCES users(user_id),
+            FOREIGN KEY(batch_id) REFERENCES withdrawal_batches(id)
+        );
+        """
+    )
+    _ensure_column(cur, "users", "last_seen_at", "TEXT")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_last_seen ON users(last_seen_at);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_history_user ON history(user_id);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_history_created ON history(created_at);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_balances_balance ON balances(balance);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_deliveries_status ON deliveries(status, updated_at);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_submissions_status ON submissions(status, id);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_publications_queue ON publications(status, position);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_publications_published ON publications(published_at);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_withdrawals_status ON withdrawals(status, id);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_withdrawals_batch ON withdrawals(batch_id, id);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_withdrawals_user ON withdrawals(user_id, status);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_withdrawal_batches_status ON withdrawal_batches(status, id);")
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS rollups (
+            period TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            value REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY(period, bucket, metric)
+        ) WITHOUT ROWID;
+        """
+    )
+    if cur.execute("SELECT 1 FROM rollups LIMIT 1;").fetchone() is None:
+        # Сам пересчёт идёт в фоне после старта (backfill_rollups); здесь только отметка, докуда считать.
+        cur.execute(
+            "INSERT OR IGNORE INTO meta(key, value) VALUES ('rollup_backfill', ?);",
+            (json.dumps({"before": _utc_now_iso()}),),
+        )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_fingerprints_lookup ON fingerprints(kind, value, created_at);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_fingerprints_created ON fingerprints(created_at);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_fingerprints_submission ON fingerprints(submission_id, kind);")
     conn.commit()
     conn.close()
 
 
+def _ensure_column(cur: sqlite3.Cursor, table: str, column: str, ddl: str) -> None:
+    """Добавить колонку в существующую таблицу, если её ещё нет (миграция старых баз)."""
+
+    columns = {row[1] for row in cur.execute(f"PRAGMA table_info({table});")}
+    if column not in columns:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl};")
+
+
 def _utc_now_iso() -> str:
     """Вернуть ISO-строку с текущим временем в UTC."""
 
     return datetime.now(UTC).isoformat()
 
 
+def _insert_user(cur: sqlite3.Cursor, user_id: int) -> bool:
+    """Добавить пользователя, если его ещё нет, и учесть его в статистике новых; вернуть True, если он новый.
+
+    Через эту функцию идут все вставки в users, чтобы живой счётчик new_users
+    совпадал с тем, что посчитал бы пересчёт по users.created_at.
+    """
+
+    cur.execute("INSERT OR IGNORE INTO users(user_id, created_at) VALUES (?, ?);", (user_id, _utc_now_iso()))
+    if cur.rowcount != 1:
+        return False
+    bump_rollups(cur, {"new_users": 1})
+    return True
+
+
 def _read_lines(path: Path) -> list[str]:
     """Безопасно прочитать строки из файла (если его нет, вернуть пустой список)."""
 
@@ -155,7 +522,7 @@ async def _save_media_file(message, context: ContextTypes.DEFAULT_TYPE, media_ty
         file = await context.bot.get_file(file_id)
         suffix = Path(getattr(file, "file_path", "")).suffix or default_suffix
         filename = f"{media_type}_{message.from_user.id}_{datetime.now(UTC).strftime('%Y%m%d%H%M%S')}{suffix}"
-        dest = MEDIA_DIR / filename
+        dest = tenant().media_dir / filename
         await file.download_to_drive(custom_path=str(dest))
         print(f"💾 Медиа сохранено: {dest}")
         return str(dest)
@@ -174,7 +541,7 @@ async def send_or_edit(
 ) -> None:
     """Отправить новое сообщение или отредактировать последнее от бота."""
 
-    state = user_states.setdefault(user_id, {})
+    state = tenant().user_states.setdefault(user_id, {})
     message_id = state.get("last_bot_message_id")
     if allow_edit and message_id:
         try:
@@ -186,7 +553,799 @@ async def send_or_edit(
     else:
         message = await context.bot.send_message(user_id, text, reply_markup=reply_markup)
     state["last_bot_message_id"] = message.message_id
-    user_states[user_id] = state
+    tenant().user_states[user_id] = state
+
+
+# ======================== ХРАНИЛИЩЕ ========================
+class Storage(ABC):
+    """Интерфейс хранилища пользователей, балансов, истории и заявок.
+
+    Бот в работе использует SQLiteStorage; MemoryStorage и DBAPIStorage
+    реализуют тот же интерфейс и нужны для тестов, нагрузочных прогонов и переезда
+    на сетевую SQL-базу. Балансы (включая удержание под вывод), активность
+    пользователей и статусы заявок меняются только через интерфейс; журнал заявок
+    на вывод и партии выплат, очередь публикаций, рассылки, отпечатки дублей и
+    снимки по-прежнему хранятся в SQLite. ``rollup`` — показатели статистики,
+    которые учитываются вместе с записью.
+    """
+
+    name = "base"
+
+    def init(self) -> None:
+        """Подготовить хранилище (создать таблицы)."""
+
+    def close(self) -> None:
+        """Освободить ресурсы хранилища."""
+
+    @abstractmethod
+    def save_user(self, user_id: int) -> bool:
+        """Добавить пользователя; вернуть True, если он новый."""
+
+    @abstractmethod
+    def get_balance(self, user_id: int) -> Optional[float]:
+        """Вернуть баланс или None, если записи о балансе нет."""
+
+    @abstractmethod
+    def set_balance(self, user_id: int, balance: float, rollup: Optional[Dict[str, float]] = None) -> None:
+        """Записать баланс (создав пользователя при необходимости)."""
+
+    @abstractmethod
+    def add_balance(self, user_id: int, amount: float, rollup: Optional[Dict[str, float]] = None) -> float:
+        """Атомарно прибавить сумму к балансу (создав запись при необходимости) и вернуть новый баланс."""
+
+    @abstractmethod
+    def hold_balance(self, user_id: int, minimum: float) -> Optional[float]:
+        """Атомарно списать весь баланс, если он не меньше minimum; вернуть списанную сумму или None."""
+
+    @abstractmethod
+    def touch_user(self, user_id: int, seen_at: str) -> None:
+        """Записать время последней активности пользователя."""
+
+    @abstractmethod
+    def add_history(self, user_id: int, username: str, mode: str, content: str, created_at: str) -> None:
+        """Добавить запись истории уже сохранённого пользователя."""
+
+    @abstractmethod
+    def count_user_posts(self, user_id: int) -> int:
+        """Посчитать записи пользователя в истории."""
+
+    @abstractmethod
+    def create_submission(
+        self,
+        user_id: int,
+        author: str,
+        mode: str,
+        msg_type: str,
+        text: str,
+        file_id: Optional[str] = None,
+        message_id: Optional[int] = None,
+        media_path: Optional[str] = None,
+    ) -> int:
+        """Сохранить заявку со статусом pending и вернуть её номер."""
+
+    @abstractmethod
+    def get_submission(self, submission_id: int):
+        """Вернуть заявку (доступ к полям по имени) или None."""
+
+    @abstractmethod
+    def count_pending_submissions(self) -> int:
+        """Посчитать заявки со статусом pending."""
+
+    @abstractmethod
+    def claim_submission(self, submission_id: int, admin_id: int, expired_before: str) -> Optional[int]:
+        """Закрепить ожидающую заявку за админом; вернуть ID другого админа, если она занята им позже expired_before."""
+
+    @abstractmethod
+    def set_submission_status(
+        self, submission_id: int, status: str, admin_id: int, expected: str, expired_before: str
+    ) -> bool:
+        """Перевести заявку из статуса expected в status, если её не держит другой админ; вернуть True при успехе."""
+
+
+class SQLiteStorage(Storage):
+    """Хранилище в файле SQLite текущего бота (основной вариант)."""
+
+    name = "sqlite"
+
+    def init(self) -> None:
+        """Таблицы создаёт _init_db() вместе с остальной схемой бота."""
+
+    def save_user(self, user_id: int) -> bool:
+        conn = _get_db_connection()
+        cur = conn.cursor()
+        is_new = _insert_user(cur, user_id)
+        conn.commit()
+        conn.close()
+        return is_new
+
+    def get_balance(self, user_id: int) -> Optional[float]:
+        conn = _get_db_connection()
+        row = conn.execute("SELECT balance FROM balances WHERE user_id = ?;", (user_id,)).fetchone()
+        conn.close()
+        return float(row[0]) if row is not None else None
+
+    def set_balance(self, user_id: int, balance: float, rollup: Optional[Dict[str, float]] = None) -> None:
+        conn = _get_db_connection()
+        cur = conn.cursor()
+        _insert_user(cur, user_id)
+        cur.execute(
+            "INSERT OR REPLACE INTO balances(user_id, balance, updated_at) VALUES (?, ?, ?);",
+            (user_id, balance, _utc_now_iso()),
+        )
+        if rollup:
+            bump_rollups(cur, rollup)
+        conn.commit()
+        conn.close()
+
+    def add_balance(self, user_id: int, amount: float, rollup: Optional[Dict[str, float]] = None) -> float:
+        conn = _get_db_connection()
+        cur = conn.cursor()
+        now = _utc_now_iso()
+        _insert_user(cur, user_id)
+        balance = cur.execute(
+            """
+            INSERT INTO balances(user_id, balance, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET balance = balance + excluded.balance, updated_at = excluded.updated_at
+            RETURNING balance;
+            """,
+            (user_id, amount, now),
+        ).fetchone()[0]
+        if rollup:
+            bump_rollups(cur, rollup)
+        conn.commit()
+        conn.close()
+        return float(balance)
+
+    def hold_balance(self, user_id: int, minimum: float) -> Optional[float]:
+        conn = _get_db_connection()
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE;")
+        row = cur.execute("SELECT balance FROM balances WHERE user_id = ?;", (user_id,)).fetchone()
+        if row is None or row[0] < minimum:
+            conn.rollback()
+            conn.close()
+            return None
+        cur.execute(
+            "UPDATE balances SET balance = balance - ?, updated_at = ? WHERE user_id = ?;",
+            (row[0], _utc_now_iso(), user_id),
+        )
+        conn.commit()
+        conn.close()
+        return float(row[0])
+
+    def touch_user(self, user_id: int, seen_at: str) -> None:
+        conn = _get_db_connection()
+        conn.execute("UPDATE users SET last_seen_at = ? WHERE user_id = ?;", (seen_at, user_id))
+        conn.commit()
+        conn.close()
+
+    def add_history(self, user_id: int, username: str, mode: str, content: str, created_at: str) -> None:
+        conn = _get_db_connection()
+        conn.execute(
+            "INSERT INTO history(user_id, username, mode, content, created_at) VALUES (?, ?, ?, ?, ?);",
+            (user_id, username, mode, content, created_at),
+        )
+        conn.commit()
+        conn.close()
+
+    def count_user_posts(self, user_id: int) -> int:
+        conn = _get_db_connection()
+        row = conn.execute("SELECT COUNT(*) FROM history WHERE user_id = ?;", (user_id,)).fetchone()
+        conn.close()
+        return int(row[0])
+
+    def create_submission(
+        self,
+        user_id: int,
+        author: str,
+        mode: str,
+        msg_type: str,
+        text: str,
+        file_id: Optional[str] = None,
+        message_id: Optional[int] = None,
+        media_path: Optional[str] = None,
+    ) -> int:
+        conn = _get_db_connection()
+        cur = conn.cursor()
+        _insert_user(cur, user_id)
+        cur.execute(
+            """
+            INSERT INTO submissions(user_id, author, mode, msg_type, text, file_id, message_id, media_path, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);
+            """,
+            (user_id, author, mode, msg_type, text, file_id, message_id, media_path, _utc_now_iso()),
+        )
+        submission_id = cur.lastrowid
+        bump_rollups(cur, {"submissions": 1, f"submissions_{mode}": 1, f"type_{msg_type}": 1})
+        conn.commit()
+        conn.close()
+        return submission_id
+
+    def get_submission(self, submission_id: int) -> Optional[sqlite3.Row]:
+        conn = _get_db_connection()
+        conn.row_factory = sqlite3.Row
+        row = conn.execute("SELECT * FROM submissions WHERE id = ?;", (submission_id,)).fetchone()
+        conn.close()
+        return row
+
+    def count_pending_submissions(self) -> int:
+        conn = _get_db_connection()
+        row = conn.execute("SELECT COUNT(*) FROM submissions WHERE status = 'pending';").fetchone()
+        conn.close()
+        return int(row[0])
+
+    def claim_submission(self, submission_id: int, admin_id: int, expired_before: str) -> Optional[int]:
+        conn = _get_db_connection()
+        cur = conn.cursor()
+        cur.execute(
+            """
+            UPDATE submissions SET claimed_by = ?, claimed_at = ?
+            WHERE id = ? AND status = 'pending'
+              AND (claimed_by IS NULL OR claimed_by = ? OR claimed_at < ?);
+            """,
+            (admin_id, _utc_now_iso(), submission_id, admin_id, expired_before),
+        )
+        holder = None
+        if cur.rowcount == 0:
+            row = cur.execute(
+                "SELECT claimed_by FROM submissions WHERE id = ? AND status = 'pending';", (submission_id,)
+            ).fetchone()
+            holder = row[0] if row else None
+        conn.commit()
+        conn.close()
+        return holder
+
+    def set_submission_status(
+        self, submission_id: int, status: str, admin_id: int, expected: str, expired_before: str
+    ) -> bool:
+        conn = _get_db_connection()
+        cur = conn.cursor()
+        cur.execute(
+            """
+            UPDATE submissions SET status = ?, decided_by = ?, decided_at = ?
+            WHERE id = ? AND status = ?
+              AND (claimed_by IS NULL OR claimed_by = ? OR claimed_at < ?);
+            """,
+            (status, admin_id, _utc_now_iso(), submission_id, expected, admin_id, expired_before),
+        )
+        changed = cur.rowcount == 1
+        conn.commit()
+        conn.close()
+        return changed
+
+
+class MemoryStorage(Storage):
+    """Хранилище в памяти процесса: словари и массивы вместо таблиц (только для тестов и бенчмарков).
+
+    История хранится столбцами (массив ID авторов и список записей), а число постов
+    каждого пользователя считается при записи, поэтому подсчёт не зависит от объёма истории.
+    Номера ожидающих заявок лежат в отсортированном массиве и убираются из него при решении.
+    """
+
+    name = "memory"
+
+    def __init__(self) -> None:
+        self.users: Dict[int, str] = {}
+        self.last_seen: Dict[int, str] = {}
+        self.balances: Dict[int, float] = {}
+        self.history_users = array("q")
+        self.history_rows: list[Tuple[str, str, str, str]] = []
+        self.post_counts: Counter[int] = Counter()
+        self.submissions: list[Dict[str, object]] = []
+        self.pending_ids = array("q")
+        self.rollups: Counter[Tuple[str, str, str]] = Counter()
+
+    def _bump(self, metrics: Dict[str, float]) -> None:
+        for period, bucket in _rollup_buckets(datetime.now(UTC)):
+            for metric, amount in metrics.items():
+                self.rollups[(period, bucket, metric)] += amount
+
+    def _add_user(self, user_id: int) -> bool:
+        if user_id in self.users:
+            return False
+        self.users[user_id] = _utc_now_iso()
+        self._bump({"new_users": 1})
+        return True
+
+    def save_user(self, user_id: int) -> bool:
+        return self._add_user(user_id)
+
+    def get_balance(self, user_id: int) -> Optional[float]:
+        return self.balances.get(user_id)
+
+    def set_balance(self, user_id: int, balance: float, rollup: Optional[Dict[str, float]] = None) -> None:
+        self._add_user(user_id)
+        self.balances[user_id] = float(balance)
+        if rollup:
+            self._bump(rollup)
+
+    def add_balance(self, user_id: int, amount: float, rollup: Optional[Dict[str, float]] = None) -> float:
+        self._add_user(user_id)
+        self.balances[user_id] = self.balances.get(user_id, 0.0) + amount
+        if rollup:
+            self._bump(rollup)
+        return self.balances[user_id]
+
+    def hold_balance(self, user_id: int, minimum: float) -> Optional[float]:
+        amount = self.balances.get(user_id)
+        if amount is None or amount < minimum:
+            return None
+        self.balances[user_id] = 0.0
+        return amount
+
+    def touch_user(self, user_id: int, seen_at: str) -> None:
+        if user_id in self.users:
+            self.last_seen[user_id] = seen_at
+
+    def add_history(self, user_id: int, username: str, mode: str, content: str, created_at: str) -> None:
+        self.history_users.append(user_id)
+        self.history_rows.append((username, mode, content, created_at))
+        self.post_counts[user_id] += 1
+
+    def count_user_posts(self, user_id: int) -> int:
+        return self.post_counts.get(user_id, 0)
+
+    def create_submission(
+        self,
+        user_id: int,
+        author: str,
+        mode: str,
+        msg_type: str,
+        text: str,
+        file_id: Optional[str] = None,
+        message_id: Optional[int] = None,
+        media_path: Optional[str] = None,
+    ) -> int:
+        self._add_user(user_id)
+        submission_id = len(self.submissions) + 1
+        self.submissions.append(
+            {
+                "id": submission_id,
+                "user_id": user_id,
+                "author": author,
+                "mode": mode,
+                "msg_type": msg_type,
+                "text": text,
+                "file_id": file_id,
+                "message_id": message_id,
+                "media_path": media_path,
+                "status": "pending",
+                "claimed_by": None,
+                "claimed_at": None,
+                "decided_by": None,
+                "decided_at": None,
+                "created_at": _utc_now_iso(),
+            }
+        )
+        self.pending_ids.append(submission_id)
+        self._bump({"submissions": 1, f"submissions_{mode}": 1, f"type_{msg_type}": 1})
+        return submission_id
+
+    def get_submission(self, submission_id: int) -> Optional[Dict[str, object]]:
+        if 1 <= submission_id <= len(self.submissions):
+            return self.submissions[submission_id - 1]
+        return None
+
+    def count_pending_submissions(self) -> int:
+        return len(self.pending_ids)
+
+    def _free_for(self, submission: Dict[str, object], admin_id: int, expired_before: str) -> bool:
+        holder = submission["claimed_by"]
+        return holder is None or holder == admin_id or submission["claimed_at"] < expired_before
+
+    def claim_submission(self, submission_id: int, admin_id: int, expired_before: str) -> Optional[int]:
+        submission = self.get_submission(submission_id)
+        if submission is None or submission["status"] != "pending":
+            return None
+        if not self._free_for(submission, admin_id, expired_before):
+            return submission["claimed_by"]
+        submission["claimed_by"] = admin_id
+        submission["claimed_at"] = _utc_now_iso()
+        return None
+
+    def set_submission_status(
+        self, submission_id: int, status: str, admin_id: int, expected: str, expired_before: str
+    ) -> bool:
+        submission = self.get_submission(submission_id)
+        if submission is None or submission["status"] != expected:
+            return False
+        if not self._free_for(submission, admin_id, expired_before):
+            return False
+        submission.update(status=status, decided_by=admin_id, decided_at=_utc_now_iso())
+        index = bisect.bisect_left(self.pending_ids, submission_id)
+        if status != "pending" and index < len(self.pending_ids) and self.pending_ids[index] == submission_id:
+            del self.pending_ids[index]
+        elif status == "pending" and expected != "pending":
+            self.pending_ids.insert(index, submission_id)
+        return True
+
+
+class DBAPIStorage(Storage):
+    """Хранилище в сетевой SQL-базе через драйвер DB-API 2.0 (например, psycopg для PostgreSQL).
+
+    Таблицы и столбцы совпадают с SQLite-схемой бота. Соединение одно на хранилище и
+    переиспользуется между запросами. Проверять можно на sqlite3 как на локальной
+    замене: ``DBAPIStorage(lambda: sqlite3.connect(path), sqlite3, dialect="sqlite")``.
+    """
+
+    name = "dbapi"
+
+    # Объявление автоинкрементного ключа в разных диалектах SQL.
+    _ID_COLUMNS = {
+        "sqlite": "INTEGER PRIMARY KEY AUTOINCREMENT",
+        "postgres": "BIGSERIAL PRIMARY KEY",
+    }
+
+    def __init__(self, connect: Callable[[], object], driver, dialect: str = "postgres") -> None:
+        if dialect not in self._ID_COLUMNS:
+            raise ValueError(f"Неизвестный диалект SQL: {dialect}")
+        self._connect = connect
+        self._driver = driver
+        self.dialect = dialect
+        self._conn = None
+        self._lock = threading.Lock()
+        self._placeholder = "%s" if driver.paramstyle in ("format", "pyformat") else "?"
+
+    def _sql(self, query: str) -> str:
+        return query.replace("?", self._placeholder)
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = self._connect()
+        return self._conn
+
+    def _run(self, work):
+        """Выполнить work(cursor) в транзакции; при ошибке откатить её."""
+
+        with self._lock:
+            conn = self._connection()
+            cur = conn.cursor()
+            try:
+                result = work(cur)
+                conn.commit()
+                return result
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cur.close()
+
+    def _execute(self, cur, query: str, params: Tuple = ()) -> None:
+        cur.execute(self._sql(query), params)
+
+    def _bump(self, cur, metrics: Dict[str, float]) -> None:
+        for period, bucket in _rollup_buckets(datetime.now(UTC)):
+            for metric, amount in metrics.items():
+                self._execute(
+                    cur,
+                    "UPDATE rollups SET value = value + ? WHERE period = ? AND bucket = ? AND metric = ?;",
+                    (amount, period, bucket, metric),
+                )
+                if cur.rowcount == 0:
+                    self._execute(
+                        cur,
+                        "INSERT INTO rollups(period, bucket, metric, value) VALUES (?, ?, ?, ?);",
+                        (period, bucket, metric, amount),
+                    )
+
+    def _ensure_user(self, cur, user_id: int) -> bool:
+        self._execute(cur, "SELECT 1 FROM users WHERE user_id = ?;", (user_id,))
+        if cur.fetchone():
+            return False
+        self._execute(cur, "INSERT INTO users(user_id, created_at) VALUES (?, ?);", (user_id, _utc_now_iso()))
+        self._bump(cur, {"new_users": 1})
+        return True
+
+    def init(self) -> None:
+        id_column = self._ID_COLUMNS[self.dialect]
+        statements = [
+            "CREATE TABLE IF NOT EXISTS users (user_id BIGINT PRIMARY KEY, created_at TEXT NOT NULL, last_seen_at TEXT);",
+            """
+            CREATE TABLE IF NOT EXISTS balances (
+                user_id BIGINT PRIMARY KEY, balance DOUBLE PRECISION NOT NULL DEFAULT 0, updated_at TEXT NOT NULL
+            );
+            """,
+            f"""
+            CREATE TABLE IF NOT EXISTS history (
+                id {id_column}, user_id BIGINT NOT NULL, username TEXT, mode TEXT NOT NULL,
+                content TEXT NOT NULL, created_at TEXT NOT NULL
+            );
+            """,
+            f"""
+            CREATE TABLE IF NOT EXISTS submissions (
+                id {id_column}, user_id BIGINT NOT NULL, author TEXT NOT NULL, mode TEXT NOT NULL,
+                msg_type TEXT NOT NULL, text TEXT NOT NULL, file_id TEXT, message_id BIGINT, media_path TEXT,
+                status TEXT NOT NULL DEFAULT 'pending', claimed_by BIGINT, claimed_at TEXT, decided_by BIGINT,
+                decided_at TEXT, created_at TEXT NOT NULL
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS rollups (
+                period VARCHAR(8) NOT NULL, bucket VARCHAR(16) NOT NULL, metric VARCHAR(64) NOT NULL,
+                value DOUBLE PRECISION NOT NULL DEFAULT 0, PRIMARY KEY(period, bucket, metric)
+            );
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_history_user ON history(user_id);",
+            "CREATE INDEX IF NOT EXISTS idx_submissions_status ON submissions(status, id);",
+        ]
+
+        def work(cur) -> None:
+            for statement in statements:
+                cur.execute(statement)
+
+        self._run(work)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def save_user(self, user_id: int) -> bool:
+        try:
+            return self._run(lambda cur: self._ensure_user(cur, user_id))
+        except self._driver.IntegrityError:
+            # Пользователя одновременно добавил другой процесс.
+            return False
+
+    def get_balance(self, user_id: int) -> Optional[float]:
+        def work(cur) -> Optional[float]:
+            self._execute(cur, "SELECT balance FROM balances WHERE user_id = ?;", (user_id,))
+            row = cur.fetchone()
+            return float(row[0]) if row is not None else None
+
+        return self._run(work)
+
+    def set_balance(self, user_id: int, balance: float, rollup: Optional[Dict[str, float]] = None) -> None:
+        def work(cur) -> None:
+            self._ensure_user(cur, user_id)
+            now = _utc_now_iso()
+            self._execute(cur, "UPDATE balances SET balance = ?, updated_at = ? WHERE user_id = ?;", (balance, now, user_id))
+            if cur.rowcount == 0:
+                self._execute(
+                    cur, "INSERT INTO balances(user_id, balance, updated_at) VALUES (?, ?, ?);", (user_id, balance, now)
+                )
+            if rollup:
+                self._bump(cur, rollup)
+
+        self._run(work)
+
+    def add_balance(self, user_id: int, amount: float, rollup: Optional[Dict[str, float]] = None) -> float:
+        def work(cur) -> float:
+            self._ensure_user(cur, user_id)
+            now = _utc_now_iso()
+            self._execute(
+                cur,
+                "UPDATE balances SET balance = balance + ?, updated_at = ? WHERE user_id = ? RETURNING balance;",
+                (amount, now, user_id),
+            )
+            row = cur.fetchone()
+            if row is None:
+                self._execute(
+                    cur,
+                    "INSERT INTO balances(user_id, balance, updated_at) VALUES (?, ?, ?) RETURNING balance;",
+                    (user_id, amount, now),
+                )
+                row = cur.fetchone()
+            if rollup:
+                self._bump(cur, rollup)
+            return float(row[0])
+
+        return self._run(work)
+
+    def hold_balance(self, user_id: int, minimum: float) -> Optional[float]:
+        def work(cur) -> Optional[float]:
+            # Списание только если баланс не изменился с момента чтения; иначе читаем заново.
+            while True:
+                self._execute(cur, "SELECT balance FROM balances WHERE user_id = ?;", (user_id,))
+                row = cur.fetchone()
+                if row is None or row[0] < minimum:
+                    return None
+                self._execute(
+                    cur,
+                    "UPDATE balances SET balance = 0, updated_at = ? WHERE user_id = ? AND balance = ?;",
+                    (_utc_now_iso(), user_id, row[0]),
+                )
+                if cur.rowcount == 1:
+                    return float(row[0])
+
+        return self._run(work)
+
+    def touch_user(self, user_id: int, seen_at: str) -> None:
+        self._run(
+            lambda cur: self._execute(cur, "UPDATE users SET last_seen_at = ? WHERE user_id = ?;", (seen_at, user_id))
+        )
+
+    def add_history(self, user_id: int, username: str, mode: str, content: str, created_at: str) -> None:
+        self._run(
+            lambda cur: self._execute(
+                cur,
+                "INSERT INTO history(user_id, username, mode, content, created_at) VALUES (?, ?, ?, ?, ?);",
+                (user_id, username, mode, content, created_at),
+            )
+        )
+
+    def count_user_posts(self, user_id: int) -> int:
+        def work(cur) -> int:
+            self._execute(cur, "SELECT COUNT(*) FROM history WHERE user_id = ?;", (user_id,))
+            return int(cur.fetchone()[0])
+
+        return self._run(work)
+
+    def create_submission(
+        self,
+        user_id: int,
+        author: str,
+        mode: str,
+        msg_type: str,
+        text: str,
+        file_id: Optional[str] = None,
+        message_id: Optional[int] = None,
+        media_path: Optional[str] = None,
+    ) -> int:
+        def work(cur) -> int:
+            self._ensure_user(cur, user_id)
+            self._execute(
+                cur,
+                """
+                INSERT INTO submissions(user_id, author, mode, msg_type, text, file_id, message_id, media_path, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) RETURNING id;
+                """,
+                (user_id, author, mode, msg_type, text, file_id, message_id, media_path, _utc_now_iso()),
+            )
+            submission_id = int(cur.fetchone()[0])
+            self._bump(cur, {"submissions": 1, f"submissions_{mode}": 1, f"type_{msg_type}": 1})
+            return submission_id
+
+        return self._run(work)
+
+    def get_submission(self, submission_id: int) -> Optional[Dict[str, object]]:
+        def work(cur) -> Optional[Dict[str, object]]:
+            self._execute(cur, "SELECT * FROM submissions WHERE id = ?;", (submission_id,))
+            row = cur.fetchone()
+            return dict(zip((column[0] for column in cur.description), row)) if row else None
+
+        return self._run(work)
+
+    def count_pending_submissions(self) -> int:
+        def work(cur) -> int:
+            self._execute(cur, "SELECT COUNT(*) FROM submissions WHERE status = 'pending';")
+            return int(cur.fetchone()[0])
+
+        return self._run(work)
+
+    def claim_submission(self, submission_id: int, admin_id: int, expired_before: str) -> Optional[int]:
+        def work(cur) -> Optional[int]:
+            self._execute(
+                cur,
+                """
+                UPDATE submissions SET claimed_by = ?, claimed_at = ?
+                WHERE id = ? AND status = 'pending'
+                  AND (claimed_by IS NULL OR claimed_by = ? OR claimed_at < ?);
+                """,
+                (admin_id, _utc_now_iso(), submission_id, admin_id, expired_before),
+            )
+            if cur.rowcount:
+                return None
+            self._execute(cur, "SELECT claimed_by FROM submissions WHERE id = ? AND status = 'pending';", (submission_id,))
+            row = cur.fetchone()
+            return row[0] if row else None
+
+        return self._run(work)
+
+    def set_submission_status(
+        self, submission_id: int, status: str, admin_id: int, expected: str, expired_before: str
+    ) -> bool:
+        def work(cur) -> bool:
+            self._execute(
+                cur,
+                """
+                UPDATE submissions SET status = ?, decided_by = ?, decided_at = ?
+                WHERE id = ? AND status = ?
+                  AND (claimed_by IS NULL OR claimed_by = ? OR claimed_at < ?);
+                """,
+                (status, admin_id, _utc_now_iso(), submission_id, expected, admin_id, expired_before),
+            )
+            return cur.rowcount == 1
+
+        return self._run(work)
+
+
+# ======================== КНОПКИ ========================
+class CallbackPayload(NamedTuple):
+    """Разобранные данные нажатой кнопки: имя действия и типизированные аргументы."""
+
+    action: str
+    args: Tuple
+
+
+class CallbackAction(NamedTuple):
+    """Описание действия кнопки: короткий код, обработчик и типы аргументов."""
+
+    name: str
+    code: str
+    handler: Callable
+    arg_types: Tuple[type, ...]
+
+
+# Действия кнопок по их коду (для разбора) и по имени (для сборки callback_data).
+_CALLBACK_ACTIONS: Dict[str, CallbackAction] = {}
+_CALLBACK_ACTIONS_BY_NAME: Dict[str, CallbackAction] = {}
+
+_BASE36_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def _register_callback(name: str, code: str, handler: Callable, *arg_types: type) -> None:
+    """Зарегистрировать действие кнопки под односимвольным кодом."""
+
+    if len(code) != 1 or code in _CALLBACK_ACTIONS:
+        raise ValueError(f"Некорректный или занятый код действия: {code!r}")
+    action = CallbackAction(name, code, handler, arg_types)
+    _CALLBACK_ACTIONS[code] = action
+    _CALLBACK_ACTIONS_BY_NAME[name] = action
+
+
+def _pack_int(value: int) -> str:
+    """Упаковать целое число в base36, чтобы уместить больше данных в 64 байта."""
+
+    if value < 0:
+        return "-" + _pack_int(-value)
+    digits = ""
+    while True:
+        value, rest = divmod(value, 36)
+        digits = _BASE36_DIGITS[rest] + digits
+        if not value:
+            return digits
+
+
+def _callback_signature(body: str) -> str:
+    """Вернуть короткую подпись тела callback_data."""
+
+    digest = hmac.digest(tenant().callback_secret, body.encode(), "sha256")
+    return base64.urlsafe_b64encode(digest[:6]).decode()
+
+
+def cb(name: str, *args) -> str:
+    """Собрать callback_data: версия, код действия, упакованные аргументы и подпись."""
+
+    action = _CALLBACK_ACTIONS_BY_NAME[name]
+    if len(args) != len(action.arg_types):
+        raise ValueError(f"Действие {name} ожидает {len(action.arg_types)} аргумент(а)")
+    packed = []
+    for arg, arg_type in zip(args, action.arg_types):
+        value = _pack_int(arg) if arg_type is int else str(arg)
+        if ":" in value or "." in value:
+            raise ValueError(f"Недопустимый символ в аргументе кнопки: {value!r}")
+        packed.append(value)
+    body = CALLBACK_VERSION + action.code + "".join(f":{value}" for value in packed)
+    data = f"{body}.{_callback_signature(body)}"
+    if len(data.encode()) > 64:
+        raise ValueError(f"callback_data длиннее 64 байт: {data!r}")
+    return data
+
+
+def decode_callback(data: str) -> Optional[Tuple[CallbackAction, CallbackPayload]]:
+    """Разобрать callback_data; вернуть None для устаревших и поддельных данных."""
+
+    if len(data) < 3 or data[0] != CALLBACK_VERSION:
+        return None
+    action = _CALLBACK_ACTIONS.get(data[1])
+    if action is None:
+        return None
+    body, sep, signature = data.rpartition(".")
+    if not sep or not hmac.compare_digest(signature, _callback_signature(body)):
+        return None
+    raw = body[2:]
+    parts = raw[1:].split(":") if raw else []
+    if len(parts) != len(action.arg_types):
+        return None
+    try:
+        args = tuple(
+            int(part, 36) if arg_type is int else part for part, arg_type in zip(parts, action.arg_types)
+        )
+    except ValueError:
+        return None
+    return action, CallbackPayload(action.name, args)
 
 
 def build_main_menu(is_admin: bool = False) -> InlineKeyboardMarkup:
@@ -194,82 +1353,81 @@ def build_main_menu(is_admin: bool = False) -> InlineKeyboardMarkup:
 
     keyboard = [
         [
-            InlineKeyboardButton("🕵️ Отправить анонимно", callback_data="anon"),
-            InlineKeyboardButton("👤 Отправить с именем", callback_data="non_anon"),
+            InlineKeyboardButton("🕵️ Отправить анонимно", callback_data=cb("anon")),
+            InlineKeyboardButton("👤 Отправить с именем", callback_data=cb("non_anon")),
         ],
         [
-            InlineKeyboardButton("💼 Профиль", callback_data="profile"),
-            InlineKeyboardButton("💸 Вывод средств", callback_data="withdraw"),
+            InlineKeyboardButton("💼 Профиль", callback_data=cb("profile")),
+            InlineKeyboardButton("💸 Вывод средств", callback_data=cb("withdraw")),
         ],
-        [InlineKeyboardButton("🔗 Ссылки", callback_data="links")],
-        [InlineKeyboardButton("🗑️ Удалить пост", callback_data="delete_post")],
+        [InlineKeyboardButton("🔗 Ссылки", callback_data=cb("links"))],
+        [InlineKeyboardButton("🗑️ Удалить пост", callback_data=cb("delete_post"))],
     ]
     if is_admin:
-        keyboard.append([InlineKeyboardButton("🛠️ Админ панель", callback_data="admin_panel")])
+        keyboard.append([InlineKeyboardButton("🛠️ Админ панель", callback_data=cb("admin_panel"))])
     return InlineKeyboardMarkup(keyboard)
 
 
 def sync_db_from_files() -> Dict[str, int]:
-    """Перезалить данные из текстовых файлов в SQLite, обновить копии и вернуть статистику."""
+    """Перезалить данные из текстовых файлов в SQLite, обновить копии и вернуть статистику.
+
+    Имеет смысл только при TEXT_MIRROR_ENABLED: иначе файлы не обновляются и перезаписали бы базу старыми данными.
+    """
 
     conn = _get_db_connection()
     cur = conn.cursor()
 
-    cur.execute("DELETE FROM history;")
-    cur.execute("DELETE FROM balances;")
-    cur.execute("DELETE FROM users;")
-
-    for line in _read_lines(USERS_FILE):
-        try:
-            user_id = int(line)
-        except ValueError:
-            continue
-        cur.execute(
-            "INSERT OR IGNORE INTO users(user_id, created_at) VALUES (?, ?);",
-            (user_id, _utc_now_iso()),
-        )
-
-    for line in _read_lines(BALANCE_FILE):
-        parts = line.split()
-        if len(parts) >= 2:
-            try:
-                user_id = int(parts[0])
-                balance = float(parts[1])
-            except ValueError:
-                continue
-            cur.execute(
-                "INSERT OR IGNORE INTO users(user_id, created_at) VALUES (?, ?);",
-                (user_id, _utc_now_iso()),
-            )
-            cur.execute(
-                "INSERT OR REPLACE INTO balances(user_id, balance, updated_at) VALUES (?, ?, ?);",
-                (user_id, balance, _utc_now_iso()),
-            )
+    try:
+        # Пользователи не удаляются: на них ссылаются заявки и выводы, а дату регистрации и активность стоит сохранить.
+        cur.execute("DELETE FROM history;")
+        cur.execute("DELETE FROM balances;")
 
-    for line in _read_lines(HISTORY_FILE):
-        parts = line.split("|")
-        if len(parts) >= 5:
+        for line in _read_lines(tenant().users_file):
             try:
-                user_id = int(parts[0].strip())
+                user_id = int(line)
             except ValueError:
                 continue
-            username = parts[1].strip()
-            mode = parts[2].strip()
-            content = parts[3].strip()
-            created_at = parts[4].strip()
-            cur.execute(
-                "INSERT OR IGNORE INTO users(user_id, created_at) VALUES (?, ?);",
-                (user_id, _utc_now_iso()),
-            )
-            cur.execute(
-                """
-                INSERT INTO history(user_id, username, mode, content, created_at)
-                VALUES (?, ?, ?, ?, ?);
-                """,
-                (user_id, username, mode, content, created_at),
-            )
-
-    conn.commit()
+            _insert_user(cur, user_id)
+
+        for line in _read_lines(tenant().balance_file):
+            parts = line.split()
+            if len(parts) >= 2:
+                try:
+                    user_id = int(parts[0])
+                    balance = float(parts[1])
+                except ValueError:
+                    continue
+                _insert_user(cur, user_id)
+                cur.execute(
+                    "INSERT OR REPLACE INTO balances(user_id, balance, updated_at) VALUES (?, ?, ?);",
+                    (user_id, balance, _utc_now_iso()),
+                )
+
+        for line in _read_lines(tenant().history_file):
+            parts = line.split("|")
+            if len(parts) >= 5:
+                try:
+                    user_id = int(parts[0].strip())
+                except ValueError:
+                    continue
+                username = parts[1].strip()
+                mode = parts[2].strip()
+                content = parts[3].strip()
+                created_at = parts[4].strip()
+                _insert_user(cur, user_id)
+                cur.execute(
+                    """
+                    INSERT INTO history(user_id, username, mode, content, created_at)
+                    VALUES (?, ?, ?, ?, ?);
+                    """,
+                    (user_id, username, mode, content, created_at),
+                )
+
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        conn.close()
+        raise
 
     users_for_file = [str(row[0]) for row in cur.execute("SELECT user_id FROM users ORDER BY user_id;")]
     balances_for_file = [
@@ -288,31 +1446,73 @@ def sync_db_from_files() -> Dict[str, int]:
     }
     conn.close()
 
-    _write_lines(USERS_FILE, users_for_file)
-    _write_lines(BALANCE_FILE, balances_for_file)
-    _write_lines(HISTORY_FILE, history_for_file)
+    _write_lines(tenant().users_file, users_for_file)
+    _write_lines(tenant().balance_file, balances_for_file)
+    _write_lines(tenant().history_file, history_for_file)
 
     return counts
 
 
-def _get_fallback_video() -> Optional[InputFile]:
-    """Вернуть видео-заглушку, если файл доступен."""
+def _fallback_video_signature() -> Optional[str]:
+    """Размер и время изменения видео-заглушки: по ним видно, что файл заменили."""
+
+    try:
+        stat = VIDEO_FALLBACK_PATH.stat()
+    except OSError:
+        return None
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _get_fallback_video() -> Optional[InputFile | str]:
+    """Вернуть видео-заглушку: file_id уже загруженного видео или сам файл, если file_id ещё не известен."""
 
+    if tenant().fallback_video_id:
+        return tenant().fallback_video_id
     if VIDEO_FALLBACK_PATH.exists():
         return InputFile(VIDEO_FALLBACK_PATH.open("rb"), filename=VIDEO_FALLBACK_PATH.name)
     return None
 
 
-def get_balance(user_id: int) -> float:
-    """Получить баланс пользователя из базы или, если записи нет, из файла."""
+def remember_fallback_video(message) -> None:
+    """Запомнить file_id видео-заглушки после первой загрузки, чтобы дальше не загружать файл."""
+
+    signature = _fallback_video_signature()
+    if tenant().fallback_video_id or not message or not message.video or not signature:
+        return
+    tenant().fallback_video_id = message.video.file_id
+    set_meta("fallback_video", f"{signature} {message.video.file_id}")
+
+
+def get_meta(key: str) -> Optional[str]:
+    """Прочитать служебное значение бота из базы."""
 
     conn = _get_db_connection()
-    cur = conn.cursor()
-    row = cur.execute("SELECT balance FROM balances WHERE user_id = ?;", (user_id,)).fetchone()
+    row = conn.execute("SELECT value FROM meta WHERE key = ?;", (key,)).fetchone()
     conn.close()
-    if row is not None:
-        return float(row[0])
-    lines = _read_lines(BALANCE_FILE)
+    return row[0] if row else None
+
+
+def set_meta(key: str, value: Optional[str]) -> None:
+    """Сохранить служебное значение бота (None — удалить)."""
+
+    conn = _get_db_connection()
+    if value is None:
+        conn.execute("DELETE FROM meta WHERE key = ?;", (key,))
+    else:
+        conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?);", (key, value))
+    conn.commit()
+    conn.close()
+
+
+def get_balance(user_id: int) -> float:
+    """Получить баланс пользователя из хранилища или, если записи нет, из файла."""
+
+    balance = tenant().storage.get_balance(user_id)
+    if balance is not None:
+        return balance
+    if not TEXT_MIRROR_ENABLED:
+        return 0.0
+    lines = _read_lines(tenant().balance_file)
     for line in lines:
         parts = line.split()
         if len(parts) >= 2 and parts[0] == str(user_id):
@@ -323,23 +1523,22 @@ def get_balance(user_id: int) -> float:
     return 0.0
 
 
-def set_balance(user_id: int, balance: float) -> None:
-    """Обновить баланс пользователя в обоих хранилищах."""
+def set_balance(user_id: int, balance: float, rollup: Optional[Dict[str, float]] = None) -> None:
+    """Обновить баланс пользователя в хранилище (и в файле, если включено зеркалирование).
+
+    ``rollup`` — показатели статистики, которые учитываются в той же транзакции.
+    """
+
+    tenant().storage.set_balance(user_id, balance, rollup)
+    _mirror_balance(user_id, balance)
 
-    conn = _get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT OR IGNORE INTO users(user_id, created_at) VALUES (?, ?);",
-        (user_id, _utc_now_iso()),
-    )
-    cur.execute(
-        "INSERT OR REPLACE INTO balances(user_id, balance, updated_at) VALUES (?, ?, ?);",
-        (user_id, balance, _utc_now_iso()),
-    )
-    conn.commit()
-    conn.close()
 
-    lines = _read_lines(BALANCE_FILE)
+def _mirror_balance(user_id: int, balance: float) -> None:
+    """Записать баланс пользователя в текстовый файл, если включено зеркалирование."""
+
+    if not TEXT_MIRROR_ENABLED:
+        return
+    lines = _read_lines(tenant().balance_file)
     updated = False
     new_lines = []
     for line in lines:
@@ -351,14 +1550,15 @@ def set_balance(user_id: int, balance: float) -> None:
             new_lines.append(line)
     if not updated:
         new_lines.append(f"{user_id} {balance}")
-    _write_lines(BALANCE_FILE, new_lines)
+    _write_lines(tenant().balance_file, new_lines)
 
 
 async def credit_user(user_id: int, amount: float, context: ContextTypes.DEFAULT_TYPE) -> float:
     """Начислить средства пользователю и вернуть его новый баланс."""
 
-    new = get_balance(user_id) + amount
-    set_balance(user_id, new)
+    # Прибавка одной командой: вывод, удержавший баланс между чтением и записью, не будет затёрт.
+    new = tenant().storage.add_balance(user_id, amount, rollup={"credited": amount})
+    _mirror_balance(user_id, new)
     try:
         await context.bot.send_message(user_id, f"🎉 Вам начислено {amount:.0f} руб. Баланс: {new:.2f} руб.")
     except Exception:
@@ -368,27 +1568,20 @@ async def credit_user(user_id: int, amount: float, context: ContextTypes.DEFAULT
 
 # ======================== РЕГИСТРАЦИЯ И ИСТОРИЯ ========================
 def save_user(user_id: int) -> bool:
-    """Сохранить пользователя в файл и базу, вернуть True если он новый."""
+    """Сохранить пользователя в хранилище (и в файл при зеркалировании), вернуть True если он новый."""
 
-    lines = _read_lines(USERS_FILE)
-    already_exists = str(user_id) in lines
-    if not already_exists:
-        lines.append(str(user_id))
-        _write_lines(USERS_FILE, lines)
+    is_new = tenant().storage.save_user(user_id)
 
-    conn = _get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT OR IGNORE INTO users(user_id, created_at) VALUES (?, ?);",
-        (user_id, _utc_now_iso()),
-    )
-    conn.commit()
-    conn.close()
-    return not already_exists
+    if TEXT_MIRROR_ENABLED:
+        lines = _read_lines(tenant().users_file)
+        if str(user_id) not in lines:
+            lines.append(str(user_id))
+            _write_lines(tenant().users_file, lines)
+    return is_new
 
 
 def log_history(user, mode: str, text: str, media_path: Optional[str] = None) -> None:
-    """Добавить запись истории в файл и SQLite с ссылкой на медиа."""
+    """Добавить запись истории в хранилище (и в файл при зеркалировании) с ссылкой на медиа."""
 
     username = f"@{user.username}" if user.username else "—"
     timestamp = datetime.now(UTC).strftime('%Y-%m-%d %H:%M:%S UTC')
@@ -398,76 +1591,1566 @@ def log_history(user, mode: str, text: str, media_path: Optional[str] = None) ->
         content_parts.append(f"Медиа: {media_path}")
     content_for_store = "\n".join(content_parts) if content_parts else "[Медиа отправлено]"
 
-    line = (
-        f"{user.id} | {username} | {'Анонимное' if mode == 'anon' else 'Не анонимное'} | "
-        f"{content_for_store} | {timestamp}"
-    )
-    lines = _read_lines(HISTORY_FILE)
-    lines.append(line)
-    _write_lines(HISTORY_FILE, lines)
+    if TEXT_MIRROR_ENABLED:
+        line = (
+            f"{user.id} | {username} | {'Анонимное' if mode == 'anon' else 'Не анонимное'} | "
+            f"{content_for_store} | {timestamp}"
+        )
+        lines = _read_lines(tenant().history_file)
+        lines.append(line)
+        _write_lines(tenant().history_file, lines)
 
-    conn = _get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO history(user_id, username, mode, content, created_at) VALUES (?, ?, ?, ?, ?);",
-        (user.id, username, mode, content_for_store, timestamp),
-    )
-    conn.commit()
-    conn.close()
+    tenant().storage.add_history(user.id, username, mode, content_for_store, timestamp)
 
 
 def count_user_posts(user_id: int) -> int:
     """Посчитать количество записей пользователя в истории."""
 
-    conn = _get_db_connection()
-    cur = conn.cursor()
-    row = cur.execute(
-        "SELECT COUNT(*) FROM history WHERE user_id = ?;",
-        (user_id,),
-    ).fetchone()
-    conn.close()
-    if row is not None:
-        return int(row[0])
-    lines = _read_lines(HISTORY_FILE)
-    return sum(1 for line in lines if line.split("|")[0].strip() == str(user_id))
-
+    return tenant().storage.count_user_posts(user_id)
 
-# ======================== ГЛАВНОЕ МЕНЮ ========================
-async def show_main_menu(
-    user_id: int, context: ContextTypes.DEFAULT_TYPE, text: str, *, allow_edit: bool = True
-) -> None:
-    """Показать главное меню, отмечая, имеет ли пользователь права админа."""
 
-    is_admin = user_id == PRIMARY_ADMIN_ID
-    await send_or_edit(context, user_id, text, build_main_menu(is_admin), allow_edit=allow_edit)
+def touch_user(user_id: int) -> None:
+    """Отметить активность пользователя (не чаще LAST_SEEN_WRITE_INTERVAL секунд)."""
 
+    now = time.monotonic()
+    last = tenant().last_seen_written.get(user_id)
+    if last is not None and now - last < LAST_SEEN_WRITE_INTERVAL:
+        return
+    tenant().last_seen_written[user_id] = now
+    tenant().storage.touch_user(user_id, _utc_now_iso())
+
+
+# Как режим записи хранится в истории: новые записи пишут код, перенесённые из history.txt — подпись.
+HISTORY_MODE_VALUES = {"anon": ("anon", "Анонимное"), "non_anon": ("non_anon", "Не анонимное")}
+# Поля записи истории в выгрузке (в порядке колонок CSV).
+HISTORY_EXPORT_FIELDS = ("id", "user_id", "username", "mode", "content", "created_at")
+
+
+class HistoryFilter(NamedTuple):
+    """Условия отбора записей истории для выгрузки: даты (включительно), автор и режим.
+
+    Даты — местные дни (UTC+PUBLISH_UTC_OFFSET_HOURS), как в статистике: выгрузка за день
+    содержит ровно те записи, что учтены в этом дне панели статистики.
+    """
+
+    since: Optional[str] = None
+    until: Optional[str] = None
+    user_id: Optional[int] = None
+    mode: Optional[str] = None
+
+    def where(self) -> Tuple[list[str], list]:
+        """Собрать условия WHERE и их параметры."""
+
+        conditions: list[str] = []
+        params: list = []
+        if self.since:
+            conditions.append("created_at >= ?")
+            params.append(self.since_inclusive())
+        if self.until:
+            conditions.append("created_at < ?")
+            params.append(self.until_exclusive())
+        if self.user_id is not None:
+            conditions.append("user_id = ?")
+            params.append(self.user_id)
+        if self.mode:
+            values = HISTORY_MODE_VALUES[self.mode]
+            conditions.append(f"mode IN ({', '.join('?' for _ in values)})")
+            params.extend(values)
+        return conditions, params
+
+    @staticmethod
+    def _day_start(day: date) -> str:
+        """Начало местного дня в UTC в виде, в котором история хранит created_at (2025-01-04 21:00:00)."""
+
+        start = datetime.combine(day, datetime.min.time()) - timedelta(hours=PUBLISH_UTC_OFFSET_HOURS)
+        return start.strftime("%Y-%m-%d %H:%M:%S")
+
+    def since_inclusive(self) -> str:
+        """Начало первого дня диапазона: записи берутся начиная с него."""
+
+        return self._day_start(date.fromisoformat(self.since))
+
+    def until_exclusive(self) -> str:
+        """Начало дня после последней даты диапазона: записи берутся строго раньше него."""
+
+        return self._day_start(date.fromisoformat(self.until) + timedelta(days=1))
+
+    def describe(self) -> str:
+        """Описание фильтра для подписи к выгрузке."""
+
+        parts = []
+        if self.since or self.until:
+            parts.append(f"{self.since or '…'} — {self.until or '…'} (UTC+{PUBLISH_UTC_OFFSET_HOURS})")
+        if self.user_id is not None:
+            parts.append(f"ID {self.user_id}")
+        if self.mode:
+            parts.append("анонимные" if self.mode == "anon" else "с именем")
+        return ", ".join(parts) or "вся история"
+
+
+def parse_history_filter(args: list[str]) -> Tuple[HistoryFilter, str]:
+    """Разобрать аргументы вида from=ГГГГ-ММ-ДД to=ГГГГ-ММ-ДД user=ID mode=anon|non_anon format=csv|jsonl.
+
+    Возвращает фильтр и формат; при ошибке бросает ValueError с понятным текстом.
+    """
+
+    values: Dict[str, str] = {}
+    for arg in args:
+        key, sep, value = arg.partition("=")
+        if not sep or key not in ("from", "to", "user", "mode", "format"):
+            raise ValueError(f"Непонятный аргумент: {arg}")
+        values[key] = value
+    for key in ("from", "to"):
+        if key in values:
+            try:
+                # Приводим к виду 2025-01-05, чтобы 2025-1-5 и 2025-01-05 означали один день.
+                values[key] = datetime.strptime(values[key], "%Y-%m-%d").date().isoformat()
+            except ValueError:
+                raise ValueError(f"Дата {key} должна быть в формате ГГГГ-ММ-ДД") from None
+    if "from" in values and "to" in values and values["from"] > values["to"]:
+        raise ValueError("Дата from не может быть позже to")
+    if "user" in values and not values["user"].isdigit():
+        raise ValueError("user должен быть числовым ID")
+    if values.get("mode", "anon") not in HISTORY_MODE_VALUES:
+        raise ValueError("mode может быть anon или non_anon")
+    fmt = values.get("format", "csv")
+    if fmt not in ("csv", "jsonl"):
+        raise ValueError("format может быть csv или jsonl")
+    history_filter = HistoryFilter(
+        since=values.get("from"),
+        until=values.get("to"),
+        user_id=int(values["user"]) if "user" in values else None,
+        mode=values.get("mode"),
+    )
+    return history_filter, fmt
 
-def _send_to_admins_sync(context: ContextTypes.DEFAULT_TYPE, send_func) -> None:
-    """Отправить уведомление всем администраторам синхронно (используется в except)."""
 
-    for admin_id in ADMIN_IDS:
-        try:
-            print(f"📨 Отправляю сообщение администратору {admin_id} (sync)")
-            send_func(admin_id)
-        except Exception:
-            continue
+def _history_id_bounds(conn: sqlite3.Connection, history_filter: HistoryFilter) -> Tuple[int, Optional[int]]:
+    """Границы id для диапазона дат по индексу created_at: id до первой записи и id последней записи.
 
+    История только дописывается, поэтому id растут вместе с created_at, и выгрузка
+    узкого диапазона читает лишь его, а не всю таблицу с начала.
+    """
 
-async def _send_to_admins_async(context: ContextTypes.DEFAULT_TYPE, coro_builder) -> None:
-    """Асинхронно отправить сообщение всем администраторам."""
+    start_after = 0
+    if history_filter.since:
+        first = conn.execute(
+            "SELECT id FROM history WHERE created_at >= ? ORDER BY created_at, id LIMIT 1;",
+            (history_filter.since_inclusive(),),
+        ).fetchone()
+        start_after = first[0] - 1 if first is not None else -1
+    end = None
+    if history_filter.until:
+        last = conn.execute(
+            "SELECT id FROM history WHERE created_at < ? ORDER BY created_at DESC, id DESC LIMIT 1;",
+            (history_filter.until_exclusive(),),
+        ).fetchone()
+        end = last[0] if last is not None else -1
+    return start_after, end
 
-    for admin_id in ADMIN_IDS:
-        try:
-            print(f"📨 Отправляю сообщение администратору {admin_id} (async)")
-            await coro_builder(admin_id)
-        except Exception:
-            print(f"⚠️ Не удалось отправить администратору {admin_id}")
-            continue
 
+def iter_history(history_filter: HistoryFilter):
+    """Построчно отдать записи истории по фильтру, читая базу порциями по id (память не растёт с историей)."""
 
-# ======================== ОБРАБОТЧИКИ ========================
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Обработчик /start: проверка подписки, регистрация и показ меню."""
+    conditions, params = history_filter.where()
+    conn = _get_db_connection()
+    last_id, end = _history_id_bounds(conn, history_filter)
+    if last_id < 0 or (end is not None and end < 0):
+        conn.close()
+        return
+    if end is not None:
+        conditions.append("id <= ?")
+        params.append(end)
+    conditions.append("id > ?")
+    sql = (
+        f"SELECT {', '.join(HISTORY_EXPORT_FIELDS)} FROM history "
+        f"WHERE {' AND '.join(conditions)} ORDER BY id LIMIT ?;"
+    )
+    try:
+        while True:
+            rows = conn.execute(sql, (*params, last_id, HISTORY_EXPORT_CHUNK)).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last_id = rows[-1][0]
+    finally:
+        conn.close()
+
+
+def write_history_export(history_filter: HistoryFilter, fmt: str):
+    """Записать историю по фильтру во временный gzip-файл CSV или JSONL.
+
+    Возвращает файл, перемотанный в начало, и число записей.
+    """
+
+    target = tempfile.TemporaryFile()
+    count = 0
+    with gzip.GzipFile(fileobj=target, mode="wb") as compressed:
+        text = io.TextIOWrapper(compressed, encoding="utf-8", newline="")
+        if fmt == "csv":
+            writer = csv.writer(text)
+            writer.writerow(HISTORY_EXPORT_FIELDS)
+            for row in iter_history(history_filter):
+                writer.writerow(row)
+                count += 1
+        else:
+            for row in iter_history(history_filter):
+                text.write(json.dumps(dict(zip(HISTORY_EXPORT_FIELDS, row)), ensure_ascii=False) + "\n")
+                count += 1
+        text.flush()
+        text.detach()
+    target.seek(0)
+    return target, count
+
+
+def history_page(before_id: int = 0, after_id: int = 0) -> Tuple[list[sqlite3.Row], Optional[int], Optional[int]]:
+    """Вернуть страницу истории (новые сверху) и курсоры соседних страниц.
+
+    Страница берётся по id: before_id — записи старше него (0 — самые свежие),
+    after_id — записи новее него. Возвращает строки, курсор для «новее» (after_id)
+    и курсор для «старее» (before_id); None — соседней страницы нет.
+    """
+
+    conn = _get_db_connection()
+    conn.row_factory = sqlite3.Row
+    columns = ", ".join(HISTORY_EXPORT_FIELDS)
+    if after_id:
+        rows = conn.execute(
+            f"SELECT {columns} FROM history WHERE id > ? ORDER BY id LIMIT ?;", (after_id, HISTORY_PAGE_SIZE)
+        ).fetchall()[::-1]
+        if len(rows) < HISTORY_PAGE_SIZE:
+            conn.close()
+            return history_page()
+    elif before_id:
+        rows = conn.execute(
+            f"SELECT {columns} FROM history WHERE id < ? ORDER BY id DESC LIMIT ?;", (before_id, HISTORY_PAGE_SIZE)
+        ).fetchall()
+    else:
+        rows = conn.execute(f"SELECT {columns} FROM history ORDER BY id DESC LIMIT ?;", (HISTORY_PAGE_SIZE,)).fetchall()
+    newer = older = None
+    if rows:
+        if conn.execute("SELECT 1 FROM history WHERE id > ? LIMIT 1;", (rows[0]["id"],)).fetchone():
+            newer = rows[0]["id"]
+        if conn.execute("SELECT 1 FROM history WHERE id < ? LIMIT 1;", (rows[-1]["id"],)).fetchone():
+            older = rows[-1]["id"]
+    conn.close()
+    return rows, newer, older
+
+
+def render_history_page(rows: list[sqlite3.Row]) -> str:
+    """Текст страницы просмотра истории."""
+
+    if not rows:
+        return "📜 История пуста."
+    lines = ["📜 История постов (новые сверху)", ""]
+    for row in rows:
+        mode = "🕵️" if row["mode"] in HISTORY_MODE_VALUES["anon"] else "👤"
+        content = row["content"]
+        if len(content) > HISTORY_PREVIEW_CHARS:
+            content = content[:HISTORY_PREVIEW_CHARS] + "…"
+        lines.append(f"#{row['id']} {mode} {row['username'] or '—'} (ID {row['user_id']}) · {row['created_at']}")
+        lines.append(content)
+        lines.append("")
+    return "\n".join(lines).rstrip()
+
+
+# ======================== СНИМКИ БАЗЫ ========================
+def _check_integrity(conn: sqlite3.Connection) -> str:
+    """Выполнить PRAGMA integrity_check и вернуть его результат ("ok" для целой базы)."""
+
+    rows = conn.execute("PRAGMA integrity_check;").fetchall()
+    return "; ".join(str(row[0]) for row in rows)
+
+
+def list_snapshots() -> list[Path]:
+    """Вернуть снимки базы (.db и .db.gz) от старых к новым; отбракованные .db.broken не входят."""
+
+    if not tenant().backup_dir.exists():
+        return []
+    backup_dir = tenant().backup_dir
+    return sorted([*backup_dir.glob("bot-*.db"), *backup_dir.glob("bot-*.db.gz")])
+
+
+def create_snapshot() -> Tuple[Path, str]:
+    """Снять согласованную копию базы онлайн-бэкапом SQLite и вернуть путь и итог проверки.
+
+    Копирование идёт шагами по BACKUP_PAGES_PER_STEP страниц, поэтому бот продолжает
+    писать в базу во время снимка. Функция блокирующая — вызывайте через run_db.
+    """
+
+    tenant().backup_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now(UTC).strftime("%Y%m%d-%H%M%S")
+    raw_path = tenant().backup_dir / f"bot-{stamp}.db"
+    source = _get_db_connection()
+    target = sqlite3.connect(raw_path)
+    try:
+        source.backup(target, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP)
+        integrity = _check_integrity(target)
+    finally:
+        target.close()
+        source.close()
+    if integrity != "ok":
+        raw_path.rename(raw_path.with_suffix(".db.broken"))
+        raise RuntimeError(f"Снимок {raw_path.name} не прошёл проверку целостности: {integrity}")
+
+    snapshot = raw_path
+    if BACKUP_COMPRESS:
+        snapshot = raw_path.with_suffix(".db.gz")
+        with raw_path.open("rb") as src, gzip.open(snapshot, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        raw_path.unlink()
+
+    for old in list_snapshots()[:-BACKUP_KEEP]:
+        old.unlink()
+    return snapshot, integrity
+
+
+def restore_snapshot(snapshot: Path) -> None:
+    """Восстановить базу из снимка (сжатого или нет) после проверки его целостности."""
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source_path = snapshot
+        if snapshot.suffix == ".gz":
+            source_path = Path(tmp) / snapshot.stem
+            with gzip.open(snapshot, "rb") as src, source_path.open("wb") as dst:
+                shutil.copyfileobj(src, dst)
+        source = sqlite3.connect(source_path)
+        target = _get_db_connection()
+        try:
+            integrity = _check_integrity(source)
+            if integrity != "ok":
+                raise RuntimeError(f"Снимок {snapshot.name} повреждён: {integrity}")
+            source.backup(target, pages=BACKUP_PAGES_PER_STEP)
+        finally:
+            target.close()
+            source.close()
+
+
+async def scheduled_snapshot(app) -> None:
+    """Снять плановый снимок базы в отдельном потоке (фоновая задача)."""
+
+    snapshot, _ = await run_db(create_snapshot)
+    print(f"💾 Снимок базы сохранён: {snapshot.name}")
+
+
+# ======================== СТАТИСТИКА ========================
+def _rollup_buckets(moment: datetime) -> list[Tuple[str, str]]:
+    """Корзины статистики для момента: час и день по местному времени и общий итог."""
+
+    local = moment.astimezone(UTC) + timedelta(hours=PUBLISH_UTC_OFFSET_HOURS)
+    return [("hour", local.strftime("%Y-%m-%dT%H")), ("day", local.strftime("%Y-%m-%d")), ("total", "")]
+
+
+def bump_rollups(cur: sqlite3.Cursor, metrics: Dict[str, float], moment: Optional[datetime] = None) -> None:
+    """Прибавить показатели к почасовой, дневной и общей статистике в текущей транзакции."""
+
+    cur.executemany(
+        """
+        INSERT INTO rollups(period, bucket, metric, value) VALUES (?, ?, ?, ?)
+        ON CONFLICT(period, bucket, metric) DO UPDATE SET value = value + excluded.value;
+        """,
+        [
+            (period, bucket, metric, amount)
+            for period, bucket in _rollup_buckets(moment or datetime.now(UTC))
+            for metric, amount in metrics.items()
+            if amount
+        ],
+    )
+
+
+# Что пересчитывается при восстановлении статистики: таблица, ключ, момент события и показатели строки.
+_ROLLUP_BACKFILL_SOURCES = (
+    ("users", "user_id", "created_at", "", lambda row: {"new_users": 1}),
+    (
+        "submissions",
+        "id",
+        "created_at",
+        ", mode, msg_type",
+        lambda row: {"submissions": 1, f"submissions_{row[2]}": 1, f"type_{row[3]}": 1},
+    ),
+    ("publications", "id", "published_at", "", lambda row: {"published": 1}),
+)
+
+
+def _backfill_rollups_step() -> bool:
+    """Учесть в статистике следующую порцию записей, созданных до обновления; вернуть True, когда всё учтено.
+
+    Считаются только записи старше отметки ``before`` — более новые уже попали в статистику
+    при записи. Позиция по каждой таблице сохраняется в meta в той же транзакции, что и
+    прибавка, поэтому после перезапуска пересчёт продолжается с места остановки.
+    Начисления и выводы раньше нигде не записывались, поэтому они считаются с момента обновления.
+    """
+
+    conn = _get_db_connection()
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE;")
+    row = cur.execute("SELECT value FROM meta WHERE key = 'rollup_backfill';").fetchone()
+    if row is None:
+        conn.rollback()
+        conn.close()
+        return True
+    state = json.loads(row[0])
+    for table, key, moment_column, extra, metrics in _ROLLUP_BACKFILL_SOURCES:
+        rows = cur.execute(
+            f"""
+            SELECT {key}, {moment_column}{extra} FROM {table}
+            WHERE {key} > ? AND {moment_column} < ? ORDER BY {key} LIMIT ?;
+            """,
+            (state.get(table, -(2**63)), state["before"], ROLLUP_BACKFILL_CHUNK),
+        ).fetchall()
+        if not rows:
+            continue
+        for source in rows:
+            try:
+                moment = datetime.fromisoformat(source[1])
+            except (TypeError, ValueError):
+                continue
+            bump_rollups(cur, metrics(source), moment)
+        state[table] = rows[-1][0]
+        state["counted"] = state.get("counted", 0) + len(rows)
+        cur.execute("UPDATE meta SET value = ? WHERE key = 'rollup_backfill';", (json.dumps(state),))
+        conn.commit()
+        conn.close()
+        return False
+    cur.execute("DELETE FROM meta WHERE key = 'rollup_backfill';")
+    conn.commit()
+    conn.close()
+    if state.get("counted"):
+        print(f"📈 Статистика восстановлена по {state['counted']} записям")
+    return True
+
+
+async def backfill_rollups(app) -> None:
+    """Однократно заполнить статистику по накопленной до обновления истории, порциями в фоне."""
+
+    while not await run_db(_backfill_rollups_step):
+        await asyncio.sleep(0)
+
+
+def rollup_summary() -> Dict[str, Dict[str, float]]:
+    """Сводка показателей за сегодня, вчера, 7 и 30 дней и за всё время.
+
+    Читаются только дневные и общие корзины, поэтому стоимость не зависит от размера истории.
+    """
+
+    today = datetime.now(UTC) + timedelta(hours=PUBLISH_UTC_OFFSET_HOURS)
+    columns = {
+        key: (today - timedelta(days=shift)).strftime("%Y-%m-%d")
+        for key, shift in (("today", 0), ("yesterday", 1), ("week", 6), ("month", 29))
+    }
+    conn = _get_db_connection()
+    rows = conn.execute(
+        "SELECT bucket, metric, value FROM rollups WHERE period = 'day' AND bucket >= ?;", (columns["month"],)
+    ).fetchall()
+    totals = conn.execute("SELECT metric, value FROM rollups WHERE period = 'total';").fetchall()
+    conn.close()
+
+    summary = {metric: dict.fromkeys([*columns, "total"], 0.0) for metric in ROLLUP_METRICS}
+    for bucket, metric, value in rows:
+        if metric not in summary:
+            continue
+        summary[metric]["today"] += value if bucket == columns["today"] else 0
+        summary[metric]["yesterday"] += value if bucket == columns["yesterday"] else 0
+        summary[metric]["week"] += value if bucket >= columns["week"] else 0
+        summary[metric]["month"] += value
+    for metric, value in totals:
+        if metric in summary:
+            summary[metric]["total"] = value
+    return summary
+
+
+def hourly_series(metric: str, hours: int = 24) -> list[float]:
+    """Значения показателя по часам за последние ``hours`` часов (старые первыми)."""
+
+    now = datetime.now(UTC)
+    buckets = [_rollup_buckets(now - timedelta(hours=shift))[0][1] for shift in range(hours - 1, -1, -1)]
+    conn = _get_db_connection()
+    rows = dict(
+        conn.execute(
+            "SELECT bucket, value FROM rollups WHERE period = 'hour' AND metric = ? AND bucket >= ?;",
+            (metric, buckets[0]),
+        ).fetchall()
+    )
+    conn.close()
+    return [rows.get(bucket, 0.0) for bucket in buckets]
+
+
+def _sparkline(values: list[float]) -> str:
+    bars = "▁▂▃▄▅▆▇█"
+    top = max(values, default=0)
+    if not top:
+        return bars[0] * len(values)
+    return "".join(bars[min(int(value / top * (len(bars) - 1) + 0.5), len(bars) - 1)] for value in values)
+
+
+def render_dashboard() -> str:
+    """Текст панели статистики для админа."""
+
+    summary = rollup_summary()
+    lines = ["📈 Статистика", "сегодня · вчера · 7 дн. · 30 дн. · всего", ""]
+    for metric, title in ROLLUP_METRICS.items():
+        digits = 2 if metric in ("credited", "withdrawn") else 0
+        values = (summary[metric][key] for key in ("today", "yesterday", "week", "month", "total"))
+        lines.append(f"{title}: {' · '.join(f'{value:.{digits}f}' for value in values)}")
+    series = hourly_series("submissions")
+    lines.append("")
+    lines.append(f"📥 Заявки за 24 ч: {_sparkline(series)} (всего {sum(series):.0f})")
+    local_now = datetime.now(UTC) + timedelta(hours=PUBLISH_UTC_OFFSET_HOURS)
+    lines.append(f"🕒 Обновлено в {local_now:%H:%M:%S}")
+    return "\n".join(lines)
+
+
+async def prune_rollups(app) -> None:
+    """Удалить почасовую статистику старше ROLLUP_HOURLY_KEEP_DAYS дней."""
+
+    oldest = _rollup_buckets(datetime.now(UTC) - timedelta(days=ROLLUP_HOURLY_KEEP_DAYS))[0][1]
+    conn = _get_db_connection()
+    conn.execute("DELETE FROM rollups WHERE period = 'hour' AND bucket < ?;", (oldest,))
+    conn.commit()
+    conn.close()
+
+
+# ======================== РАССЫЛКИ ========================
+def select_broadcast_audience(segment: str) -> list[int]:
+    """Выбрать получателей рассылки по сегменту, исключая недоступных пользователей.
+
+    Заблокировавшие бота и удалённые аккаунты пропускаются, пока не пройдёт
+    BROADCAST_REPROBE_DAYS с последней попытки, после чего попадают в рассылку снова.
+    """
+
+    now = datetime.now(UTC)
+    reprobe_before = (now - timedelta(days=BROADCAST_REPROBE_DAYS)).isoformat()
+    placeholders = ", ".join("?" for _ in DEAD_DELIVERY_STATUSES)
+    conditions = [f"(d.status IS NULL OR d.status NOT IN ({placeholders}) OR d.updated_at < ?)"]
+    params: list = [*DEAD_DELIVERY_STATUSES, reprobe_before]
+    if segment == "active":
+        conditions.append("u.last_seen_at >= ?")
+        params.append((now - timedelta(days=BROADCAST_ACTIVE_DAYS)).isoformat())
+    elif segment == "balance":
+        conditions.append("EXISTS (SELECT 1 FROM balances b WHERE b.user_id = u.user_id AND b.balance > 0)")
+    elif segment == "posters":
+        conditions.append("EXISTS (SELECT 1 FROM history h WHERE h.user_id = u.user_id)")
+
+    conn = _get_db_connection()
+    rows = conn.execute(
+        f"""
+        SELECT u.user_id FROM users u
+        LEFT JOIN deliveries d ON d.user_id = u.user_id
+        WHERE {" AND ".join(conditions)}
+        ORDER BY u.user_id;
+        """,
+        params,
+    ).fetchall()
+    conn.close()
+    return [row[0] for row in rows]
+
+
+def record_deliveries(results: list[Tuple[int, str, Optional[str]]]) -> None:
+    """Сохранить последний результат отправки каждому пользователю одной транзакцией."""
+
+    if not results:
+        return
+    now = _utc_now_iso()
+    conn = _get_db_connection()
+    conn.executemany(
+        """
+        INSERT INTO deliveries(user_id, status, error, failures, updated_at, last_ok_at)
+        VALUES (?, ?, ?, CASE WHEN ? = 'ok' THEN 0 ELSE 1 END, ?, CASE WHEN ? = 'ok' THEN ? END)
+        ON CONFLICT(user_id) DO UPDATE SET
+            status = excluded.status,
+            error = excluded.error,
+            failures = CASE WHEN excluded.status = 'ok' THEN 0 ELSE deliveries.failures + 1 END,
+            updated_at = excluded.updated_at,
+            last_ok_at = COALESCE(excluded.last_ok_at, deliveries.last_ok_at);
+        """,
+        [(uid, status, error, status, now, status, now) for uid, status, error in results],
+    )
+    conn.commit()
+    conn.close()
+
+
+def _retry_after_seconds(exc: RetryAfter) -> float:
+    """Вернуть паузу из RetryAfter в секундах (PTB отдаёт int или timedelta)."""
+
+    delay = exc.retry_after
+    return delay.total_seconds() if isinstance(delay, timedelta) else float(delay)
+
+
+async def deliver_message(context: ContextTypes.DEFAULT_TYPE, user_id: int, text: str) -> Tuple[str, Optional[str]]:
+    """Отправить сообщение пользователю и вернуть статус доставки и текст ошибки."""
+
+    for attempt in range(2):
+        try:
+            await context.bot.send_message(user_id, text)
+            return "ok", None
+        except RetryAfter as exc:
+            if attempt:
+                return "retry_after", str(exc)
+            await asyncio.sleep(_retry_after_seconds(exc))
+        except Forbidden as exc:
+            return "forbidden", str(exc)
+        except BadRequest as exc:
+            if "chat not found" in str(exc).lower():
+                return "not_found", str(exc)
+            return "error", str(exc)
+        except Exception as exc:
+            return "error", str(exc)
+    return "error", None
+
+
+async def run_broadcast(context: ContextTypes.DEFAULT_TYPE, segment: str, text: str) -> Dict[str, int]:
+    """Разослать текст сегменту аудитории, записав статус доставки каждому получателю."""
+
+    results: list[Tuple[int, str, Optional[str]]] = []
+    counts = {"sent": 0, "failed": 0, "unreachable": 0}
+    for uid in select_broadcast_audience(segment):
+        status, error = await deliver_message(context, uid, text)
+        results.append((uid, status, error))
+        if status == "ok":
+            counts["sent"] += 1
+        elif status in DEAD_DELIVERY_STATUSES:
+            counts["unreachable"] += 1
+        else:
+            counts["failed"] += 1
+        if len(results) >= 200:
+            record_deliveries(results)
+            results = []
+    record_deliveries(results)
+    return counts
+
+
+# ======================== ВЫПЛАТЫ ========================
+# Заголовок CSV партии выплат.
+WITHDRAWAL_CSV_HEADER = ("id", "user_id", "username", "amount", "details", "created_at")
+
+
+def request_withdrawal(user_id: int, username: str, details: str) -> Optional[Tuple[int, float]]:
+    """Перевести весь баланс пользователя в удержание под новую заявку на вывод.
+
+    Баланс проверяется и списывается одной операцией хранилища, поэтому параллельное
+    начисление или повторное нажатие не приведут к двойному выводу.
+    Возвращает номер заявки и сумму или None, если на балансе меньше WITHDRAW_MIN.
+    """
+
+    amount = tenant().storage.hold_balance(user_id, WITHDRAW_MIN)
+    if amount is None:
+        return None
+    _mirror_balance(user_id, 0.0)
+    conn = _get_db_connection()
+    try:
+        cur = conn.execute(
+            "INSERT INTO withdrawals(user_id, username, amount, details, created_at) VALUES (?, ?, ?, ?, ?);",
+            (user_id, username, amount, details, _utc_now_iso()),
+        )
+        conn.commit()
+    except sqlite3.Error:
+        # Заявка не записалась — удержание возвращаем, чтобы деньги не пропали.
+        _mirror_balance(user_id, tenant().storage.add_balance(user_id, amount))
+        raise
+    finally:
+        conn.close()
+    return cur.lastrowid, amount
+
+
+def held_amount(user_id: int) -> float:
+    """Сумма заявок пользователя на вывод, которые ещё не выплачены и не отклонены."""
+
+    conn = _get_db_connection()
+    row = conn.execute(
+        "SELECT COALESCE(SUM(amount), 0) FROM withdrawals WHERE user_id = ? AND status IN ('pending', 'exported');",
+        (user_id,),
+    ).fetchone()
+    conn.close()
+    return float(row[0])
+
+
+def withdrawal_overview() -> Tuple[Tuple[int, float], list[Tuple[int, str, int, float]]]:
+    """Вернуть число и сумму ожидающих заявок и неоплаченные партии (номер, дата, заявки, сумма)."""
+
+    conn = _get_db_connection()
+    pending = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(amount), 0) FROM withdrawals WHERE status = 'pending';"
+    ).fetchone()
+    batches = conn.execute(
+        """
+        SELECT b.id, b.created_at, COUNT(w.id), COALESCE(SUM(w.amount), 0)
+        FROM withdrawal_batches b LEFT JOIN withdrawals w ON w.batch_id = b.id AND w.status = 'exported'
+        WHERE b.status = 'exported'
+        GROUP BY b.id ORDER BY b.id LIMIT ?;
+        """,
+        (WITHDRAW_BATCHES_SHOWN,),
+    ).fetchall()
+    conn.close()
+    return (int(pending[0]), float(pending[1])), [(row[0], row[1], int(row[2]), float(row[3])) for row in batches]
+
+
+def create_payout_batch(admin_id: int) -> Optional[Tuple[int, int, float]]:
+    """Собрать все ожидающие заявки в новую партию; вернуть её номер, число заявок и сумму.
+
+    Если ожидающих заявок нет, партия не создаётся и возвращается None.
+    """
+
+    conn = _get_db_connection()
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE;")
+    if cur.execute("SELECT 1 FROM withdrawals WHERE status = 'pending' LIMIT 1;").fetchone() is None:
+        conn.rollback()
+        conn.close()
+        return None
+    cur.execute(
+        "INSERT INTO withdrawal_batches(created_by, created_at) VALUES (?, ?);", (admin_id, _utc_now_iso())
+    )
+    batch_id = cur.lastrowid
+    cur.execute("UPDATE withdrawals SET status = 'exported', batch_id = ? WHERE status = 'pending';", (batch_id,))
+    count, total = cur.execute(
+        "SELECT COUNT(*), COALESCE(SUM(amount), 0) FROM withdrawals WHERE batch_id = ?;", (batch_id,)
+    ).fetchone()
+    conn.commit()
+    conn.close()
+    return batch_id, int(count), float(total)
+
+
+def iter_batch_withdrawals(batch_id: int):
+    """Построчно отдать заявки партии (выгруженные и уже оплаченные), не загружая её целиком (постранично по id)."""
+
+    conn = _get_db_connection()
+    last_id = 0
+    try:
+        while True:
+            rows = conn.execute(
+                """
+                SELECT id, user_id, username, amount, details, created_at FROM withdrawals
+                WHERE batch_id = ? AND status IN ('exported', 'paid') AND id > ?
+                ORDER BY id LIMIT ?;
+                """,
+                (batch_id, last_id, WITHDRAW_EXPORT_CHUNK),
+            ).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last_id = rows[-1][0]
+    finally:
+        conn.close()
+
+
+def write_batch_csv(batch_id: int):
+    """Записать партию выплат во временный CSV (UTF-8 с BOM для Excel).
+
+    Возвращает файл, перемотанный в начало, и число заявок в нём.
+    """
+
+    spool = tempfile.TemporaryFile()
+    text = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+    writer = csv.writer(text)
+    writer.writerow(WITHDRAWAL_CSV_HEADER)
+    count = 0
+    for withdrawal_id, user_id, username, amount, details, created_at in iter_batch_withdrawals(batch_id):
+        writer.writerow((withdrawal_id, user_id, username or "", f"{amount:.2f}", details, created_at))
+        count += 1
+    text.flush()
+    text.detach()
+    spool.seek(0)
+    return spool, count
+
+
+def mark_batch_paid(batch_id: int, admin_id: int) -> Optional[list[Tuple[int, float]]]:
+    """Отметить партию оплаченной одним действием; вернуть суммы выплат по пользователям.
+
+    Возвращает None, если партии нет или она уже оплачена.
+    """
+
+    conn = _get_db_connection()
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE;")
+    now = _utc_now_iso()
+    cur.execute(
+        "UPDATE withdrawal_batches SET status = 'paid', paid_by = ?, paid_at = ? WHERE id = ? AND status = 'exported';",
+        (admin_id, now, batch_id),
+    )
+    if cur.rowcount != 1:
+        conn.rollback()
+        conn.close()
+        return None
+    payouts = cur.execute(
+        """
+        SELECT user_id, SUM(amount) FROM withdrawals
+        WHERE batch_id = ? AND status = 'exported' GROUP BY user_id;
+        """,
+        (batch_id,),
+    ).fetchall()
+    cur.execute(
+        """
+        UPDATE withdrawals SET status = 'paid', decided_by = ?, decided_at = ?
+        WHERE batch_id = ? AND status = 'exported';
+        """,
+        (admin_id, now, batch_id),
+    )
+    bump_rollups(cur, {"withdrawn": sum(amount for _, amount in payouts)})
+    conn.commit()
+    conn.close()
+    return [(int(user_id), float(amount)) for user_id, amount in payouts]
+
+
+def _refund_withdrawal(
+    withdrawal_id: int, admin_id: int, condition: str, status: str
+) -> Optional[Tuple[int, float, float]]:
+    """Перевести заявку в статус status и вернуть удержанную сумму на баланс.
+
+    condition — SQL-условие на строку заявки, при котором возврат допустим. Статус
+    меняется одним условным UPDATE до возврата денег, поэтому сумма возвращается
+    не больше одного раза. Возвращает пользователя, сумму и новый баланс или None,
+    если условие не выполнено.
+    """
+
+    conn = _get_db_connection()
+    row = conn.execute(
+        f"""
+        UPDATE withdrawals SET status = ?, decided_by = ?, decided_at = ?
+        WHERE id = ? AND {condition}
+        RETURNING user_id, amount;
+        """,
+        (status, admin_id, _utc_now_iso(), withdrawal_id),
+    ).fetchone()
+    conn.commit()
+    conn.close()
+    if row is None:
+        return None
+    user_id, amount = int(row[0]), float(row[1])
+    balance = tenant().storage.add_balance(user_id, amount)
+    _mirror_balance(user_id, balance)
+    return user_id, amount, balance
+
+
+def reject_withdrawal(withdrawal_id: int, admin_id: int) -> Optional[Tuple[int, float, float]]:
+    """Отклонить ожидающую заявку и вернуть удержанную сумму на баланс.
+
+    Выгруженную в партию заявку так отклонить нельзя: её могли уже оплатить по CSV.
+    Возвращает пользователя, сумму и новый баланс или None, если заявку уже нельзя отклонить.
+    """
+
+    return _refund_withdrawal(withdrawal_id, admin_id, "status = 'pending'", "rejected")
+
+
+def fail_withdrawal(withdrawal_id: int, admin_id: int) -> Optional[Tuple[int, float, float]]:
+    """Отметить выплату из неоплаченной партии несостоявшейся и вернуть сумму на баланс.
+
+    Нужна, когда банк не провёл перевод (например, неверный номер карты): такая заявка
+    выпадает из партии и не попадает в mark_batch_paid.
+    Возвращает пользователя, сумму и новый баланс или None, если заявка не выгружена или партия уже оплачена.
+    """
+
+    return _refund_withdrawal(
+        withdrawal_id,
+        admin_id,
+        "status = 'exported' AND batch_id IN (SELECT id FROM withdrawal_batches WHERE status = 'exported')",
+        "failed",
+    )
+
+
+def render_payouts() -> Tuple[str, InlineKeyboardMarkup]:
+    """Собрать экран выплат: очередь заявок, неоплаченные партии и кнопки действий."""
+
+    (pending, pending_total), batches = withdrawal_overview()
+    lines = ["💸 Выплаты", "", f"⏳ Ожидают выгрузки: {pending} на {pending_total:.2f} руб."]
+    keyboard = []
+    if pending:
+        keyboard.append([InlineKeyboardButton(f"📤 Выгрузить {pending} в CSV", callback_data=cb("payout_export"))])
+    if batches:
+        lines.append("")
+        lines.append("📦 Выгружены, ждут оплаты:")
+    for batch_id, created_at, count, total in batches:
+        lines.append(f"• Партия #{batch_id} от {created_at[:16].replace('T', ' ')} UTC: {count} на {total:.2f} руб.")
+        keyboard.append(
+            [
+                InlineKeyboardButton(f"📄 CSV #{batch_id}", callback_data=cb("payout_csv", batch_id)),
+                InlineKeyboardButton(f"✅ Оплачена #{batch_id}", callback_data=cb("payout_paid", batch_id)),
+            ]
+        )
+    lines.append("")
+    lines.append("Отклонить ещё не выгруженную заявку и вернуть деньги на баланс: /payout_reject <номер>")
+    lines.append("Выплата из неоплаченной партии не прошла — вернуть деньги на баланс: /payout_failed <номер>")
+    keyboard.append([InlineKeyboardButton("🔄 Обновить", callback_data=cb("payouts"))])
+    keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data=cb("admin_panel"))])
+    return "\n".join(lines), InlineKeyboardMarkup(keyboard)
+
+
+async def send_payout_batch(context: ContextTypes.DEFAULT_TYPE, admin_id: int, batch_id: int, caption: str) -> None:
+    """Отправить админу CSV партии выплат одним документом."""
+
+    spool, count = await run_db(write_batch_csv, batch_id)
+    try:
+        if not count:
+            await context.bot.send_message(admin_id, f"⚠️ В партии #{batch_id} нет заявок.")
+            return
+        document = InputFile(spool, filename=f"payouts_batch_{batch_id}.csv")
+        await context.bot.send_document(admin_id, document, caption=caption)
+    finally:
+        spool.close()
+
+
+async def notify_payouts(context: ContextTypes.DEFAULT_TYPE, payouts: list[Tuple[int, float]]) -> int:
+    """Сообщить пользователям о выплате; вернуть число доставленных сообщений."""
+
+    delivered = 0
+    for user_id, amount in payouts:
+        status, _ = await deliver_message(context, user_id, f"✅ Выплата {amount:.2f} руб. отправлена по вашим реквизитам.")
+        delivered += status == "ok"
+    return delivered
+
+
+# ======================== ОЧЕРЕДЬ МОДЕРАЦИИ ========================
+# Названия типов контента в карточке заявки.
+SUBMISSION_TYPE_TITLES = {"text": "📝 Текст", "photo": "🖼 Фото", "video": "🎥 Видео", "audio": "🎧 Аудио"}
+
+
+def create_submission(
+    user_id: int,
+    author: str,
+    mode: str,
+    msg_type: str,
+    text: str,
+    file_id: Optional[str] = None,
+    message_id: Optional[int] = None,
+    media_path: Optional[str] = None,
+) -> int:
+    """Поставить заявку в очередь модерации и вернуть её номер."""
+
+    return tenant().storage.create_submission(
+        user_id, author, mode, msg_type, text, file_id, message_id, media_path
+    )
+
+
+def get_submission(submission_id: int) -> Optional[sqlite3.Row]:
+    """Вернуть заявку по номеру или None, если её нет."""
+
+    return tenant().storage.get_submission(submission_id)
+
+
+def count_pending_submissions() -> int:
+    """Посчитать заявки, ожидающие модерации."""
+
+    return tenant().storage.count_pending_submissions()
+
+
+def pending_neighbours(submission_id: int) -> Tuple[Optional[int], Optional[int]]:
+    """Вернуть номера соседних ожидающих заявок (предыдущей и следующей) по индексу."""
+
+    conn = _get_db_connection()
+    prev_row = conn.execute(
+        "SELECT MAX(id) FROM submissions WHERE status = 'pending' AND id < ?;", (submission_id,)
+    ).fetchone()
+    next_row = conn.execute(
+        "SELECT MIN(id) FROM submissions WHERE status = 'pending' AND id > ?;", (submission_id,)
+    ).fetchone()
+    conn.close()
+    return prev_row[0], next_row[0]
+
+
+def first_pending_submission_id() -> Optional[int]:
+    """Вернуть номер самой старой ожидающей заявки."""
+
+    conn = _get_db_connection()
+    row = conn.execute("SELECT MIN(id) FROM submissions WHERE status = 'pending';").fetchone()
+    conn.close()
+    return row[0]
+
+
+def _claim_expired_before() -> str:
+    """Момент, раньше которого закрепление заявки за админом считается просроченным."""
+
+    return (datetime.now(UTC) - timedelta(seconds=MODERATION_CLAIM_TTL)).isoformat()
+
+
+def claim_submission(submission_id: int, admin_id: int) -> Optional[int]:
+    """Закрепить заявку за админом; вернуть ID другого админа, если она уже занята."""
+
+    return tenant().storage.claim_submission(submission_id, admin_id, _claim_expired_before())
+
+
+def set_submission_status(
+    submission_id: int, status: str, admin_id: int, *, expected: str = "pending"
+) -> bool:
+    """Перевести заявку в новый статус, если она в ожидаемом статусе и не занята другим админом."""
+
+    return tenant().storage.set_submission_status(
+        submission_id, status, admin_id, expected, _claim_expired_before()
+    )
+
+
+def submission_post_text(submission: sqlite3.Row) -> str:
+    """Собрать текст публикации заявки (без подписи канала)."""
+
+    if submission["msg_type"] == "text":
+        return f"{submission['author']}\n\n{submission['text']}"
+    if submission["text"]:
+        return f"{submission['author']}\n\n💬 {submission['text']}"
+    return submission["author"]
+
+
+# ======================== ДУБЛИКАТЫ ========================
+# Параметры хэш-функций MinHash вида (a * x + b) mod p; фиксированы, чтобы подписи были сравнимы между запусками.
+_MINHASH_PRIME = (1 << 61) - 1
+_minhash_rng = random.Random(99)
+_MINHASH_PARAMS = [
+    (_minhash_rng.randrange(1, _MINHASH_PRIME), _minhash_rng.randrange(0, _MINHASH_PRIME))
+    for _ in range(DUPLICATE_MINHASH_PERMUTATIONS)
+]
+
+
+class DuplicateMatch(NamedTuple):
+    """Найденный дубль: номер заявки, её автор и тип совпадения."""
+
+    submission_id: int
+    user_id: int
+    kind: str
+
+
+def normalize_text(text: str) -> str:
+    """Привести текст к виду для сравнения: регистр, ё, пунктуация и пробелы не учитываются."""
+
+    text = unicodedata.normalize("NFKC", text or "").casefold().replace("ё", "е")
+    return " ".join(re.findall(r"\w+", text))
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def minhash_signature(normalized: str) -> list[int]:
+    """Подпись MinHash по шинглам из DUPLICATE_SHINGLE_WORDS слов."""
+
+    words = normalized.split()
+    size = min(DUPLICATE_SHINGLE_WORDS, len(words))
+    shingles = {_hash64(" ".join(words[i : i + size])) for i in range(len(words) - size + 1)}
+    return [min((a * x + b) % _MINHASH_PRIME for x in shingles) for a, b in _MINHASH_PARAMS]
+
+
+def _lsh_bands(signature: list[int]) -> list[str]:
+    """Ключи полос LSH: тексты с общей полосой становятся кандидатами в почти дубли."""
+
+    rows = len(signature) // DUPLICATE_LSH_BANDS
+    return [
+        f"{band}:{_hash64(','.join(map(str, signature[band * rows : (band + 1) * rows]))):x}"
+        for band in range(DUPLICATE_LSH_BANDS)
+    ]
+
+
+def submission_fingerprints(text: str, media_unique_id: Optional[str]) -> list[Tuple[str, str, Optional[str]]]:
+    """Отпечатки поста: (вид, значение, подпись MinHash) для медиа, точного текста и полос LSH.
+
+    У медиапоста отпечаток только у самого файла: разные фото или видео с одинаковой
+    подписью — это разные посты, поэтому подпись в поиске дублей не участвует.
+    """
+
+    if media_unique_id:
+        return [("media", media_unique_id, None)]
+    prints = []
+    normalized = normalize_text(text)
+    if len(normalized) >= DUPLICATE_MIN_TEXT:
+        signature = minhash_signature(normalized) if DUPLICATE_NEAR_ENABLED else None
+        packed = ",".join(f"{value:x}" for value in signature) if signature else None
+        prints.append(("text", hashlib.sha256(normalized.encode("utf-8")).hexdigest(), packed))
+        if signature:
+            prints.extend(("band", band, None) for band in _lsh_bands(signature))
+    return prints
+
+
+def find_duplicate(fingerprints: list[Tuple[str, str, Optional[str]]]) -> Optional[DuplicateMatch]:
+    """Найти заявку за последние DUPLICATE_WINDOW_HOURS часов с тем же медиа, текстом или почти тем же текстом.
+
+    Учитываются только заявки, которые ещё ждут решения, одобрены или опубликованы:
+    отклонённый или отменённый пост можно прислать снова.
+    """
+
+    if not fingerprints:
+        return None
+    cutoff = (datetime.now(UTC) - timedelta(hours=DUPLICATE_WINDOW_HOURS)).isoformat()
+    statuses = ", ".join("?" for _ in DUPLICATE_LIVE_STATUSES)
+    conn = _get_db_connection()
+    try:
+        for kind, value, _ in fingerprints:
+            if kind == "band":
+                continue
+            row = conn.execute(
+                f"""
+                SELECT f.submission_id, f.user_id FROM fingerprints AS f
+                JOIN submissions AS s ON s.id = f.submission_id
+                WHERE f.kind = ? AND f.value = ? AND f.created_at >= ? AND s.status IN ({statuses})
+                ORDER BY f.id DESC LIMIT 1;
+                """,
+                (kind, value, cutoff, *DUPLICATE_LIVE_STATUSES),
+            ).fetchone()
+            if row:
+                return DuplicateMatch(row[0], row[1], kind)
+
+        bands = [value for kind, value, _ in fingerprints if kind == "band"]
+        signature = next((sig for kind, _, sig in fingerprints if kind == "text" and sig), None)
+        if not bands or not signature:
+            return None
+        placeholders = ",".join("?" * len(bands))
+        candidates = conn.execute(
+            f"""
+            SELECT DISTINCT t.submission_id, t.user_id, t.signature
+            FROM fingerprints AS b
+            JOIN fingerprints AS t ON t.submission_id = b.submission_id AND t.kind = 'text'
+            JOIN submissions AS s ON s.id = b.submission_id
+            WHERE b.kind = 'band' AND b.value IN ({placeholders}) AND b.created_at >= ? AND s.status IN ({statuses});
+            """,
+            (*bands, cutoff, *DUPLICATE_LIVE_STATUSES),
+        ).fetchall()
+    finally:
+        conn.close()
+
+    own = signature.split(",")
+    best: Optional[Tuple[float, int, int]] = None
+    for submission_id, user_id, other in candidates:
+        if not other:
+            continue
+        similarity = sum(x == y for x, y in zip(own, other.split(","))) / len(own)
+        if similarity >= DUPLICATE_NEAR_THRESHOLD and (best is None or similarity > best[0]):
+            best = (similarity, submission_id, user_id)
+    return DuplicateMatch(best[1], best[2], "near") if best else None
+
+
+def record_fingerprints(
+    submission_id: int, user_id: int, fingerprints: list[Tuple[str, str, Optional[str]]]
+) -> None:
+    """Сохранить отпечатки новой заявки."""
+
+    if not fingerprints:
+        return
+    now = _utc_now_iso()
+    conn = _get_db_connection()
+    conn.executemany(
+        """
+        INSERT INTO fingerprints(submission_id, user_id, kind, value, signature, created_at)
+        VALUES (?, ?, ?, ?, ?, ?);
+        """,
+        [(submission_id, user_id, kind, value, signature, now) for kind, value, signature in fingerprints],
+    )
+    conn.commit()
+    conn.close()
+
+
+async def prune_fingerprints(app) -> None:
+    """Удалить отпечатки старше окна поиска дублей, чтобы таблица не росла."""
+
+    cutoff = (datetime.now(UTC) - timedelta(hours=DUPLICATE_WINDOW_HOURS)).isoformat()
+    conn = _get_db_connection()
+    removed = conn.execute("DELETE FROM fingerprints WHERE created_at < ?;", (cutoff,)).rowcount
+    conn.commit()
+    conn.close()
+    if removed:
+        print(f"🧹 Удалено устаревших отпечатков постов: {removed}")
+
+
+# ======================== ОЧЕРЕДЬ ПУБЛИКАЦИЙ ========================
+def enqueue_publication(submission_id: int) -> int:
+    """Поставить одобренную заявку в конец очереди публикаций и вернуть её позицию."""
+
+    conn = _get_db_connection()
+    cur = conn.cursor()
+    row = cur.execute("SELECT COALESCE(MAX(position), 0) FROM publications;").fetchone()
+    position = int(row[0]) + 1
+    now = _utc_now_iso()
+    cur.execute(
+        """
+        INSERT INTO publications(submission_id, position, next_attempt_at, created_at)
+        VALUES (?, ?, ?, ?);
+        """,
+        (submission_id, position, now, now),
+    )
+    conn.commit()
+    conn.close()
+    return position
+
+
+def count_queued_publications() -> int:
+    """Посчитать публикации, ожидающие отправки в канал."""
+
+    conn = _get_db_connection()
+    row = conn.execute("SELECT COUNT(*) FROM publications WHERE status = 'queued';").fetchone()
+    conn.close()
+    return int(row[0])
+
+
+def queued_publications_page(from_position: int = 0) -> Tuple[list[sqlite3.Row], Optional[int], Optional[int]]:
+    """Вернуть страницу очереди с позиции from_position и начала соседних страниц."""
+
+    conn = _get_db_connection()
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute(
+        """
+        SELECT p.id, p.position, p.attempts, p.last_error, s.author, s.msg_type, s.text
+        FROM publications p JOIN submissions s ON s.id = p.submission_id
+        WHERE p.status = 'queued' AND p.position >= ?
+        ORDER BY p.position LIMIT ?;
+        """,
+        (from_position, PUBLISH_PAGE_SIZE + 1),
+    ).fetchall()
+    previous = conn.execute(
+        """
+        SELECT MIN(position) FROM (
+            SELECT position FROM publications
+            WHERE status = 'queued' AND position < ?
+            ORDER BY position DESC LIMIT ?
+        );
+        """,
+        (from_position, PUBLISH_PAGE_SIZE),
+    ).fetchone()[0]
+    conn.close()
+    next_position = rows[PUBLISH_PAGE_SIZE]["position"] if len(rows) > PUBLISH_PAGE_SIZE else None
+    return rows[:PUBLISH_PAGE_SIZE], previous, next_position
+
+
+def move_publication(publication_id: int, direction: int) -> bool:
+    """Поменять публикацию местами с соседней в очереди (direction: -1 выше, 1 ниже)."""
+
+    conn = _get_db_connection()
+    cur = conn.cursor()
+    row = cur.execute(
+        "SELECT position FROM publications WHERE id = ? AND status = 'queued';", (publication_id,)
+    ).fetchone()
+    neighbour = None
+    if row is not None:
+        if direction < 0:
+            neighbour = cur.execute(
+                """
+                SELECT id, position FROM publications
+                WHERE status = 'queued' AND position < ? ORDER BY position DESC LIMIT 1;
+                """,
+                (row[0],),
+            ).fetchone()
+        else:
+            neighbour = cur.execute(
+                """
+                SELECT id, position FROM publications
+                WHERE status = 'queued' AND position > ? ORDER BY position LIMIT 1;
+                """,
+                (row[0],),
+            ).fetchone()
+    if neighbour is not None:
+        cur.execute("UPDATE publications SET position = ? WHERE id = ?;", (neighbour[1], publication_id))
+        cur.execute("UPDATE publications SET position = ? WHERE id = ?;", (row[0], neighbour[0]))
+    conn.commit()
+    conn.close()
+    return neighbour is not None
+
+
+def cancel_publication(publication_id: int) -> bool:
+    """Снять публикацию из очереди (или неудачную, исчерпавшую попытки); заявка получает статус cancelled."""
+
+    conn = _get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE publications SET status = 'cancelled' WHERE id = ? AND status IN ('queued', 'failed');",
+        (publication_id,),
+    )
+    cancelled = cur.rowcount == 1
+    if cancelled:
+        cur.execute(
+            """
+            UPDATE submissions SET status = 'cancelled'
+            WHERE id = (SELECT submission_id FROM publications WHERE id = ?);
+            """,
+            (publication_id,),
+        )
+    conn.commit()
+    conn.close()
+    return cancelled
+
+
+def failed_publications(limit: int) -> Tuple[int, list[sqlite3.Row]]:
+    """Вернуть число публикаций, исчерпавших попытки, и первые limit из них."""
+
+    conn = _get_db_connection()
+    conn.row_factory = sqlite3.Row
+    total = conn.execute("SELECT COUNT(*) FROM publications WHERE status = 'failed';").fetchone()[0]
+    rows = conn.execute(
+        """
+        SELECT p.id, p.attempts, p.last_error, s.author, s.msg_type, s.text
+        FROM publications p JOIN submissions s ON s.id = p.submission_id
+        WHERE p.status = 'failed'
+        ORDER BY p.position LIMIT ?;
+        """,
+        (limit,),
+    ).fetchall()
+    conn.close()
+    return int(total), rows
+
+
+def requeue_publication(publication_id: int) -> bool:
+    """Вернуть публикацию, исчерпавшую попытки, в очередь на её прежнее место со сброшенным счётчиком."""
+
+    conn = _get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        UPDATE publications SET status = 'queued', attempts = 0, next_attempt_at = ?, last_error = NULL
+        WHERE id = ? AND status = 'failed';
+        """,
+        (_utc_now_iso(), publication_id),
+    )
+    requeued = cur.rowcount == 1
+    if requeued:
+        cur.execute(
+            """
+            UPDATE submissions SET status = 'approved'
+            WHERE id = (SELECT submission_id FROM publications WHERE id = ?) AND status = 'failed';
+            """,
+            (publication_id,),
+        )
+    conn.commit()
+    conn.close()
+    return requeued
+
+
+def _last_published_at() -> Optional[datetime]:
+    """Время последней успешной публикации (переживает перезапуск, так как берётся из базы)."""
+
+    conn = _get_db_connection()
+    row = conn.execute("SELECT MAX(published_at) FROM publications;").fetchone()
+    conn.close()
+    return datetime.fromisoformat(row[0]) if row[0] else None
+
+
+def _latest_slot(now: datetime) -> Optional[datetime]:
+    """Вернуть последний наступивший слот публикации (в UTC) или None, если слоты не заданы."""
+
+    if not PUBLISH_SLOTS:
+        return None
+    offset = timedelta(hours=PUBLISH_UTC_OFFSET_HOURS)
+    local_now = now + offset
+    candidates = []
+    for slot in PUBLISH_SLOTS:
+        hour, minute = (int(part) for part in slot.split(":"))
+        moment = local_now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if moment > local_now:
+            moment -= timedelta(days=1)
+        candidates.append(moment - offset)
+    return max(candidates)
+
+
+def publication_due(now: datetime) -> bool:
+    """Проверить, наступило ли время следующей публикации по интервалу или слоту."""
+
+    last = _last_published_at()
+    if last is not None and now - last < timedelta(seconds=PUBLISH_INTERVAL):
+        return False
+    slot = _latest_slot(now)
+    return slot is None or last is None or last < slot
+
+
+def _next_due_publication() -> Optional[sqlite3.Row]:
+    """Вернуть первую в очереди публикацию, для которой прошла пауза между попытками."""
+
+    conn = _get_db_connection()
+    conn.row_factory = sqlite3.Row
+    row = conn.execute(
+        """
+        SELECT * FROM publications
+        WHERE status = 'queued' AND next_attempt_at <= ?
+        ORDER BY position LIMIT 1;
+        """,
+        (_utc_now_iso(),),
+    ).fetchone()
+    conn.close()
+    return row
+
+
+def _finish_publication(publication_id: int, submission_id: int) -> None:
+    """Отметить публикацию и заявку как опубликованные."""
+
+    now = _utc_now_iso()
+    conn = _get_db_connection()
+    conn.execute(
+        "UPDATE publications SET status = 'published', published_at = ?, last_error = NULL WHERE id = ?;",
+        (now, publication_id),
+    )
+    conn.execute("UPDATE submissions SET status = 'published' WHERE id = ?;", (submission_id,))
+    bump_rollups(conn.cursor(), {"published": 1})
+    conn.commit()
+    conn.close()
+
+
+def _postpone_publication(
+    publication: sqlite3.Row, error: str, delay: Optional[float], *, counted: bool = True
+) -> str:
+    """Запланировать повтор публикации с экспоненциальной паузой; вернуть новый статус.
+
+    ``counted=False`` — повтор после ограничения частоты (RetryAfter): попытка не
+    засчитывается, и публикация не может из-за него стать failed.
+    """
+
+    attempts = publication["attempts"] + 1 if counted else publication["attempts"]
+    status = "failed" if attempts >= PUBLISH_MAX_ATTEMPTS else "queued"
+    if delay is None:
+        delay = PUBLISH_RETRY_BASE * 2 ** (attempts - 1)
+    next_attempt = (datetime.now(UTC) + timedelta(seconds=delay)).isoformat()
+    conn = _get_db_connection()
+    conn.execute(
+        "UPDATE publications SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?;",
+        (status, attempts, next_attempt, error, publication["id"]),
+    )
+    if status == "failed":
+        conn.execute("UPDATE submissions SET status = 'failed' WHERE id = ?;", (publication["submission_id"],))
+    conn.commit()
+    conn.close()
+    return status
+
+
+async def publish_next(app) -> None:
+    """Опубликовать следующую заявку из очереди, если подошло время (фоновая задача)."""
+
+    if not publication_due(datetime.now(UTC)):
+        return
+    publication = _next_due_publication()
+    if publication is None:
+        return
+    submission = get_submission(publication["submission_id"])
+    try:
+        await publish_submission(app, submission)
+    except RetryAfter as exc:
+        delay = _retry_after_seconds(exc)
+        _postpone_publication(publication, str(exc), delay, counted=False)
+        print(f"⏳ Публикация заявки #{submission['id']} отложена на {delay:.0f} c из-за ограничения частоты")
+        return
+    except Exception as exc:
+        status = _postpone_publication(publication, str(exc), None)
+        print(f"⚠️ Публикация заявки #{submission['id']} не удалась: {exc}")
+        if status == "failed":
+            await tenant().notifier.notify(
+                app,
+                "warning",
+                f"Ошибка при отправке в канал заявки #{submission['id']}: {exc}\n"
+                "Вернуть её в очередь можно в «Очереди публикаций».",
+            )
+        return
+    _finish_publication(publication["id"], submission["id"])
+    # Автор получает вознаграждение только после подтверждённой публикации.
+    await reward_author(app, submission["user_id"])
+
+
+# ======================== УВЕДОМЛЕНИЯ АДМИНОВ ========================
+class AdminNotifier:
+    """Рассылка событий админам: срочные — сразу, остальные — одной сводкой за интервал.
+
+    Каждый админ сам выбирает, какие классы событий приходят сразу. Одинаковые
+    предупреждения в сводке склеиваются в одну строку со счётчиком; срочное событие
+    с ``dedup_key`` приходит сразу один раз за интервал сводки, повторы — в сводку.
+    """
+
+    def __init__(self) -> None:
+        # admin_id -> класс события -> ключ -> [строка, количество]
+        self._buffer: Dict[int, Dict[str, Dict[str, list]]] = {}
+        self._prefs: Optional[Dict[Tuple[int, str], bool]] = None
+        self._sequence = 0
+        # (admin_id, dedup_key) срочных событий, уже отправленных за текущий интервал сводки.
+        self._sent: set[Tuple[int, str]] = set()
+
+    def _load_prefs(self) -> Dict[Tuple[int, str], bool]:
+        """Загрузить настройки админов из базы (один раз, дальше — из памяти)."""
+
+        if self._prefs is None:
+            conn = _get_db_connection()
+            rows = conn.execute("SELECT admin_id, event_class, immediate FROM admin_notify_prefs;").fetchall()
+            conn.close()
+            self._prefs = {(admin_id, event_class): bool(immediate) for admin_id, event_class, immediate in rows}
+        return self._prefs
+
+    def is_immediate(self, admin_id: int, event_class: str) -> bool:
+        """Проверить, приходят ли события класса админу сразу."""
+
+        return self._load_prefs().get((admin_id, event_class), event_class in NOTIFY_IMMEDIATE_DEFAULT)
+
+    def toggle(self, admin_id: int, event_class: str) -> bool:
+        """Переключить режим доставки класса для админа и вернуть новый режим (True — сразу)."""
+
+        immediate = not self.is_immediate(admin_id, event_class)
+        conn = _get_db_connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO admin_notify_prefs(admin_id, event_class, immediate) VALUES (?, ?, ?);",
+            (admin_id, event_class, int(immediate)),
+        )
+        conn.commit()
+        conn.close()
+        self._load_prefs()[(admin_id, event_class)] = immediate
+        return immediate
+
+    async def notify(
+        self,
+        context: ContextTypes.DEFAULT_TYPE,
+        event_class: str,
+        text: str,
+        *,
+        digest_line: Optional[str] = None,
+        reply_markup: Optional[InlineKeyboardMarkup] = None,
+        dedup_key: Optional[str] = None,
+    ) -> None:
+        """Отправить событие сразу или отложить его в сводку, в зависимости от настроек админа."""
+
+        for admin_id in tenant().admin_ids:
+            if self.is_immediate(admin_id, event_class) and (admin_id, dedup_key) not in self._sent:
+                if dedup_key is not None:
+                    self._sent.add((admin_id, dedup_key))
+                try:
+                    await context.bot.send_message(admin_id, text, reply_markup=reply_markup)
+                except Exception:
+                    print(f"⚠️ Не удалось отправить администратору {admin_id}")
+                continue
+            if dedup_key is None:
+                self._sequence += 1
+                key = str(self._sequence)
+            else:
+                key = dedup_key
+            bucket = self._buffer.setdefault(admin_id, {}).setdefault(event_class, {})
+            entry = bucket.setdefault(key, [digest_line or text, 0])
+            entry[1] += 1
+
+    def _render_digest(self, classes: Dict[str, Dict[str, list]]) -> str:
+        """Собрать текст сводки для одного админа."""
+
+        lines = [f"📬 Сводка уведомлений за {NOTIFY_DIGEST_INTERVAL // 60} мин."]
+        for event_class, entries in classes.items():
+            total = sum(count for _, count in entries.values())
+            lines.append(f"\n{NOTIFY_EVENT_CLASSES.get(event_class, event_class)} ({total}):")
+            items = list(entries.values())
+            for line, count in items[:NOTIFY_DIGEST_LINES]:
+                lines.append(f"• {line}" + (f" (×{count})" if count > 1 else ""))
+            if len(items) > NOTIFY_DIGEST_LINES:
+                lines.append(f"…и ещё {len(items) - NOTIFY_DIGEST_LINES}")
+        return "\n".join(lines)[:4000]
+
+    async def flush(self, app) -> None:
+        """Отправить каждому админу накопленную сводку одним сообщением."""
+
+        buffer, self._buffer = self._buffer, {}
+        self._sent.clear()
+        for admin_id, classes in buffer.items():
+            markup = None
+            if "submission" in classes:
+                markup = InlineKeyboardMarkup(
+                    [[InlineKeyboardButton("🗂 Открыть очередь", callback_data=cb("mod_open"))]]
+                )
+            try:
+                await app.bot.send_message(admin_id, self._render_digest(classes), reply_markup=markup)
+            except Exception:
+                print(f"⚠️ Не удалось отправить сводку администратору {admin_id}")
+
+
+# ======================== ГЛАВНОЕ МЕНЮ ========================
+async def show_main_menu(
+    user_id: int, context: ContextTypes.DEFAULT_TYPE, text: str, *, allow_edit: bool = True
+) -> None:
+    """Показать главное меню, отмечая, имеет ли пользователь права админа."""
+
+    is_admin = user_id == tenant().primary_admin_id
+    await send_or_edit(context, user_id, text, build_main_menu(is_admin), allow_edit=allow_edit)
+
+
+# ======================== ОБРАБОТЧИКИ ========================
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик /start: проверка подписки, регистрация и показ меню."""
 
     if not update.message:
         return
@@ -475,16 +3158,17 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = user.id
 
     try:
-        member = await context.bot.get_chat_member("@Mind4Not0Found4", user_id)
+        member = await context.bot.get_chat_member(tenant().subscribe_channel, user_id)
         if getattr(member, "status", None) in ["left", "kicked"]:
             raise Exception("Не подписан")
     except Exception:
-        keyboard = [[InlineKeyboardButton("📢 Подписаться на канал", url="https://t.me/Mind4Not0Found4")]]
+        channel = tenant().subscribe_channel
+        keyboard = [[InlineKeyboardButton("📢 Подписаться на канал", url=f"https://t.me/{channel.lstrip('@')}")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await send_or_edit(
             context,
             user_id,
-            "⚠️ Для использования бота нужно подписаться на канал @Mind4Not0Found4.\n\nПосле подписки нажмите /start снова.",
+            f"⚠️ Для использования бота нужно подписаться на канал {channel}.\n\nПосле подписки нажмите /start снова.",
             reply_markup,
             allow_edit=False,
         )
@@ -493,44 +3177,50 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if save_user(user_id):
         prev = get_balance(user_id)
         set_balance(user_id, prev + 1.0)
+        tenant().last_seen_written.pop(user_id, None)
+    touch_user(user_id)
 
-    user_states.setdefault(user_id, {})
+    tenant().user_states.setdefault(user_id, {})
     await show_main_menu(user_id, context, "Привет! 👋 Выбери действие:", allow_edit=False)
 
 
-async def choose_mode(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def choose_mode(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, payload: CallbackPayload
+) -> None:
     """Сохранить выбор пользователя: анонимно или с именем."""
 
     query = update.callback_query
     await query.answer()
     user_id = query.from_user.id
-    user_states[user_id] = {"mode": query.data}
+    tenant().user_states[user_id] = {"mode": payload.action}
     keyboard = [
-        [InlineKeyboardButton("📝 Текст", callback_data="text")],
-        [InlineKeyboardButton("🖼 Фото", callback_data="photo")],
-        [InlineKeyboardButton("🎥 Видео", callback_data="video")],
-        [InlineKeyboardButton("🎧 Аудио", callback_data="audio")],
-        [InlineKeyboardButton("⬅️ Назад", callback_data="back_to_menu")],
+        [InlineKeyboardButton("📝 Текст", callback_data=cb("text"))],
+        [InlineKeyboardButton("🖼 Фото", callback_data=cb("photo"))],
+        [InlineKeyboardButton("🎥 Видео", callback_data=cb("video"))],
+        [InlineKeyboardButton("🎧 Аудио", callback_data=cb("audio"))],
+        [InlineKeyboardButton("⬅️ Назад", callback_data=cb("back_to_menu"))],
     ]
     await send_or_edit(context, user_id, "Что хочешь отправить? 🤔", InlineKeyboardMarkup(keyboard))
 
 
-async def choose_type(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def choose_type(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, payload: CallbackPayload
+) -> None:
     """Записать тип выбранного контента и попросить прислать его."""
 
     query = update.callback_query
     await query.answer()
     user_id = query.from_user.id
-    state = user_states.get(user_id, {})
-    state["type"] = query.data
-    user_states[user_id] = state
+    state = tenant().user_states.get(user_id, {})
+    state["type"] = payload.action
+    tenant().user_states[user_id] = state
     prompts = {
         "text": "✏️ Отправь текст для администратора.",
         "photo": "🖼 Отправь фото для администратора.",
         "video": "🎥 Отправь видео для администратора.",
         "audio": "🎧 Отправь аудио для администратора.",
     }
-    await send_or_edit(context, user_id, prompts[query.data])
+    await send_or_edit(context, user_id, prompts[payload.action])
 
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -541,18 +3231,19 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     user = update.message.from_user
     user_id = user.id
-    state = user_states.get(user_id, {})
+    touch_user(user_id)
+    state = tenant().user_states.get(user_id, {})
 
     if state.get("awaiting_withdraw") and update.message.text:
         card = update.message.text
         state["withdraw_card"] = card
         state["awaiting_withdraw"] = False
         state["awaiting_withdraw_confirm"] = True
-        user_states[user_id] = state
+        tenant().user_states[user_id] = state
         balance = get_balance(user_id)
         keyboard = [
-            [InlineKeyboardButton("✅ Подтвердить вывод", callback_data="withdraw_confirm")],
-            [InlineKeyboardButton("❌ Отменить", callback_data="withdraw_cancel")],
+            [InlineKeyboardButton("✅ Подтвердить вывод", callback_data=cb("withdraw_confirm"))],
+            [InlineKeyboardButton("❌ Отменить", callback_data=cb("withdraw_cancel"))],
         ]
         await send_or_edit(
             context,
@@ -564,19 +3255,18 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         print(f"💸 Пользователь {user_id} указал реквизиты для вывода: {card}")
         return
 
-    if state.get("awaiting_broadcast") and user_id == PRIMARY_ADMIN_ID:
+    if state.get("awaiting_broadcast") and user_id == tenant().primary_admin_id:
         text = update.message.text or ""
-        user_ids = _read_lines(USERS_FILE)
-        sent, failed = 0, 0
-        for uid in user_ids:
-            try:
-                await context.bot.send_message(int(uid), text)
-                sent += 1
-            except Exception:
-                failed += 1
-        user_states[user_id] = {}
+        counts = await run_broadcast(context, state.get("broadcast_segment", "all"), text)
+        tenant().user_states[user_id] = {}
         await show_main_menu(
-            user_id, context, f"✅ Рассылка завершена. Успешно: {sent}, ошибок: {failed}.", allow_edit=False
+            user_id,
+            context,
+            (
+                f"✅ Рассылка завершена. Успешно: {counts['sent']}, ошибок: {counts['failed']}, "
+                f"недоступны: {counts['unreachable']}."
+            ),
+            allow_edit=False,
         )
         return
 
@@ -584,7 +3274,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         state["delete_link"] = update.message.text
         state["awaiting_delete_link"] = False
         state["awaiting_delete_reason"] = True
-        user_states[user_id] = state
+        tenant().user_states[user_id] = state
         await send_or_edit(context, user_id, "✏️ Введите причину удаления поста:", allow_edit=False)
         return
 
@@ -594,10 +3284,10 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         state["delete_reason"] = reason
         state["awaiting_delete_reason"] = False
         state["awaiting_delete_confirm"] = True
-        user_states[user_id] = state
+        tenant().user_states[user_id] = state
         keyboard = [
-            [InlineKeyboardButton("✅ Подтвердить удаление", callback_data="delete_confirm")],
-            [InlineKeyboardButton("❌ Отменить", callback_data="delete_cancel")],
+            [InlineKeyboardButton("✅ Подтвердить удаление", callback_data=cb("delete_confirm"))],
+            [InlineKeyboardButton("❌ Отменить", callback_data=cb("delete_cancel"))],
         ]
         await send_or_edit(
             context,
@@ -614,11 +3304,11 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if state.get("awaiting_caption") and update.message.text:
         state["pending_caption"] = update.message.text
         state.pop("awaiting_caption", None)
-        user_states[user_id] = state
+        tenant().user_states[user_id] = state
         keyboard = [
             [
-                InlineKeyboardButton("✅ Отправить", callback_data="confirm_send"),
-                InlineKeyboardButton("❌ Отменить", callback_data="cancel_send"),
+                InlineKeyboardButton("✅ Отправить", callback_data=cb("confirm_send")),
+                InlineKeyboardButton("❌ Отменить", callback_data=cb("cancel_send")),
             ]
         ]
         await send_or_edit(
@@ -647,12 +3337,12 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         state["pending_message"] = update.message
         state["pending_caption"] = ""
         state["pending_media_path"] = media_path
-        user_states[user_id] = state
+        tenant().user_states[user_id] = state
         keyboard = [
             [
-                InlineKeyboardButton("📝 Добавить подпись", callback_data="add_caption"),
-                InlineKeyboardButton("✅ Отправить", callback_data="confirm_send"),
-                InlineKeyboardButton("❌ Отменить", callback_data="cancel_send"),
+                InlineKeyboardButton("📝 Добавить подпись", callback_data=cb("add_caption")),
+                InlineKeyboardButton("✅ Отправить", callback_data=cb("confirm_send")),
+                InlineKeyboardButton("❌ Отменить", callback_data=cb("cancel_send")),
             ]
         ]
         await send_or_edit(
@@ -666,9 +3356,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     if msg_type == "text" and update.message.text:
         state["pending_message"] = update.message
-        user_states[user_id] = state
+        tenant().user_states[user_id] = state
         keyboard = [
-            [InlineKeyboardButton("✅ Подтвердить", callback_data="confirm_send"), InlineKeyboardButton("❌ Отменить", callback_data="cancel_send")]
+            [InlineKeyboardButton("✅ Подтвердить", callback_data=cb("confirm_send")), InlineKeyboardButton("❌ Отменить", callback_data=cb("cancel_send"))]
         ]
         await send_or_edit(
             context,
@@ -679,172 +3369,339 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
 
 
-async def add_caption_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def add_caption_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, payload: CallbackPayload
+) -> None:
     """Запросить у пользователя подпись к медиафайлу."""
 
     query = update.callback_query
-    await query.answer()
     user_id = query.from_user.id
-    state = user_states.get(user_id)
+    state = tenant().user_states.get(user_id)
     if not state or "pending_message" not in state:
         return await query.answer("⚠️ Нет сообщения для добавления текста.", show_alert=True)
+    await query.answer()
     state["awaiting_caption"] = True
-    user_states[user_id] = state
+    tenant().user_states[user_id] = state
     await send_or_edit(context, user_id, "📝 Напишите текст, который хотите добавить к медиа.")
 
 
-async def confirm_or_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def confirm_or_cancel(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, payload: CallbackPayload
+) -> None:
     """Подтвердить или отменить отправку поста администраторам."""
 
     query = update.callback_query
-    await query.answer()
     user_id = query.from_user.id
-    state = user_states.get(user_id)
+    state = tenant().user_states.get(user_id)
     if not state or "pending_message" not in state:
         return await query.answer("⚠️ Нет сообщения для подтверждения.", show_alert=True)
+    await query.answer()
 
     pending_message = state["pending_message"]
     mode = state.get("mode", "anon")
     msg_type = state.get("type", "text")
     user = query.from_user
 
-    if query.data == "cancel_send":
-        user_states.pop(user_id, None)
+    if payload.action == "cancel_send":
+        tenant().user_states.pop(user_id, None)
         await show_main_menu(user_id, context, "🚫 Отправка отменена.")
         return
 
-    post_cb = f"post_channel:{user.id}"
-    caption_text = "📨 Анонимное сообщение" if mode == "anon" else f"👤 От {user.first_name} (ID: {user.id})"
+    author = "📨 Анонимное сообщение" if mode == "anon" else f"👤 От {user.first_name} (ID: {user.id})"
     media_caption = state.get("pending_caption", "")
     original_caption = pending_message.caption or "" if hasattr(pending_message, "caption") else ""
     media_path = state.get("pending_media_path")
-    if media_caption:
-        caption_text += f"\n\n💬 {media_caption}"
-    elif original_caption:
-        caption_text += f"\n\n💬 {original_caption}"
-
-    admin_keyboard = [[InlineKeyboardButton("📢 Запостить в канал", callback_data=post_cb)]]
-    admin_markup = InlineKeyboardMarkup(admin_keyboard)
-
-    async def send_to_admin(admin_id: int) -> None:
-        print(f"📨 Готовлю отправку сообщения пользователю {user_id} админу {admin_id}")
-        if msg_type == "text":
-            text_to_send = pending_message.text
-            await context.bot.send_message(
-                chat_id=admin_id, text=f"{caption_text}\n\n{text_to_send}", reply_markup=admin_markup
-            )
+    if msg_type == "text":
+        text, file_id, unique_id = pending_message.text, None, None
+    else:
+        text = media_caption or original_caption
+        media = {"photo": pending_message.photo, "video": pending_message.video, "audio": pending_message.audio}
+        attachment = media["photo"][-1] if msg_type == "photo" else media[msg_type]
+        file_id, unique_id = attachment.file_id, attachment.file_unique_id
+
+    fingerprints = submission_fingerprints(text, unique_id)
+    duplicate = find_duplicate(fingerprints)
+    if duplicate:
+        tenant().user_states.pop(user_id, None)
+        print(f"🔁 Пост от {user_id} совпал с заявкой #{duplicate.submission_id} ({duplicate.kind}), не отправлен")
+        if duplicate.user_id == user_id:
+            notice = f"🔁 Вы уже отправляли это сообщение (заявка #{duplicate.submission_id}), оно уже у админов или в канале."
         else:
-            await context.bot.copy_message(
-                chat_id=admin_id,
-                from_chat_id=user_id,
-                message_id=pending_message.message_id,
-                caption=caption_text,
-                reply_markup=admin_markup,
-            )
-        print(f"✅ Сообщение пользователя {user_id} доставлено админу {admin_id}")
+            notice = "🔁 Такое сообщение уже недавно присылали, оно уже у админов или в канале."
+        await show_main_menu(user_id, context, f"{notice}\nПовторно отправлять не нужно 🙂")
+        return
 
     try:
-        await _send_to_admins_async(context, send_to_admin)
-        if msg_type == "text":
-            log_history(user, mode, pending_message.text)
-        else:
-            log_history(user, mode, media_caption or pending_message.caption or "", media_path)
-    except Exception as e:
-        _send_to_admins_sync(
-            context, lambda admin_id: context.bot.send_message(admin_id, f"Ошибка при пересылке от {user.id}: {e}")
+        submission_id = create_submission(
+            user_id, author, mode, msg_type, text, file_id, pending_message.message_id, media_path
         )
+        record_fingerprints(submission_id, user_id, fingerprints)
+        log_history(user, mode, text, media_path)
+        print(f"🗂 Заявка #{submission_id} от {user_id} поставлена в очередь модерации")
+        await notify_new_submission(context, submission_id)
+    except Exception as e:
+        await tenant().notifier.notify(context, "warning", f"Ошибка при пересылке от {user.id}: {e}")
 
-    user_states.pop(user_id, None)
+    tenant().user_states.pop(user_id, None)
     await show_main_menu(user_id, context, "✅ Сообщение успешно отправлено админам!")
 
 
-async def post_to_channel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Опубликовать сообщение в канал после подтверждения администратора."""
+async def publish_submission(context: ContextTypes.DEFAULT_TYPE, submission: sqlite3.Row) -> None:
+    """Опубликовать заявку в канал; при ошибке выбросить исключение."""
+
+    sender_id = submission["user_id"]
+    msg_type = submission["msg_type"]
+    caption = submission_post_text(submission) + tenant().channel_footer
+    if msg_type == "photo":
+        await context.bot.send_photo(chat_id=tenant().channel_id, photo=submission["file_id"], caption=caption)
+        print(f"📢 В канал отправлено фото от {sender_id}")
+    elif msg_type == "video":
+        await context.bot.send_video(chat_id=tenant().channel_id, video=submission["file_id"], caption=caption)
+        print(f"📢 В канал отправлено видео от {sender_id}")
+    elif msg_type == "audio":
+        await context.bot.send_audio(chat_id=tenant().channel_id, audio=submission["file_id"], caption=caption)
+        print(f"📢 В канал отправлено аудио от {sender_id}")
+    else:
+        fallback_video = _get_fallback_video()
+        if fallback_video:
+            message = await context.bot.send_video(chat_id=tenant().channel_id, video=fallback_video, caption=caption)
+            remember_fallback_video(message)
+            print(f"📢 В канал отправлен текст {sender_id} с видео-заглушкой")
+        else:
+            await context.bot.send_message(chat_id=tenant().channel_id, text=caption)
+            warning = "Видео youra.mp4 не найдено, отправлен только текстовый пост."
+            await tenant().notifier.notify(context, "warning", warning, dedup_key=warning)
+            print(f"📢 В канал отправлен текст {sender_id} без медиа")
+
+
+async def reward_author(context: ContextTypes.DEFAULT_TYPE, sender_id: int) -> None:
+    """Начислить автору вознаграждение за публикацию и оповестить админов."""
+
+    try:
+        new_bal = await credit_user(sender_id, 16.0, context)
+        await tenant().notifier.notify(
+            context,
+            "credit",
+            f"✅ Автору (ID HIDDEN) начислено 15 руб. Новый баланс: {new_bal:.2f} руб.",
+            digest_line=f"начислено 15 руб., баланс автора {new_bal:.2f} руб.",
+        )
+    except Exception:
+        await tenant().notifier.notify(context, "warning", f"⚠️ Не удалось начислить средства автору (ID {sender_id}).")
+
+
+async def notify_new_submission(context: ContextTypes.DEFAULT_TYPE, submission_id: int) -> None:
+    """Сразу оповестить каждого админа о новой заявке коротким сообщением со ссылкой на неё."""
+
+    submission = get_submission(submission_id)
+    preview = submission["text"][:200] or SUBMISSION_TYPE_TITLES.get(submission["msg_type"], "")
+    markup = InlineKeyboardMarkup(
+        [[InlineKeyboardButton("🗂 Открыть заявку", callback_data=cb("mod_open_item", submission_id))]]
+    )
+    await tenant().notifier.notify(
+        context,
+        "submission",
+        f"📥 Новая заявка #{submission_id}\n{submission['author']}\n\n{preview}",
+        digest_line=f"#{submission_id} {submission['author']}: {preview[:60]}",
+        reply_markup=markup,
+    )
+
+
+async def show_submission_card(
+    context: ContextTypes.DEFAULT_TYPE, admin_id: int, submission_id: Optional[int], note: str = ""
+) -> None:
+    """Показать админу карточку заявки с кнопками решения и навигации по очереди."""
+
+    submission = get_submission(submission_id) if submission_id else None
+    if submission is None or submission["status"] != "pending":
+        submission_id = first_pending_submission_id()
+        submission = get_submission(submission_id) if submission_id else None
+    if submission is None:
+        keyboard = [[InlineKeyboardButton("⬅️ Назад", callback_data=cb("back_to_menu"))]]
+        await send_or_edit(context, admin_id, f"{note}🗂 Очередь модерации пуста.", InlineKeyboardMarkup(keyboard))
+        return
+
+    holder = claim_submission(submission_id, admin_id)
+    prev_id, next_id = pending_neighbours(submission_id)
+    lines = [
+        f"{note}🗂 Заявка #{submission_id} · в очереди: {count_pending_submissions()}",
+        f"🕒 {submission['created_at'][:19].replace('T', ' ')} UTC",
+        f"{submission['author']} · {SUBMISSION_TYPE_TITLES.get(submission['msg_type'], submission['msg_type'])}",
+    ]
+    if submission["text"]:
+        lines.append(f"\n💬 {submission['text']}")
+    keyboard = []
+    if holder is not None:
+        lines.append(f"\n🔒 Заявку разбирает другой администратор (ID {holder}).")
+    else:
+        keyboard.append(
+            [
+                InlineKeyboardButton("✅ Одобрить", callback_data=cb("mod_approve", submission_id)),
+                InlineKeyboardButton("❌ Отклонить", callback_data=cb("mod_reject", submission_id)),
+            ]
+        )
+    if submission["file_id"]:
+        keyboard.append([InlineKeyboardButton("👁 Показать медиа", callback_data=cb("mod_media", submission_id))])
+    navigation = []
+    if prev_id:
+        navigation.append(InlineKeyboardButton("⬅️", callback_data=cb("mod_open_item", prev_id)))
+    if next_id:
+        navigation.append(InlineKeyboardButton("➡️", callback_data=cb("mod_open_item", next_id)))
+    if navigation:
+        keyboard.append(navigation)
+    keyboard.append([InlineKeyboardButton("🏠 В меню", callback_data=cb("back_to_menu"))])
+    await send_or_edit(context, admin_id, "\n".join(lines), InlineKeyboardMarkup(keyboard))
+
+
+async def queue_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик /queue: открыть очередь модерации (только для админов)."""
+
+    if not update.message or update.message.from_user.id not in tenant().admin_ids:
+        return
+    await show_submission_card(context, update.message.from_user.id, None)
+
+
+async def moderation_open_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, payload: CallbackPayload
+) -> None:
+    """Открыть очередь модерации или конкретную заявку."""
 
     query = update.callback_query
+    if query.from_user.id not in tenant().admin_ids:
+        await query.answer("⛔ Недостаточно прав", show_alert=True)
+        return
     await query.answer()
-    if query.from_user.id not in ADMIN_IDS:
-        await query.edit_message_text("❌ Только админ может постить в канал.")
+    await show_submission_card(context, query.from_user.id, payload.args[0] if payload.args else None)
+
+
+async def moderation_media_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, payload: CallbackPayload
+) -> None:
+    """Прислать админу медиа из заявки, чтобы его можно было посмотреть перед решением."""
+
+    query = update.callback_query
+    admin_id = query.from_user.id
+    submission = get_submission(payload.args[0]) if admin_id in tenant().admin_ids else None
+    if submission is None or not submission["message_id"]:
+        await query.answer("⚠️ Медиа недоступно", show_alert=True)
         return
+    await query.answer()
+    await context.bot.copy_message(
+        chat_id=admin_id, from_chat_id=submission["user_id"], message_id=submission["message_id"]
+    )
+    state = tenant().user_states.setdefault(admin_id, {})
+    # Карточку показываем заново под медиа, чтобы кнопки решения остались внизу чата.
+    state.pop("last_bot_message_id", None)
+    await show_submission_card(context, admin_id, submission["id"])
 
-    data = query.data or ""
-    parts = data.split(":")
-    sender_id = int(parts[1]) if len(parts) >= 2 and parts[0] == "post_channel" else None
-    msg = query.message
-    footer = "\n\n✉️ Отправить анонимное сообщение в канал - @School99InfBot\n🎉 Наш веселенький чат - https://t.me/+joXHChzNX542ZjZi"
 
-    def build_caption(text: str) -> str:
-        return f"{text}{footer}"
+async def moderation_decide_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, payload: CallbackPayload
+) -> None:
+    """Одобрить (и опубликовать) или отклонить заявку."""
 
-    posted_successfully = False
-    try:
-        if msg.photo:
-            await context.bot.send_photo(
-                chat_id=CHANNEL_ID, photo=msg.photo[-1].file_id, caption=build_caption(msg.caption or "")
-            )
-            posted_successfully = True
-            print(f"📢 В канал отправлено фото от {sender_id}")
-        elif msg.video:
-            await context.bot.send_video(
-                chat_id=CHANNEL_ID, video=msg.video.file_id, caption=build_caption(msg.caption or "")
-            )
-            posted_successfully = True
-            print(f"📢 В канал отправлено видео от {sender_id}")
-        elif msg.audio:
-            await context.bot.send_audio(
-                chat_id=CHANNEL_ID, audio=msg.audio.file_id, caption=build_caption(msg.caption or "")
-            )
-            posted_successfully = True
-            print(f"📢 В канал отправлено аудио от {sender_id}")
-        else:
-            text = msg.text or msg.caption or ""
-            fallback_video = _get_fallback_video()
-            try:
-                if fallback_video:
-                    await context.bot.send_video(
-                        chat_id=CHANNEL_ID, video=fallback_video, caption=build_caption(text)
-                    )
-                    posted_successfully = True
-                    await query.edit_message_text(build_caption(text) + "\n✅ Запощено в канал с видео.")
-                    print(f"📢 В канал отправлен текст {sender_id} с видео-заглушкой")
-                else:
-                    await context.bot.send_message(chat_id=CHANNEL_ID, text=build_caption(text))
-                    posted_successfully = True
-                    await query.edit_message_text(build_caption(text) + "\n⚠️ Видео-заглушка отсутствует.")
-                    await _send_to_admins_async(
-                        context,
-                        lambda admin_id: context.bot.send_message(
-                            admin_id,
-                            "Видео youra.mp4 не найдено, отправлен только текстовый пост.",
-                        ),
-                    )
-                    print(f"📢 В канал отправлен текст {sender_id} без медиа")
-            except Exception as e:
-                await query.edit_message_text(f"Ошибка при добавлении видео: {e}")
-                posted_successfully = False
-    except Exception as e:
-        await query.edit_message_text(f"Ошибка при отправке в канал: {e}")
-        posted_successfully = False
+    query = update.callback_query
+    admin_id = query.from_user.id
+    if admin_id not in tenant().admin_ids:
+        await query.answer("⛔ Недостаточно прав", show_alert=True)
+        return
+    submission_id = payload.args[0]
+    status = "approved" if payload.action == "mod_approve" else "rejected"
+    if not set_submission_status(submission_id, status, admin_id):
+        await query.answer("⚠️ Заявка уже разобрана или занята другим администратором.", show_alert=True)
+        await show_submission_card(context, admin_id, submission_id)
+        return
+    await query.answer()
 
-    if posted_successfully and sender_id:
-        try:
-            new_bal = await credit_user(sender_id, 16.0, context)
-            await _send_to_admins_async(
-                context,
-                lambda admin_id: context.bot.send_message(
-                        admin_id, f"✅ Автору (ID HIDDEN) начислено 15 руб. Новый баланс: {new_bal:.2f} руб."
-                ),
-            )
-        except Exception:
-            await _send_to_admins_async(
-                context,
-                lambda admin_id: context.bot.send_message(
-                    admin_id, f"⚠️ Не удалось начислить средства автору (ID {sender_id})."
-                ),
-            )
+    if status == "rejected":
+        print(f"🗂 Заявка #{submission_id} отклонена администратором {admin_id}")
+        await show_submission_card(context, admin_id, submission_id, f"❌ Заявка #{submission_id} отклонена.\n\n")
+        return
+
+    enqueue_publication(submission_id)
+    print(f"🗂 Заявка #{submission_id} одобрена администратором {admin_id} и поставлена в очередь публикаций")
+    await show_submission_card(
+        context,
+        admin_id,
+        submission_id,
+        f"✅ Заявка #{submission_id} одобрена и ждёт публикации (в очереди: {count_queued_publications()}).\n\n",
+    )
+
+
+async def publications_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, payload: CallbackPayload
+) -> None:
+    """Показать страницу очереди публикаций с кнопками перестановки, отмены и возврата неудачных."""
 
+    query = update.callback_query
+    admin_id = query.from_user.id
+    if admin_id not in tenant().admin_ids:
+        await query.answer("⛔ Недостаточно прав", show_alert=True)
+        return
+    await query.answer()
+    from_position = payload.args[0] if payload.args else 0
+    note = ""
+    if payload.action in ("pub_up", "pub_down"):
+        moved = move_publication(payload.args[1], -1 if payload.action == "pub_up" else 1)
+        note = "" if moved else "⚠️ Дальше двигать некуда.\n\n"
+    elif payload.action == "pub_cancel":
+        note = "🚫 Публикация отменена.\n\n" if cancel_publication(payload.args[1]) else ""
+    elif payload.action == "pub_retry":
+        note = "🔁 Публикация возвращена в очередь.\n\n" if requeue_publication(payload.args[1]) else ""
 
-async def profile_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await show_publications_page(context, admin_id, from_position, note)
+
+
+async def show_publications_page(
+    context: ContextTypes.DEFAULT_TYPE, admin_id: int, from_position: int, note: str = ""
+) -> None:
+    """Отрисовать страницу очереди публикаций."""
+
+    rows, previous, next_position = queued_publications_page(from_position)
+    if not rows and previous is not None:
+        rows, previous, next_position = queued_publications_page(previous)
+    schedule = ", ".join(PUBLISH_SLOTS) if PUBLISH_SLOTS else f"каждые {PUBLISH_INTERVAL // 60} мин."
+    lines = [f"{note}📅 Очередь публикаций: {count_queued_publications()} ({schedule})"]
+    keyboard = []
+    page_start = rows[0]["position"] if rows else 0
+    for row in rows:
+        preview = (row["text"] or SUBMISSION_TYPE_TITLES.get(row["msg_type"], ""))[:40]
+        line = f"\n#{row['id']} · {row['author']}\n{preview}"
+        if row["attempts"]:
+            line += f"\n⚠️ Попыток: {row['attempts']}, ошибка: {row['last_error']}"
+        lines.append(line)
+        keyboard.append(
+            [
+                InlineKeyboardButton(f"⬆️ #{row['id']}", callback_data=cb("pub_up", page_start, row["id"])),
+                InlineKeyboardButton("⬇️", callback_data=cb("pub_down", page_start, row["id"])),
+                InlineKeyboardButton("❌", callback_data=cb("pub_cancel", page_start, row["id"])),
+            ]
+        )
+    failed_total, failed = failed_publications(PUBLISH_PAGE_SIZE)
+    if failed_total:
+        lines.append(f"\n⛔ Не опубликованы после {PUBLISH_MAX_ATTEMPTS} попыток: {failed_total}")
+    for row in failed:
+        preview = (row["text"] or SUBMISSION_TYPE_TITLES.get(row["msg_type"], ""))[:40]
+        lines.append(f"\n#{row['id']} · {row['author']}\n{preview}\n⚠️ Ошибка: {row['last_error']}")
+        keyboard.append(
+            [
+                InlineKeyboardButton(f"🔁 В очередь #{row['id']}", callback_data=cb("pub_retry", page_start, row["id"])),
+                InlineKeyboardButton("❌", callback_data=cb("pub_cancel", page_start, row["id"])),
+            ]
+        )
+    navigation = []
+    if previous is not None:
+        navigation.append(InlineKeyboardButton("⬅️", callback_data=cb("pub_list", previous)))
+    if next_position is not None:
+        navigation.append(InlineKeyboardButton("➡️", callback_data=cb("pub_list", next_position)))
+    if navigation:
+        keyboard.append(navigation)
+    keyboard.append([InlineKeyboardButton("🏠 В меню", callback_data=cb("back_to_menu"))])
+    await send_or_edit(context, admin_id, "\n".join(lines), InlineKeyboardMarkup(keyboard))
+
+
+async def profile_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, payload: CallbackPayload
+) -> None:
     """Показать профиль пользователя со статистикой."""
 
     query = update.callback_query
@@ -852,27 +3709,33 @@ async def profile_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     user = query.from_user
     username = f"@{user.username}" if user.username else "—"
     balance = get_balance(user.id)
+    held = held_amount(user.id)
     posts_count = count_user_posts(user.id)
     text = (
         f"👤 Профиль пользователя\n\n"
         f"💬 Username: {username}\n"
         f"🆔 TG ID: {user.id}\n"
         f"💰 Баланс: {balance:.2f} руб.\n"
-        f"📝 Опубликованных постов: {posts_count}"
+        + (f"⏳ Ожидает выплаты: {held:.2f} руб.\n" if held else "")
+        + f"📝 Опубликованных постов: {posts_count}"
     )
-    await send_or_edit(context, user.id, text, build_main_menu(user.id == PRIMARY_ADMIN_ID))
+    await send_or_edit(context, user.id, text, build_main_menu(user.id == tenant().primary_admin_id))
 
 
-async def back_to_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def back_to_menu_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, payload: CallbackPayload
+) -> None:
     """Очистить состояние и вернуть пользователя в меню."""
 
     query = update.callback_query
     await query.answer()
-    user_states.pop(query.from_user.id, None)
+    tenant().user_states.pop(query.from_user.id, None)
     await show_main_menu(query.from_user.id, context, "🏠 Главное меню")
 
 
-async def withdraw_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def withdraw_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, payload: CallbackPayload
+) -> None:
     """Проверить возможность вывода и запросить реквизиты."""
 
     query = update.callback_query
@@ -880,87 +3743,413 @@ async def withdraw_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     user_id = query.from_user.id
     balance = get_balance(user_id)
     print(f"💸 Пользователь {user_id} запросил вывод, баланс {balance:.2f}")
-    if balance < 200:
-        user_states[user_id] = {}
-        await show_main_menu(user_id, context, "⚠️ Нельзя вывести меньше 200 руб. Возврат в меню.")
+    if balance < WITHDRAW_MIN:
+        tenant().user_states[user_id] = {}
+        await show_main_menu(user_id, context, f"⚠️ Нельзя вывести меньше {WITHDRAW_MIN} руб. Возврат в меню.")
         return
-    state = user_states.get(user_id, {})
+    state = tenant().user_states.get(user_id, {})
     state["awaiting_withdraw"] = True
     state.pop("awaiting_withdraw_confirm", None)
     state.pop("withdraw_card", None)
-    user_states[user_id] = state
+    tenant().user_states[user_id] = state
     await send_or_edit(context, user_id, f"💸 На балансе {balance:.2f} руб. Укажите карту или номер СБП для вывода:")
 
 
-async def links_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def links_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, payload: CallbackPayload
+) -> None:
     """Вывести полезные ссылки на чат и канал."""
 
     query = update.callback_query
     await query.answer()
     keyboard = [
-        [InlineKeyboardButton("💬 Чат", url="https://t.me/+joXHChzNX542ZjZi")],
-        [InlineKeyboardButton("📢 Канал", url="https://t.me/+MRaBuj3Cx8gzZjEy")],
-        [InlineKeyboardButton("⬅️ Назад", callback_data="back_to_menu")],
+        [InlineKeyboardButton("💬 Чат", url=tenant().chat_url)],
+        [InlineKeyboardButton("📢 Канал", url=tenant().channel_url)],
+        [InlineKeyboardButton("⬅️ Назад", callback_data=cb("back_to_menu"))],
     ]
     await send_or_edit(context, query.from_user.id, "🔗 Полезные ссылки:", InlineKeyboardMarkup(keyboard))
 
 
-async def delete_post_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def delete_post_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, payload: CallbackPayload
+) -> None:
     """Запросить у пользователя ссылку и причину для удаления поста."""
 
     query = update.callback_query
     await query.answer()
     user_id = query.from_user.id
     print(f"🗑 Пользователь {user_id} нажал 'Удалить пост'")
-    state = user_states.get(user_id, {})
+    state = tenant().user_states.get(user_id, {})
     state["awaiting_delete_link"] = True
     state["awaiting_delete_reason"] = False
     state.pop("awaiting_delete_confirm", None)
     state.pop("delete_link", None)
     state.pop("delete_reason", None)
-    user_states[user_id] = state
+    tenant().user_states[user_id] = state
     await send_or_edit(context, user_id, "🔗 Введите ссылку на пост из канала:")
 
 
-async def admin_panel_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Открыть админ-панель (доступно только основному администратору)."""
+async def admin_panel_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, payload: CallbackPayload
+) -> None:
+    """Открыть админ-панель (доступно только основному администратору)."""
+
+    query = update.callback_query
+    if query.from_user.id != tenant().primary_admin_id:
+        await query.answer("⛔ Недостаточно прав", show_alert=True)
+        return
+    await query.answer()
+    keyboard = [
+        [InlineKeyboardButton(f"🗂 Очередь модерации ({count_pending_submissions()})", callback_data=cb("mod_open"))],
+        [InlineKeyboardButton(f"📅 Очередь публикаций ({count_queued_publications()})", callback_data=cb("pub_list", 0))],
+        [InlineKeyboardButton("💸 Выплаты", callback_data=cb("payouts"))],
+        [InlineKeyboardButton("📜 История постов", callback_data=cb("history_page", 0))],
+        [InlineKeyboardButton("📨 Сделать рассылку", callback_data=cb("broadcast_start"))],
+        # Без зеркалирования файлы не обновляются, и перезаливка из них стёрла бы свежие данные.
+        *([[InlineKeyboardButton("🔄 Синхронизация", callback_data=cb("sync_db"))]] if TEXT_MIRROR_ENABLED else []),
+        [InlineKeyboardButton("💾 Снимок базы", callback_data=cb("backup"))],
+        [InlineKeyboardButton("🔔 Уведомления", callback_data=cb("notify_settings"))],
+        [InlineKeyboardButton("📈 Статистика", callback_data=cb("dashboard"))],
+        [
+            InlineKeyboardButton("🩺 CPU", callback_data=cb("diagnostics", "cpu")),
+            InlineKeyboardButton("🧠 Память", callback_data=cb("diagnostics", "mem")),
+            InlineKeyboardButton("🧵 Задачи", callback_data=cb("diagnostics", "tasks")),
+            InlineKeyboardButton("🌐 Сеть", callback_data=cb("diagnostics", "net")),
+        ],
+        [InlineKeyboardButton("⬅️ Назад", callback_data=cb("back_to_menu"))],
+    ]
+    await send_or_edit(context, query.from_user.id, "🛠️ Админ панель", InlineKeyboardMarkup(keyboard))
+
+
+async def broadcast_start_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, payload: CallbackPayload
+) -> None:
+    """Предложить администратору выбрать сегмент аудитории для рассылки."""
+
+    query = update.callback_query
+    if query.from_user.id != tenant().primary_admin_id:
+        await query.answer("⛔ Недостаточно прав", show_alert=True)
+        return
+    await query.answer()
+    keyboard = [
+        [InlineKeyboardButton(title, callback_data=cb("broadcast_segment", segment))]
+        for segment, title in BROADCAST_SEGMENTS.items()
+    ]
+    keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data=cb("admin_panel"))])
+    await send_or_edit(context, query.from_user.id, "👥 Кому отправить рассылку?", InlineKeyboardMarkup(keyboard))
+
+
+async def broadcast_segment_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, payload: CallbackPayload
+) -> None:
+    """Запомнить сегмент и запустить режим ввода текста для рассылки."""
+
+    query = update.callback_query
+    segment = payload.args[0]
+    if query.from_user.id != tenant().primary_admin_id or segment not in BROADCAST_SEGMENTS:
+        await query.answer("⛔ Недостаточно прав", show_alert=True)
+        return
+    await query.answer()
+    state = tenant().user_states.get(query.from_user.id, {})
+    state["awaiting_broadcast"] = True
+    state["broadcast_segment"] = segment
+    tenant().user_states[query.from_user.id] = state
+    audience = len(select_broadcast_audience(segment))
+    await send_or_edit(
+        context,
+        query.from_user.id,
+        f"✉️ Получателей: {audience} ({BROADCAST_SEGMENTS[segment]}). Отправьте текст для рассылки:",
+    )
+
+
+async def backup_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, payload: CallbackPayload
+) -> None:
+    """Снять снимок базы по запросу администратора и показать последние снимки."""
+
+    query = update.callback_query
+    if query.from_user.id != tenant().primary_admin_id:
+        await query.answer("⛔ Недостаточно прав", show_alert=True)
+        return
+    await query.answer()
+    try:
+        snapshot, integrity = await run_db(create_snapshot)
+        text = f"💾 Снимок сохранён: {snapshot.name} ({snapshot.stat().st_size / 1024:.1f} КиБ), проверка: {integrity}"
+    except Exception as exc:
+        text = f"⚠️ Не удалось снять снимок базы: {exc}"
+    recent = "\n".join(f"• {path.name}" for path in reversed(list_snapshots()[-5:]))
+    await send_or_edit(
+        context,
+        query.from_user.id,
+        f"{text}\n\nПоследние снимки:\n{recent or '—'}\n\nВосстановление: python start.py --restore <файл>",
+    )
+
+
+async def show_notify_settings(context: ContextTypes.DEFAULT_TYPE, admin_id: int) -> None:
+    """Показать админу настройки доставки уведомлений по классам событий."""
+
+    keyboard = []
+    for event_class, title in NOTIFY_EVENT_CLASSES.items():
+        mode = "⚡ сразу" if tenant().notifier.is_immediate(admin_id, event_class) else "📬 сводкой"
+        keyboard.append([InlineKeyboardButton(f"{title}: {mode}", callback_data=cb("notify_toggle", event_class))])
+    keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data=cb("back_to_menu"))])
+    await send_or_edit(
+        context,
+        admin_id,
+        f"🔔 Уведомления. Нажмите на класс, чтобы переключить режим (сводка раз в {NOTIFY_DIGEST_INTERVAL // 60} мин.).",
+        InlineKeyboardMarkup(keyboard),
+    )
+
+
+async def notify_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик /notify: настройки уведомлений (только для админов)."""
+
+    if not update.message or update.message.from_user.id not in tenant().admin_ids:
+        return
+    await show_notify_settings(context, update.message.from_user.id)
+
+
+async def notify_settings_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, payload: CallbackPayload
+) -> None:
+    """Открыть настройки уведомлений или переключить режим класса событий."""
+
+    query = update.callback_query
+    admin_id = query.from_user.id
+    if admin_id not in tenant().admin_ids:
+        await query.answer("⛔ Недостаточно прав", show_alert=True)
+        return
+    await query.answer()
+    if payload.action == "notify_toggle" and payload.args[0] in NOTIFY_EVENT_CLASSES:
+        tenant().notifier.toggle(admin_id, payload.args[0])
+    await show_notify_settings(context, admin_id)
+
+
+async def dashboard_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, payload: CallbackPayload
+) -> None:
+    """Показать основному администратору панель статистики."""
+
+    query = update.callback_query
+    if query.from_user.id != tenant().primary_admin_id:
+        await query.answer("⛔ Недостаточно прав", show_alert=True)
+        return
+    await query.answer()
+    keyboard = [
+        [InlineKeyboardButton("🔄 Обновить", callback_data=cb("dashboard"))],
+        [InlineKeyboardButton("⬅️ Назад", callback_data=cb("admin_panel"))],
+    ]
+    await send_or_edit(context, query.from_user.id, render_dashboard(), InlineKeyboardMarkup(keyboard))
+
+
+async def payouts_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, payload: CallbackPayload
+) -> None:
+    """Экран выплат: выгрузка партии в CSV, повторная отправка CSV и отметка об оплате."""
+
+    query = update.callback_query
+    admin_id = query.from_user.id
+    if admin_id != tenant().primary_admin_id:
+        await query.answer("⛔ Недостаточно прав", show_alert=True)
+        return
+    await query.answer()
+    action = payload.action
+    notice = ""
+    if action == "payout_export":
+        batch = await run_db(create_payout_batch, admin_id)
+        if batch is None:
+            notice = "⚠️ Нет заявок для выгрузки."
+        else:
+            batch_id, count, total = batch
+            print(f"💸 Партия выплат #{batch_id}: {count} заявок на {total:.2f} руб.")
+            caption = f"📦 Партия #{batch_id}: {count} заявок на {total:.2f} руб."
+            await send_payout_batch(context, admin_id, batch_id, caption)
+    elif action == "payout_csv":
+        await send_payout_batch(context, admin_id, payload.args[0], f"📦 Партия #{payload.args[0]}")
+    elif action == "payout_paid":
+        keyboard = [
+            [InlineKeyboardButton("✅ Да, оплачена", callback_data=cb("payout_paid_confirm", payload.args[0]))],
+            [InlineKeyboardButton("⬅️ Назад", callback_data=cb("payouts"))],
+        ]
+        await send_or_edit(
+            context,
+            admin_id,
+            f"Отметить партию #{payload.args[0]} оплаченной? Пользователи получат уведомление о выплате.",
+            InlineKeyboardMarkup(keyboard),
+        )
+        return
+    elif action == "payout_paid_confirm":
+        payouts = await run_db(mark_batch_paid, payload.args[0], admin_id)
+        if payouts is None:
+            notice = f"⚠️ Партия #{payload.args[0]} уже оплачена или не найдена."
+        else:
+            total = sum(amount for _, amount in payouts)
+            print(f"💸 Партия #{payload.args[0]} оплачена: {len(payouts)} пользователей, {total:.2f} руб.")
+            await send_or_edit(context, admin_id, f"⏳ Партия #{payload.args[0]} оплачена, уведомляю пользователей…")
+            delivered = await notify_payouts(context, payouts)
+            notice = f"✅ Партия #{payload.args[0]} оплачена: {total:.2f} руб., уведомлено {delivered} из {len(payouts)}."
+    text, markup = await run_db(render_payouts)
+    # После документа экран отправляется заново, чтобы оказаться под ним.
+    await send_or_edit(
+        context,
+        admin_id,
+        f"{notice}\n\n{text}" if notice else text,
+        markup,
+        allow_edit=action not in ("payout_export", "payout_csv") or bool(notice),
+    )
+
+
+async def payout_reject_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик /payout_reject <номер>: отклонить ожидающую заявку на вывод и вернуть деньги на баланс."""
+
+    if not update.message or update.message.from_user.id != tenant().primary_admin_id:
+        return
+    if len(context.args) != 1 or not context.args[0].lstrip("#").isdigit():
+        await update.message.reply_text("Использование: /payout_reject <номер заявки>")
+        return
+    withdrawal_id = int(context.args[0].lstrip("#"))
+    rejected = await run_db(reject_withdrawal, withdrawal_id, update.message.from_user.id)
+    if rejected is None:
+        await update.message.reply_text(
+            f"⚠️ Заявка #{withdrawal_id} не найдена или уже выгружена в партию выплат. "
+            "Если выплата по ней не прошла, используйте /payout_failed."
+        )
+        return
+    user_id, amount, balance = rejected
+    print(f"💸 Заявка на вывод #{withdrawal_id} отклонена, {amount:.2f} руб. возвращены пользователю {user_id}")
+    await deliver_message(
+        context,
+        user_id,
+        f"↩️ Заявка на вывод #{withdrawal_id} отклонена, {amount:.2f} руб. возвращены на баланс ({balance:.2f} руб.).",
+    )
+    await update.message.reply_text(f"✅ Заявка #{withdrawal_id} отклонена, {amount:.2f} руб. возвращены на баланс.")
+
+
+async def payout_failed_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик /payout_failed <номер>: снять непрошедшую выплату с неоплаченной партии и вернуть деньги на баланс."""
+
+    if not update.message or update.message.from_user.id != tenant().primary_admin_id:
+        return
+    if len(context.args) != 1 or not context.args[0].lstrip("#").isdigit():
+        await update.message.reply_text("Использование: /payout_failed <номер заявки>")
+        return
+    withdrawal_id = int(context.args[0].lstrip("#"))
+    failed = await run_db(fail_withdrawal, withdrawal_id, update.message.from_user.id)
+    if failed is None:
+        await update.message.reply_text(
+            f"⚠️ Заявка #{withdrawal_id} не найдена, не выгружена или её партия уже отмечена оплаченной."
+        )
+        return
+    user_id, amount, balance = failed
+    print(f"💸 Выплата по заявке #{withdrawal_id} не прошла, {amount:.2f} руб. возвращены пользователю {user_id}")
+    await deliver_message(
+        context,
+        user_id,
+        f"↩️ Выплата по заявке #{withdrawal_id} не прошла, {amount:.2f} руб. возвращены на баланс "
+        f"({balance:.2f} руб.). Проверьте реквизиты и оформите вывод заново.",
+    )
+    await update.message.reply_text(
+        f"✅ Заявка #{withdrawal_id} снята с партии, {amount:.2f} руб. возвращены на баланс."
+    )
+
+
+async def send_history_export(
+    context: ContextTypes.DEFAULT_TYPE, admin_id: int, history_filter: HistoryFilter, fmt: str
+) -> None:
+    """Выгрузить историю по фильтру и отправить админу gzip-файлом."""
+
+    target, count = await run_db(write_history_export, history_filter, fmt)
+    try:
+        size = target.seek(0, io.SEEK_END)
+        target.seek(0)
+        if size > HISTORY_EXPORT_MAX_BYTES:
+            await context.bot.send_message(
+                admin_id,
+                f"⚠️ Выгрузка ({count} записей, {size / 1024 / 1024:.1f} МиБ) больше лимита Telegram. Сузьте фильтр.",
+            )
+            return
+        filename = f"history_{datetime.now(UTC):%Y%m%d_%H%M%S}.{fmt}.gz"
+        caption = f"📜 История: {history_filter.describe()}, записей: {count}"
+        await context.bot.send_document(admin_id, InputFile(target, filename=filename), caption=caption)
+    finally:
+        target.close()
+    print(f"📜 Выгрузка истории ({history_filter.describe()}, {fmt}): {count} записей, {size} байт")
+
+
+async def history_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, payload: CallbackPayload
+) -> None:
+    """Листать историю постов по страницам или выгрузить её целиком."""
 
     query = update.callback_query
-    await query.answer()
-    if query.from_user.id != PRIMARY_ADMIN_ID:
+    admin_id = query.from_user.id
+    if admin_id != tenant().primary_admin_id:
         await query.answer("⛔ Недостаточно прав", show_alert=True)
         return
-    keyboard = [
-        [InlineKeyboardButton("📨 Сделать рассылку", callback_data="broadcast_start")],
-        [InlineKeyboardButton("🔄 Синхронизация", callback_data="sync_db")],
-        [InlineKeyboardButton("⬅️ Назад", callback_data="back_to_menu")],
-    ]
-    await send_or_edit(context, query.from_user.id, "🛠️ Админ панель", InlineKeyboardMarkup(keyboard))
+    await query.answer()
+    if payload.action == "history_export":
+        await send_history_export(context, admin_id, HistoryFilter(), payload.args[0])
+        return
+    if payload.action == "history_newer":
+        rows, newer, older = await run_db(history_page, 0, payload.args[0])
+    else:
+        rows, newer, older = await run_db(history_page, payload.args[0])
+    keyboard = []
+    navigation = []
+    if newer is not None:
+        navigation.append(InlineKeyboardButton("⬅️ Новее", callback_data=cb("history_newer", newer)))
+    if older is not None:
+        navigation.append(InlineKeyboardButton("Старее ➡️", callback_data=cb("history_page", older)))
+    if navigation:
+        keyboard.append(navigation)
+    keyboard.append(
+        [
+            InlineKeyboardButton("📦 CSV.gz", callback_data=cb("history_export", "csv")),
+            InlineKeyboardButton("📦 JSONL.gz", callback_data=cb("history_export", "jsonl")),
+        ]
+    )
+    keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data=cb("admin_panel"))])
+    text = render_history_page(rows) + "\n\nВыгрузка с фильтром: /history_export from=ГГГГ-ММ-ДД to=… user=ID mode=anon"
+    await send_or_edit(context, admin_id, text, InlineKeyboardMarkup(keyboard))
 
 
-async def broadcast_start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Запустить режим ввода текста для рассылки всем пользователям."""
+async def history_export_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик /history_export: выгрузить историю с фильтром по датам, автору и режиму."""
 
-    query = update.callback_query
-    await query.answer()
-    if query.from_user.id != PRIMARY_ADMIN_ID:
-        await query.answer("⛔ Недостаточно прав", show_alert=True)
+    if not update.message or update.message.from_user.id != tenant().primary_admin_id:
         return
-    state = user_states.get(query.from_user.id, {})
-    state["awaiting_broadcast"] = True
-    user_states[query.from_user.id] = state
-    await send_or_edit(context, query.from_user.id, "✉️ Отправьте текст для рассылки всем пользователям:")
+    try:
+        history_filter, fmt = parse_history_filter(context.args)
+    except ValueError as exc:
+        await update.message.reply_text(
+            f"⚠️ {exc}\n\nИспользование: /history_export [from=ГГГГ-ММ-ДД] [to=ГГГГ-ММ-ДД] "
+            "[user=ID] [mode=anon|non_anon] [format=csv|jsonl]"
+        )
+        return
+    await send_history_export(context, update.message.from_user.id, history_filter, fmt)
 
 
-async def sync_db_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def sync_db_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, payload: CallbackPayload
+) -> None:
     """Синхронизировать базу с текстовыми файлами по запросу администратора."""
 
     query = update.callback_query
-    await query.answer()
-    if query.from_user.id != PRIMARY_ADMIN_ID:
+    if query.from_user.id != tenant().primary_admin_id:
         await query.answer("⛔ Недостаточно прав", show_alert=True)
         return
-    counts = sync_db_from_files()
+    if not TEXT_MIRROR_ENABLED:
+        await query.answer(
+            "⚠️ Зеркалирование в файлы выключено: файлы устарели, синхронизация из них отключена.", show_alert=True
+        )
+        return
+    await query.answer()
+    try:
+        counts = await run_db(sync_db_from_files)
+    except sqlite3.Error as exc:
+        print(f"⚠️ Синхронизация с файлами не удалась: {exc}")
+        await send_or_edit(context, query.from_user.id, f"⚠️ Синхронизация не удалась, база не изменена: {exc}")
+        return
     await send_or_edit(
         context,
         query.from_user.id,
@@ -973,114 +4162,1218 @@ async def sync_db_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     )
 
 
-async def withdraw_confirm_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def withdraw_confirm_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, payload: CallbackPayload
+) -> None:
     """Обработать подтверждение или отмену вывода средств."""
 
     query = update.callback_query
-    await query.answer()
     user = query.from_user
     user_id = user.id
-    state = user_states.get(user_id, {})
-    action = query.data
+    state = tenant().user_states.get(user_id, {})
+    action = payload.action
+    if action != "withdraw_cancel" and not state.get("awaiting_withdraw_confirm"):
+        await query.answer("⚠️ Нет активного запроса на вывод", show_alert=True)
+        return
+    await query.answer()
 
-    if action == "withdraw_confirm" and state.get("awaiting_withdraw_confirm"):
+    if action == "withdraw_confirm":
         card = state.get("withdraw_card", "—")
-        balance = get_balance(user_id)
-        set_balance(user_id, 0.0)
-        await _send_to_admins_async(
+        tenant().user_states[user_id] = {}
+        username = f"@{user.username}" if user.username else "—"
+        created = await run_db(request_withdrawal, user_id, username, card)
+        if created is None:
+            await show_main_menu(
+                user_id, context, f"⚠️ На балансе меньше {WITHDRAW_MIN} руб., вывод невозможен.", allow_edit=False
+            )
+            return
+        withdrawal_id, amount = created
+        await tenant().notifier.notify(
             context,
-            lambda admin_id: context.bot.send_message(
-                admin_id,
-                (
-                    "Запрос на вывод средств\n"
-                    f"Пользователь: @{user.username or '—'}\n"
-                    f"ID: {user.id}\n"
-                    f"Сумма: {balance:.2f} руб.\n"
-                    f"Реквизиты: {card}"
-                ),
-            ),
+            "withdraw",
+            f"💸 Заявка на вывод #{withdrawal_id}: {username} (ID {user.id}), {amount:.2f} руб.",
+            digest_line=f"#{withdrawal_id} {username} (ID {user.id}): {amount:.2f} руб.",
         )
-        print(
-            f"💸 Подтверждён вывод: пользователь {user.id} ({user.username or '—'}), сумма {balance:.2f}, реквизиты {card}"
+        print(f"💸 Заявка на вывод #{withdrawal_id}: пользователь {user.id} ({username}), сумма {amount:.2f}")
+        await show_main_menu(
+            user_id,
+            context,
+            f"✅ Заявка на вывод #{withdrawal_id} принята: {amount:.2f} руб. удержаны до выплаты.",
+            allow_edit=False,
         )
-        user_states[user_id] = {}
-        await show_main_menu(user_id, context, "✅ Запрос на вывод отправлен. Баланс обнулён.", allow_edit=False)
     elif action == "withdraw_cancel":
-        user_states[user_id] = {}
+        tenant().user_states[user_id] = {}
         print(f"💸 Пользователь {user_id} отменил вывод средств")
         await show_main_menu(user_id, context, "❌ Вывод отменён.", allow_edit=False)
-    else:
-        await query.answer("⚠️ Нет активного запроса на вывод", show_alert=True)
 
 
-async def delete_confirm_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def delete_confirm_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, payload: CallbackPayload
+) -> None:
     """Обработать подтверждение или отмену удаления поста."""
 
     query = update.callback_query
-    await query.answer()
     user = query.from_user
     user_id = user.id
-    state = user_states.get(user_id, {})
-    action = query.data
+    state = tenant().user_states.get(user_id, {})
+    action = payload.action
+    if action != "delete_cancel" and not state.get("awaiting_delete_confirm"):
+        await query.answer("⚠️ Нет активного запроса на удаление", show_alert=True)
+        return
+    await query.answer()
 
-    if action == "delete_confirm" and state.get("awaiting_delete_confirm"):
+    if action == "delete_confirm":
         link = state.get("delete_link", "—")
         reason = state.get("delete_reason", "—")
-        await _send_to_admins_async(
+        await tenant().notifier.notify(
             context,
-            lambda admin_id: context.bot.send_message(
-                admin_id,
-                (
-                    "Удаление поста\n"
-                    f"Ссылка: {link}\n"
-                    f"Причина: {reason}\n"
-                    f"ID: {user.id}\n"
-                    f"Пользователь: @{user.username or '—'}"
-                ),
+            "delete",
+            (
+                "Удаление поста\n"
+                f"Ссылка: {link}\n"
+                f"Причина: {reason}\n"
+                f"ID: {user.id}\n"
+                f"Пользователь: @{user.username or '—'}"
             ),
+            digest_line=f"{link} — {reason} (ID {user.id})",
         )
         print(
             f"🗑 Подтверждён запрос удаления: пользователь {user.id} ({user.username or '—'}), ссылка {link}, причина: {reason}"
         )
-        user_states[user_id] = {}
+        tenant().user_states[user_id] = {}
         await show_main_menu(user_id, context, "✅ Запрос на удаление отправлен администратору.", allow_edit=False)
     elif action == "delete_cancel":
-        user_states[user_id] = {}
+        tenant().user_states[user_id] = {}
         print(f"🗑 Пользователь {user_id} отменил запрос на удаление поста")
         await show_main_menu(user_id, context, "❌ Запрос на удаление отменён.", allow_edit=False)
-    else:
-        await query.answer("⚠️ Нет активного запроса на удаление", show_alert=True)
 
 
-def main() -> None:
-    """Точка входа: инициализация БД, хэндлеров и запуск бота."""
+# ======================== ДИАГНОСТИКА ========================
+# Идёт ли сейчас снятие профиля (одновременно допускается только одно).
+_diagnostics_running = False
+
+
+async def _send_report(context: ContextTypes.DEFAULT_TYPE, admin_id: int, filename: str, text: str, caption: str) -> None:
+    """Отправить админу текстовый отчёт документом."""
+
+    document = InputFile(io.BytesIO(text.encode("utf-8")), filename=filename)
+    await context.bot.send_document(admin_id, document, caption=caption)
+
+
+async def capture_cpu_profile(seconds: float) -> str:
+    """Профилировать поток event loop заданное время и вернуть отчёт cProfile."""
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_TOP)
+    out.write("\n")
+    stats.sort_stats(pstats.SortKey.TIME).print_stats(PROFILE_TOP)
+    return out.getvalue()
+
+
+async def capture_memory_snapshot(seconds: float) -> str:
+    """Отследить выделения памяти за заданное время и вернуть топ мест выделения."""
+
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start(10)
+    try:
+        await asyncio.sleep(seconds)
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+    snapshot = snapshot.filter_traces(
+        (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>"))
+    )
+    lines = [f"Отслежено: {current / 1024:.1f} КиБ, пик: {peak / 1024:.1f} КиБ", ""]
+    for index, stat in enumerate(snapshot.statistics("lineno")[:PROFILE_TOP], start=1):
+        lines.append(f"{index:>3}. {stat}")
+    lines.append("")
+    lines.append("По стеку вызовов (топ-5):")
+    for stat in snapshot.statistics("traceback")[:5]:
+        lines.append(f"{stat.count} блоков, {stat.size / 1024:.1f} КиБ")
+        lines.extend(f"    {line}" for line in stat.traceback.format())
+    return "\n".join(lines)
+
+
+def describe_tasks(processor: Optional[BaseUpdateProcessor] = None) -> str:
+    """Вернуть список активных asyncio-задач с возрастом и местом, где они ждут."""
+
+    now = time.monotonic()
+    current = asyncio.current_task()
+    rows = []
+    for task in asyncio.all_tasks():
+        started = _task_started_at.get(task)
+        age = now - started if started is not None else None
+        frames = task.get_stack(limit=1)
+        where = f"{frames[-1].f_code.co_filename}:{frames[-1].f_lineno}" if frames else "—"
+        coro = task.get_coro()
+        name = getattr(coro, "__qualname__", repr(coro))
+        marker = " (отчёт)" if task is current else ""
+        rows.append((age if age is not None else -1.0, f"{task.get_name()}{marker}", name, where))
+    rows.sort(key=lambda row: row[0], reverse=True)
+    lines = [f"Задач: {len(rows)}"]
+    if isinstance(processor, PerUserUpdateProcessor):
+        stats = processor.stats()
+        lines.append(
+            f"Обновлений обработано: {stats['processed']}, в очереди: {stats['queue_depth']}, "
+            f"ожидание среднее {stats['avg_wait']:.3f} c, максимум {stats['max_wait']:.3f} c"
+        )
+    lines.append(
+        f"Флуд: отклонено {tenant().flood_guard.throttled}, дублей {tenant().flood_guard.duplicates}, "
+        f"сброшено при перегрузке {tenant().flood_guard.shed}"
+    )
+    lines.append("")
+    for age, task_name, coro_name, where in rows:
+        age_text = f"{age:8.1f} c" if age >= 0 else "       —"
+        lines.append(f"{age_text}  {task_name}  {coro_name}  @ {where}")
+    return "\n".join(lines)
+
+
+async def _run_diagnostics(context: ContextTypes.DEFAULT_TYPE, admin_id: int, kind: str) -> None:
+    """Снять выбранный отчёт и отправить его админу (выполняется отдельной задачей)."""
+
+    global _diagnostics_running
+    try:
+        if kind == "cpu":
+            report = await capture_cpu_profile(PROFILE_SECONDS)
+            await _send_report(context, admin_id, "cpu_profile.txt", report, f"🩺 Профиль CPU за {PROFILE_SECONDS} c")
+        else:
+            report = await capture_memory_snapshot(PROFILE_SECONDS)
+            await _send_report(context, admin_id, "memory_top.txt", report, f"🧠 Выделения памяти за {PROFILE_SECONDS} c")
+    except Exception as exc:
+        print(f"⚠️ Не удалось снять диагностику {kind}: {exc}")
+    finally:
+        _diagnostics_running = False
+
+
+async def diagnostics_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, payload: CallbackPayload
+) -> None:
+    """Снять профиль CPU, снимок памяти, список задач или загрузку сети по кнопке админ-панели."""
+
+    global _diagnostics_running
+    query = update.callback_query
+    admin_id = query.from_user.id
+    if admin_id != tenant().primary_admin_id:
+        await query.answer("⛔ Недостаточно прав", show_alert=True)
+        return
+    kind = payload.args[0]
+    if kind not in ("tasks", "net") and _diagnostics_running:
+        await query.answer("⏳ Профиль уже снимается, дождитесь отчёта.", show_alert=True)
+        return
+    await query.answer()
+    if kind == "tasks":
+        report = describe_tasks(context.application.update_processor)
+        await _send_report(context, admin_id, "tasks.txt", report, "🧵 Активные задачи")
+        return
+    if kind == "net":
+        await send_or_edit(context, admin_id, f"🌐 HTTP-пулы\n\n{describe_network(context.application)}")
+        return
+    _diagnostics_running = True
+    # Снимаем отдельной задачей, чтобы не держать очередь обновлений админа всё это время.
+    task = asyncio.create_task(_run_diagnostics(context, admin_id, kind), name=f"diagnostics_{kind}")
+    _task_started_at[task] = time.monotonic()
+    # Держим ссылку, чтобы задачу не собрал сборщик мусора и её отменил _post_shutdown; готовая убирается из списка.
+    background_tasks = tenant().background_tasks
+    background_tasks.append(task)
+    task.add_done_callback(lambda done: done in background_tasks and background_tasks.remove(done))
+    await send_or_edit(context, admin_id, f"⏳ Снимаю отчёт {PROFILE_SECONDS} c, пришлю документом.")
+
+
+async def callback_router(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Единая точка входа для всех кнопок: разбор callback_data и вызов обработчика."""
+
+    query = update.callback_query
+    decoded = decode_callback(query.data or "")
+    if decoded is None:
+        await query.answer("⚠️ Кнопка устарела. Откройте меню заново через /start.", show_alert=True)
+        return
+    action, payload = decoded
+    touch_user(query.from_user.id)
+    await action.handler(update, context, payload)
+
+
+# Таблица кнопок: имя действия, код в callback_data, обработчик и типы аргументов.
+_register_callback("back_to_menu", "m", back_to_menu_handler)
+_register_callback("anon", "a", choose_mode)
+_register_callback("non_anon", "n", choose_mode)
+_register_callback("text", "t", choose_type)
+_register_callback("photo", "p", choose_type)
+_register_callback("video", "v", choose_type)
+_register_callback("audio", "u", choose_type)
+_register_callback("confirm_send", "s", confirm_or_cancel)
+_register_callback("cancel_send", "x", confirm_or_cancel)
+_register_callback("mod_open", "o", moderation_open_handler)
+_register_callback("mod_open_item", "O", moderation_open_handler, int)
+_register_callback("mod_media", "e", moderation_media_handler, int)
+_register_callback("mod_approve", "y", moderation_decide_handler, int)
+_register_callback("mod_reject", "r", moderation_decide_handler, int)
+_register_callback("pub_list", "q", publications_handler, int)
+_register_callback("pub_up", "U", publications_handler, int, int)
+_register_callback("pub_down", "V", publications_handler, int, int)
+_register_callback("pub_cancel", "Z", publications_handler, int, int)
+_register_callback("pub_retry", "F", publications_handler, int, int)
+_register_callback("add_caption", "k", add_caption_handler)
+_register_callback("profile", "f", profile_handler)
+_register_callback("withdraw", "w", withdraw_handler)
+_register_callback("withdraw_confirm", "W", withdraw_confirm_handler)
+_register_callback("withdraw_cancel", "X", withdraw_confirm_handler)
+_register_callback("links", "l", links_handler)
+_register_callback("delete_post", "d", delete_post_handler)
+_register_callback("delete_confirm", "D", delete_confirm_handler)
+_register_callback("delete_cancel", "Y", delete_confirm_handler)
+_register_callback("admin_panel", "A", admin_panel_handler)
+_register_callback("broadcast_start", "B", broadcast_start_handler)
+_register_callback("broadcast_segment", "b", broadcast_segment_handler, str)
+_register_callback("sync_db", "S", sync_db_handler)
+_register_callback("backup", "K", backup_handler)
+_register_callback("notify_settings", "N", notify_settings_handler)
+_register_callback("notify_toggle", "T", notify_settings_handler, str)
+_register_callback("diagnostics", "g", diagnostics_handler, str)
+_register_callback("dashboard", "c", dashboard_handler)
+_register_callback("payouts", "P", payouts_handler)
+_register_callback("payout_export", "E", payouts_handler)
+_register_callback("payout_csv", "R", payouts_handler, int)
+_register_callback("payout_paid", "I", payouts_handler, int)
+_register_callback("payout_paid_confirm", "J", payouts_handler, int)
+_register_callback("history_page", "h", history_handler, int)
+_register_callback("history_newer", "H", history_handler, int)
+_register_callback("history_export", "L", history_handler, str)
+
+
+# ======================== ЗАЩИТА ОТ ФЛУДА ========================
+class FloodGuard:
+    """Ограничитель частоты действий: token bucket на пользователя и отсев двойных нажатий."""
+
+    def __init__(self, rate: float, burst: int, duplicate_window: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.duplicate_window = duplicate_window
+        self._buckets: Dict[int, Tuple[float, float]] = {}
+        self._last_press: Dict[int, Tuple[str, float]] = {}
+        self.throttled = 0
+        self.duplicates = 0
+        self.shed = 0
+
+    def allow(self, user_id: int, now: float) -> bool:
+        """Списать токен пользователя; вернуть False, если лимит исчерпан."""
+
+        tokens, updated = self._buckets.get(user_id, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+        if tokens < 1.0:
+            self._buckets[user_id] = (tokens, now)
+            self.throttled += 1
+            return False
+        self._buckets[user_id] = (tokens - 1.0, now)
+        if len(self._buckets) > 10000:
+            self._prune(now)
+        return True
+
+    def is_duplicate(self, user_id: int, data: str, now: float) -> bool:
+        """Проверить, не нажата ли та же кнопка повторно в пределах окна."""
+
+        previous = self._last_press.get(user_id)
+        self._last_press[user_id] = (data, now)
+        if previous is not None and previous[0] == data and now - previous[1] < self.duplicate_window:
+            self.duplicates += 1
+            return True
+        return False
+
+    def _prune(self, now: float) -> None:
+        """Удалить записи пользователей, чьи корзины уже полностью восстановились."""
+
+        full_after = self.burst / self.rate
+        self._buckets = {uid: b for uid, b in self._buckets.items() if now - b[1] < full_after}
+        self._last_press = {
+            uid: press for uid, press in self._last_press.items() if now - press[1] < self.duplicate_window
+        }
+
+
+async def _answer_quietly(query, text: Optional[str] = None) -> None:
+    """Ответить на нажатие кнопки, не падая из-за сетевой ошибки."""
+
+    try:
+        await query.answer(text)
+    except Exception:
+        pass
+
+
+async def admit_update(update: object, queue_depth: int) -> bool:
+    """Решить, пропускать ли обновление в обработку; False — флуд, двойное нажатие или лишняя работа при перегрузке.
+
+    Вызывается при получении обновления, до очереди пользователя и слотов обработки:
+    отброшенное обновление не занимает место в очереди, а окно двойного нажатия
+    считается от прихода нажатий, а не от конца обработки предыдущего.
+    """
+
+    user_id = _update_user_id(update)
+    if not isinstance(update, Update) or user_id is None or user_id in tenant().admin_ids:
+        return True
+    now = time.monotonic()
+    query = update.callback_query
+    if query is not None:
+        data = query.data or ""
+        if tenant().flood_guard.is_duplicate(user_id, data, now):
+            await _answer_quietly(query)
+            return False
+        if not tenant().flood_guard.allow(user_id, now):
+            await _answer_quietly(query, "⏳ Слишком часто. Подождите пару секунд.")
+            return False
+        if queue_depth >= OVERLOAD_QUEUE_DEPTH:
+            decoded = decode_callback(data)
+            if decoded is not None and decoded[1].action in NON_CRITICAL_ACTIONS:
+                tenant().flood_guard.shed += 1
+                await _answer_quietly(query, "🐢 Бот сейчас перегружен, попробуйте чуть позже.")
+                return False
+        return True
+    return update.message is None or tenant().flood_guard.allow(user_id, now)
+
+
+# ======================== СЕТЬ ========================
+class MeteredRequest(BaseRequest):
+    """Пул HTTP-соединений одного класса запросов с повторами и счётчиками загрузки.
+
+    Повторяется только то, что безопасно повторить: запрос, который не дождался
+    свободного соединения (он не ушёл в Telegram), и запросы на чтение — get-методы
+    Bot API и скачивание файлов. Пауза перед повтором случайная, чтобы после сбоя
+    сети запросы не возвращались одной волной.
+    """
+
+    def __init__(self, name: str, *, retries: int = HTTP_RETRY_ATTEMPTS) -> None:
+        self.name = name
+        self.size = HTTP_POOL_SIZES[name]
+        self.retries = retries
+        timeouts = HTTP_TIMEOUTS[name]
+        http2 = name != "poll" and HTTP2_ENABLED and importlib.util.find_spec("h2") is not None
+        self._request = HTTPXRequest(
+            connection_pool_size=self.size,
+            connect_timeout=timeouts["connect"],
+            read_timeout=timeouts["read"],
+            write_timeout=timeouts["write"],
+            media_write_timeout=timeouts["write"],
+            pool_timeout=timeouts["pool"],
+            http_version="2" if http2 else "1.1",
+            httpx_kwargs={
+                "limits": httpx.Limits(
+                    max_connections=self.size,
+                    max_keepalive_connections=self.size,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+                )
+            },
+        )
+        self.http_version = "2" if http2 else "1.1"
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.saturated = 0
+        self.pool_timeouts = 0
+        self.retried = 0
+        self.failed = 0
+        self.busy_time = 0.0
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return self._request.read_timeout
+
+    async def initialize(self) -> None:
+        await self._request.initialize()
+
+    async def shutdown(self) -> None:
+        await self._request.shutdown()
+
+    @staticmethod
+    def _is_idempotent(url: str, method: str) -> bool:
+        """Можно ли повторить запрос, который мог дойти до Telegram."""
+
+        return method == "GET" or url.rsplit("/", 1)[-1].startswith("get")
+
+    def _retry_delay(self, attempt: int) -> float:
+        """Случайная пауза перед повтором в окне, растущем вдвое с каждой попыткой."""
+
+        return random.uniform(0, min(HTTP_RETRY_MAX, HTTP_RETRY_BASE * 2**attempt))
+
+    async def do_request(self, url: str, method: str, *args, **kwargs) -> Tuple[int, bytes]:
+        attempt = 0
+        while True:
+            self.requests += 1
+            if self.in_flight >= self.size:
+                self.saturated += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            started = time.perf_counter()
+            try:
+                return await self._request.do_request(url, method, *args, **kwargs)
+            except (TimedOut, NetworkError) as exc:
+                pool_timeout = isinstance(exc.__cause__, httpx.PoolTimeout)
+                self.pool_timeouts += pool_timeout
+                if attempt >= self.retries or not (pool_timeout or self._is_idempotent(url, method)):
+                    self.failed += 1
+                    raise
+                error = exc.__class__.__name__
+            finally:
+                self.in_flight -= 1
+                self.busy_time += time.perf_counter() - started
+            delay = self._retry_delay(attempt)
+            attempt += 1
+            self.retried += 1
+            print(f"🔁 [{self.name}] {error}, повтор {attempt}/{self.retries} через {delay:.2f} c")
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, float]:
+        """Вернуть счётчики пула: запросы, насыщение, таймауты ожидания, повторы."""
+
+        return {
+            "size": self.size,
+            "http": self.http_version,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "requests": self.requests,
+            "saturated_share": self.saturated / self.requests if self.requests else 0.0,
+            "pool_timeouts": self.pool_timeouts,
+            "retried": self.retried,
+            "failed": self.failed,
+            "avg_time": self.busy_time / self.requests if self.requests else 0.0,
+        }
+
+
+class RoutedRequest(BaseRequest):
+    """Запросы к Bot API: загрузка и скачивание файлов идут в отдельный пул, остальное — в общий.
+
+    Так многомегабайтное видео не занимает соединения, которые нужны ответам на кнопки.
+    """
+
+    def __init__(self) -> None:
+        self.api = MeteredRequest("api")
+        self.media = MeteredRequest("media")
+
+    @property
+    def pools(self) -> list[MeteredRequest]:
+        return [self.api, self.media]
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return self.api.read_timeout
+
+    async def initialize(self) -> None:
+        await asyncio.gather(self.api.initialize(), self.media.initialize())
+
+    async def shutdown(self) -> None:
+        await asyncio.gather(self.api.shutdown(), self.media.shutdown())
+
+    async def do_request(self, url: str, method: str, request_data=None, *args, **kwargs) -> Tuple[int, bytes]:
+        is_media = "/file/bot" in url or (request_data is not None and request_data.contains_files)
+        pool = self.media if is_media else self.api
+        return await pool.do_request(url, method, request_data, *args, **kwargs)
+
+
+def describe_network(app: Application) -> str:
+    """Вернуть отчёт о загрузке HTTP-пулов бота."""
+
+    lines = []
+    for pool in app.bot_data.get("http_pools", []):
+        stats = pool.stats()
+        lines.append(
+            f"{pool.name}: HTTP/{stats['http']}, занято {stats['in_flight']}/{stats['size']} "
+            f"(пик {stats['peak_in_flight']}), запросов {stats['requests']}, "
+            f"при полном пуле {stats['saturated_share'] * 100:.1f}%, таймаутов ожидания {stats['pool_timeouts']}, "
+            f"повторов {stats['retried']}, ошибок {stats['failed']}, среднее {stats['avg_time'] * 1e3:.0f} мс"
+        )
+    return "\n".join(lines) or "Пулы HTTP не настроены."
+
+
+# ======================== НЕСКОЛЬКО БОТОВ В ОДНОМ ПРОЦЕССЕ ========================
+@dataclass(eq=False)
+class Tenant:
+    """Настройки и состояние одного бота: токен, админы, канал и собственный каталог данных.
+
+    Все функции работают с ботом, выбранным через tenant(), поэтому в одном процессе
+    можно запустить несколько ботов, и их данные не пересекаются.
+    """
+
+    name: str
+    token: str
+    primary_admin_id: int
+    secondary_admin_id: int
+    channel_id: int | str
+    data_dir: Path
+    media_dir: Optional[Path] = None
+    subscribe_channel: str = SUBSCRIBE_CHANNEL
+    chat_url: str = CHAT_URL
+    channel_url: str = CHANNEL_URL
+    bot_username: str = BOT_USERNAME
+    user_states: Dict[int, Dict] = field(default_factory=dict)
+    last_seen_written: Dict[int, float] = field(default_factory=dict)
+    background_tasks: list = field(default_factory=list)
+    notifier: AdminNotifier = field(default_factory=AdminNotifier)
+    storage: Storage = field(default_factory=SQLiteStorage)
+    fallback_video_id: Optional[str] = None
+    ready: bool = False
+    warmup: Dict[str, float] = field(default_factory=dict)
+    flood_guard: FloodGuard = field(
+        default_factory=lambda: FloodGuard(FLOOD_RATE, FLOOD_BURST, DUPLICATE_PRESS_WINDOW)
+    )
+
+    def __post_init__(self) -> None:
+        self.data_dir = Path(self.data_dir)
+        self.media_dir = Path(self.media_dir) if self.media_dir else self.data_dir / "media"
+        self.callback_secret = hashlib.sha256(f"callback:{self.token}".encode()).digest()
+
+    @property
+    def admin_ids(self) -> list[int]:
+        """Все администраторы бота, которым пересылаются заявки."""
+
+        return sorted({self.primary_admin_id, self.secondary_admin_id})
+
+    @property
+    def db_path(self) -> Path:
+        return self.data_dir / "bot.db"
+
+    @property
+    def users_file(self) -> Path:
+        return self.data_dir / "users.txt"
+
+    @property
+    def history_file(self) -> Path:
+        return self.data_dir / "history.txt"
+
+    @property
+    def balance_file(self) -> Path:
+        return self.data_dir / "balance.txt"
+
+    @property
+    def backup_dir(self) -> Path:
+        return self.data_dir / "backups"
+
+    @property
+    def channel_footer(self) -> str:
+        """Подпись для публикаций в канале."""
+
+        return (
+            f"\n\n✉️ Отправить анонимное сообщение в канал - {self.bot_username}"
+            f"\n🎉 Наш веселенький чат - {self.chat_url}"
+        )
+
+    def prepare(self) -> None:
+        """Создать каталоги данных и таблицы базы бота."""
+
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.media_dir.mkdir(parents=True, exist_ok=True)
+        with use_tenant(self):
+            _init_db()
+            self.storage.init()
+
+
+# Бот по умолчанию — настройки из cfg.py и каталоги data/ и media_daun/.
+DEFAULT_TENANT = Tenant(
+    name="default",
+    token=TOKEN,
+    primary_admin_id=PRIMARY_ADMIN_ID,
+    secondary_admin_id=SECONDARY_ADMIN_ID,
+    channel_id=CHANNEL_ID,
+    data_dir=DATA_DIR,
+    media_dir=MEDIA_DIR,
+)
+_current_tenant: contextvars.ContextVar[Tenant] = contextvars.ContextVar("tenant", default=DEFAULT_TENANT)
+
+
+def tenant() -> Tenant:
+    """Вернуть бота, в контексте которого выполняется текущий код."""
+
+    return _current_tenant.get()
+
+
+class use_tenant:
+    """Контекстный менеджер: выполнить блок кода от имени указанного бота."""
+
+    def __init__(self, current: Tenant) -> None:
+        self.current = current
+        self._token: Optional[contextvars.Token] = None
+
+    def __enter__(self) -> Tenant:
+        self._token = _current_tenant.set(self.current)
+        return self.current
 
-    _init_db()
-    app = ApplicationBuilder().token(TOKEN).build()
+    def __exit__(self, *exc_info) -> None:
+        _current_tenant.reset(self._token)
+
+
+def load_tenants(path: Path) -> list[Tenant]:
+    """Прочитать список ботов из JSON-файла.
+
+    Формат: список объектов с полями name, token, main_admin, second_admin, channel_id,
+    data_dir и необязательными media_dir, subscribe_channel, chat_url, channel_url, bot_username.
+    """
+
+    tenants = []
+    for item in json.loads(path.read_text(encoding="utf-8")):
+        optional = {
+            key: item[key]
+            for key in ("media_dir", "subscribe_channel", "chat_url", "channel_url", "bot_username")
+            if key in item
+        }
+        tenants.append(
+            Tenant(
+                name=item["name"],
+                token=item["token"],
+                primary_admin_id=int(item["main_admin"]),
+                secondary_admin_id=int(item.get("second_admin", item["main_admin"])),
+                channel_id=item["channel_id"],
+                data_dir=_project_path(item["data_dir"]),
+                **optional,
+            )
+        )
+    if len({t.name for t in tenants}) != len(tenants) or len({t.data_dir for t in tenants}) != len(tenants):
+        raise ValueError("У каждого бота должны быть своё имя и свой каталог данных")
+    return tenants
+
+
+# Общий пул потоков для тяжёлых операций с базой всех ботов процесса.
+DB_EXECUTOR = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+
+
+async def run_db(func, *args):
+    """Выполнить блокирующую функцию работы с базой в общем пуле, сохранив текущего бота."""
+
+    context = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(DB_EXECUTOR, functools.partial(context.run, func, *args))
+
+
+class SharedRequest(BaseRequest):
+    """Общий HTTP-пул для нескольких ботов: закрывается, когда его отпустил последний бот."""
+
+    def __init__(self, request: RoutedRequest) -> None:
+        self._request = request
+        self._users = 0
+
+    @property
+    def pools(self) -> list[MeteredRequest]:
+        return self._request.pools
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return self._request.read_timeout
+
+    async def initialize(self) -> None:
+        if not self._users:
+            await self._request.initialize()
+        self._users += 1
+
+    async def shutdown(self) -> None:
+        self._users = max(self._users - 1, 0)
+        if not self._users:
+            await self._request.shutdown()
+
+    async def do_request(self, *args, **kwargs) -> Tuple[int, bytes]:
+        return await self._request.do_request(*args, **kwargs)
+
+
+def tenant_report(apps: list[Application], since: float, baseline: Dict[str, int]) -> str:
+    """Собрать отчёт о нагрузке каждого бота: обновления, ожидание, время обработки, память состояний."""
+
+    elapsed = max(time.monotonic() - since, 1e-9)
+    lines = [f"📊 Нагрузка ботов за {elapsed:.0f} c:"]
+    for app in apps:
+        current = app.bot_data["tenant"]
+        processor = app.update_processor
+        stats = processor.stats() if isinstance(processor, PerUserUpdateProcessor) else {}
+        processed = int(stats.get("processed", 0))
+        delta = processed - baseline.get(current.name, 0)
+        baseline[current.name] = processed
+        db_size = current.db_path.stat().st_size / 2**20 if current.db_path.exists() else 0.0
+        lines.append(
+            f"  {current.name}: {delta / elapsed * 60:.1f} обн/мин, ожидание {stats.get('avg_wait', 0.0) * 1e3:.1f} мс, "
+            f"обработка {stats.get('avg_busy', 0.0) * 1e3:.1f} мс, в очереди {stats.get('queue_depth', 0)}, "
+            f"диалогов {len(current.user_states)}, база {db_size:.1f} МиБ"
+        )
+    return "\n".join(lines)
+
+
+async def _run_tenants(tenants: list[Tenant]) -> None:
+    """Запустить всех ботов в одном event loop с общим HTTP-пулом и пулом базы."""
+
+    shared_request = SharedRequest(RoutedRequest())
+    apps = [build_application(current, request=shared_request) for current in tenants]
+    STARTUP.mark("сборка")
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # На Windows сигналы в event loop не поддерживаются — остановка по Ctrl+C.
+
+    started = []
+    try:
+        for app in apps:
+            with use_tenant(app.bot_data["tenant"]):
+                await app.initialize()
+                await app.post_init(app)
+                await app.updater.start_polling()
+                await app.start()
+            started.append(app)
+            print(f"🤖 Бот {app.bot_data['tenant'].name} запущен...")
+        since, baseline = time.monotonic(), {}
+        while not stop_event.is_set():
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=TENANT_REPORT_INTERVAL)
+            except asyncio.TimeoutError:
+                print(tenant_report(apps, since, baseline))
+                since = time.monotonic()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for app in reversed(started):
+            with use_tenant(app.bot_data["tenant"]):
+                await app.updater.stop()
+                await app.stop()
+                await app.post_stop(app)
+                await app.shutdown()
+                await app.post_shutdown(app)
+
+
+def run_tenants(path: Path) -> None:
+    """Точка входа режима нескольких ботов: python start.py --tenants tenants.json."""
+
+    tenants = load_tenants(path)
+    for current in tenants:
+        current.prepare()
+    STARTUP.mark("база")
+    try:
+        asyncio.run(_run_tenants(tenants))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        DB_EXECUTOR.shutdown(wait=True)
+
+
+# ======================== ЗАПУСК ========================
+class StartupReport:
+    """Время этапов запуска процесса: от импорта до начала приёма обновлений."""
+
+    def __init__(self, started: float) -> None:
+        self.started = started
+        self.phases: Dict[str, float] = {}
+        self._last = started
+
+    def mark(self, phase: str) -> None:
+        """Завершить этап: записать время с конца предыдущего этапа."""
+
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    @property
+    def total(self) -> float:
+        return self._last - self.started
+
+    def summary(self) -> str:
+        parts = ", ".join(f"{phase} {seconds:.2f} c" for phase, seconds in self.phases.items())
+        return f"{parts} — всего {self.total:.2f} c"
+
+
+STARTUP = StartupReport(_IMPORT_STARTED)
+
+
+async def _wait_until_running(app: Application) -> None:
+    """Дождаться, пока приложение начнёт принимать обновления."""
+
+    while not app.running or (app.updater and not app.updater.running):
+        await asyncio.sleep(0.02)
+
+
+async def _warm_fallback_video(app: Application) -> None:
+    """Проверить сохранённый file_id видео-заглушки; до проверки пост уходит с загрузкой файла."""
+
+    cached = await run_db(get_meta, "fallback_video")
+    if not cached:
+        return
+    signature, _, file_id = cached.partition(" ")
+    if signature != _fallback_video_signature():
+        await run_db(set_meta, "fallback_video", None)
+        print("🎞 Видео-заглушка изменилась, file_id будет получен при следующей публикации")
+        return
+    try:
+        await app.bot.get_file(file_id)
+    except (BadRequest, Forbidden):
+        await run_db(set_meta, "fallback_video", None)
+        print("🎞 Сохранённый file_id видео-заглушки больше не действует")
+        return
+    tenant().fallback_video_id = file_id
+
+
+async def warm_up(app: Application) -> None:
+    """Фоновый прогрев после старта опроса: бот уже отвечает, а кэши заполняются.
+
+    Пока прогрев не закончен, всё работает по медленному пути: настройки уведомлений
+    читаются при первом обращении, видео-заглушка загружается файлом.
+    """
+
+    current = tenant()
+    await _wait_until_running(app)
+    if "опрос" not in STARTUP.phases:
+        STARTUP.mark("опрос")
+        marker = "⚠️" if STARTUP.total > STARTUP_BUDGET else "🚀"
+        print(f"{marker} Запуск до приёма обновлений: {STARTUP.summary()}")
+
+    steps = {
+        "настройки уведомлений": lambda: run_db(current.notifier._load_prefs),
+        "видео-заглушка": lambda: _warm_fallback_video(app),
+        "оптимизация базы": lambda: run_db(_optimize_db),
+    }
+    for name, step in steps.items():
+        started = time.perf_counter()
+        try:
+            await step()
+        except Exception as exc:
+            print(f"⚠️ [{current.name}] Прогрев «{name}» не удался: {exc}")
+        current.warmup[name] = time.perf_counter() - started
+    current.ready = True
+    details = ", ".join(f"{name} {seconds:.2f} c" for name, seconds in current.warmup.items())
+    print(f"✅ [{current.name}] Бот готов, прогрев: {details}")
+
+
+def _optimize_db() -> None:
+    """Дать SQLite обновить статистику индексов (PRAGMA optimize дешёв и рекомендуется при запуске)."""
+
+    conn = _get_db_connection()
+    conn.execute("PRAGMA optimize;")
+    conn.close()
+
+
+# Приложения, о готовности которых отвечает HTTP-проверка, и сам сервер проверки.
+_health_apps: list[Application] = []
+_health_server: Optional[asyncio.AbstractServer] = None
+
+
+def readiness_report() -> Tuple[bool, Dict[str, object]]:
+    """Готовы ли все боты процесса и подробности для ответа проверки готовности."""
+
+    bots = {
+        app.bot_data["tenant"].name: {
+            "ready": app.bot_data["tenant"].ready,
+            "running": app.running,
+            "warmup": {name: round(seconds, 3) for name, seconds in app.bot_data["tenant"].warmup.items()},
+        }
+        for app in _health_apps
+    }
+    ready = bool(bots) and all(bot["ready"] for bot in bots.values())
+    startup = {phase: round(seconds, 3) for phase, seconds in STARTUP.phases.items()}
+    return ready, {"ready": ready, "startup": startup, "bots": bots}
+
+
+async def _serve_health(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Ответить на GET /health (процесс жив) или GET /ready (все боты прогреты)."""
+
+    try:
+        request_line = (await asyncio.wait_for(reader.readline(), timeout=5)).decode("latin-1").split()
+        path = request_line[1] if len(request_line) > 1 else "/"
+        ready, report = readiness_report()
+        if path == "/health":
+            status, body = 200, {"alive": True}
+        elif path == "/ready":
+            status, body = (200 if ready else 503), report
+        else:
+            status, body = 404, {"error": "not found"}
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        reason = {200: "OK", 404: "Not Found", 503: "Service Unavailable"}[status]
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode("latin-1")
+            + payload
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_health_server(app: Application) -> None:
+    """Добавить бота в проверку готовности и запустить её сервер, если он ещё не запущен."""
+
+    global _health_server
+    _health_apps.append(app)
+    if HEALTH_PORT and _health_server is None:
+        _health_server = await asyncio.start_server(_serve_health, HEALTH_HOST, HEALTH_PORT)
+        print(f"🩺 Проверка готовности: http://{HEALTH_HOST}:{HEALTH_PORT}/ready")
+
+
+async def stop_health_server(app: Application) -> None:
+    """Убрать бота из проверки готовности; остановить сервер, когда ботов не осталось."""
+
+    global _health_server
+    if app in _health_apps:
+        _health_apps.remove(app)
+    if not _health_apps and _health_server is not None:
+        _health_server.close()
+        await _health_server.wait_closed()
+        _health_server = None
+
+
+# ======================== ФОНОВЫЕ ЗАДАЧИ ========================
+# Момент запуска известных задач (обработка обновлений, фоновые циклы) для отчёта о задачах.
+_task_started_at: "weakref.WeakKeyDictionary[asyncio.Task, float]" = weakref.WeakKeyDictionary()
+
+
+async def _run_periodic(app, interval: float, job) -> None:
+    """Вызывать job(app) каждые interval секунд, не давая ошибкам остановить цикл."""
+
+    _current_tenant.set(app.bot_data["tenant"])
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await job(app)
+        except Exception as exc:
+            print(f"⚠️ Фоновая задача {job.__name__} завершилась с ошибкой: {exc}")
+
+
+def start_periodic(app, interval: float, job) -> None:
+    """Запустить периодическую фоновую задачу."""
+
+    task = asyncio.create_task(_run_periodic(app, interval, job), name=job.__name__)
+    _task_started_at[task] = time.monotonic()
+    tenant().background_tasks.append(task)
+
+
+async def _post_init(app) -> None:
+    """Запустить прогрев и фоновые задачи после инициализации приложения."""
+
+    warm_task = asyncio.create_task(warm_up(app), name="warm_up")
+    _task_started_at[warm_task] = time.monotonic()
+    tenant().background_tasks.append(warm_task)
+    backfill_task = asyncio.create_task(backfill_rollups(app), name="backfill_rollups")
+    _task_started_at[backfill_task] = time.monotonic()
+    tenant().background_tasks.append(backfill_task)
+    await start_health_server(app)
+
+    start_periodic(app, NOTIFY_DIGEST_INTERVAL, tenant().notifier.flush)
+    start_periodic(app, PUBLISH_TICK, publish_next)
+    start_periodic(app, DUPLICATE_PRUNE_INTERVAL, prune_fingerprints)
+    start_periodic(app, ROLLUP_PRUNE_INTERVAL, prune_rollups)
+    if BACKUP_INTERVAL:
+        start_periodic(app, BACKUP_INTERVAL, scheduled_snapshot)
+
+
+async def _post_stop(app) -> None:
+    """Отправить накопленную сводку уведомлений, пока бот ещё может писать."""
+
+    await tenant().notifier.flush(app)
+
+
+async def _post_shutdown(app) -> None:
+    """Остановить фоновые задачи при завершении работы."""
+
+    for task in tenant().background_tasks:
+        task.cancel()
+    await asyncio.gather(*tenant().background_tasks, return_exceptions=True)
+    tenant().background_tasks.clear()
+    tenant().ready = False
+    await stop_health_server(app)
+    print(f"🌐 [{tenant().name}] HTTP-пулы:\n{describe_network(app)}")
+
+
+# ======================== ОБРАБОТКА ОБНОВЛЕНИЙ ========================
+def _update_user_id(update: object) -> Optional[int]:
+    """Вернуть ID пользователя, от которого пришло обновление (если он есть)."""
+
+    if isinstance(update, Update) and update.effective_user:
+        return update.effective_user.id
+    return None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений с сохранением порядка для каждого пользователя.
+
+    Обновления разных пользователей выполняются одновременно (не более
+    ``max_concurrent_updates`` штук), а обновления одного пользователя идут строго
+    друг за другом, поэтому его состояние в ``user_states`` не гоняется само с собой.
+    Для каждого обновления замеряется время ожидания в очереди и время обработки,
+    а сама обработка идёт от имени бота ``owner``.
+    """
+
+    def __init__(self, max_concurrent_updates: int, max_pending_updates: int, owner: Optional[Tenant] = None) -> None:
+        # Семафор базового класса ограничивает число ожидающих задач, а реальную
+        # параллельность ограничивает собственный семафор: иначе пользователь, ждущий
+        # своей очереди, занимал бы слот и тормозил остальных.
+        super().__init__(max(max_pending_updates, max_concurrent_updates))
+        self._workers = asyncio.Semaphore(max_concurrent_updates)
+        self._running = 0
+        self._user_locks: Dict[int, asyncio.Lock] = {}
+        self._user_waiters: Dict[int, int] = {}
+        self.owner = owner or DEFAULT_TENANT
+        self.processed = 0
+        self.total_busy = 0.0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        """Сколько обновлений сейчас ждёт своей очереди на обработку."""
+
+        return max(self.current_concurrent_updates - self._running, 0)
+
+    def stats(self) -> Dict[str, float]:
+        """Вернуть сводку по времени ожидания и обработки обновлений."""
+
+        return {
+            "processed": self.processed,
+            "avg_wait": self.total_wait / self.processed if self.processed else 0.0,
+            "avg_busy": self.total_busy / self.processed if self.processed else 0.0,
+            "max_wait": self.max_wait,
+            "last_wait": self.last_wait,
+            "queue_depth": self.queue_depth,
+        }
+
+    def _record_wait(self, update: object, waited: float) -> None:
+        """Учесть время ожидания обновления и залогировать слишком долгое."""
+
+        self.processed += 1
+        self.total_wait += waited
+        self.last_wait = waited
+        self.max_wait = max(self.max_wait, waited)
+        if waited >= SLOW_QUEUE_WAIT:
+            print(
+                f"⏳ Обновление от {_update_user_id(update)} ждало в очереди {waited:.2f} c "
+                f"(в очереди: {self.queue_depth})"
+            )
+
+    async def _run(self, update: object, coroutine, queued_at: float) -> None:
+        """Выполнить обработку обновления, учитывая его ожидание и занятый слот."""
+
+        self._record_wait(update, time.perf_counter() - queued_at)
+        self._running += 1
+        started = time.perf_counter()
+        try:
+            await coroutine
+        finally:
+            self._running -= 1
+            self.total_busy += time.perf_counter() - started
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        """Отсеять флуд, затем дождаться очереди пользователя и свободного слота и обработать обновление."""
+
+        queued_at = time.perf_counter()
+        _current_tenant.set(self.owner)
+        # Проверка до очереди пользователя и слота обработки: отброшенное обновление
+        # не ждёт за чужими и не держит их. Глубина очереди — без самого этого обновления.
+        if not await admit_update(update, self.queue_depth - 1):
+            coroutine.close()
+            return
+        task = asyncio.current_task()
+        if task is not None:
+            _task_started_at[task] = time.monotonic()
+        user_id = _update_user_id(update)
+        if user_id is None:
+            async with self._workers:
+                await self._run(update, coroutine, queued_at)
+            return
+
+        lock = self._user_locks.setdefault(user_id, asyncio.Lock())
+        self._user_waiters[user_id] = self._user_waiters.get(user_id, 0) + 1
+        try:
+            async with lock:
+                async with self._workers:
+                    await self._run(update, coroutine, queued_at)
+        finally:
+            self._user_waiters[user_id] -= 1
+            if not self._user_waiters[user_id]:
+                # Замок больше никому не нужен — убираем, чтобы словарь не рос бесконечно.
+                del self._user_waiters[user_id]
+                self._user_locks.pop(user_id, None)
+
+    async def initialize(self) -> None:
+        """Ресурсы создаются в конструкторе, дополнительная инициализация не нужна."""
+
+    async def shutdown(self) -> None:
+        """Вывести итоговую статистику и сбросить замки пользователей."""
+
+        stats = self.stats()
+        print(
+            f"📊 [{self.owner.name}] Обработано обновлений: {stats['processed']}, "
+            f"среднее ожидание {stats['avg_wait']:.3f} c, максимум {stats['max_wait']:.3f} c, "
+            f"средняя обработка {stats['avg_busy']:.3f} c"
+        )
+        self._user_locks.clear()
+        self._user_waiters.clear()
+
+
+def build_application(owner: Tenant, request: Optional[RoutedRequest | SharedRequest] = None) -> Application:
+    """Собрать приложение бота со всеми хэндлерами и фоновыми задачами.
+
+    ``request`` — пулы для запросов к Bot API (общие, если ботов несколько); получение
+    обновлений у каждого бота всегда идёт через собственное соединение.
+    """
+
+    request = request or RoutedRequest()
+    # Updater сам повторяет getUpdates после ошибок, поэтому у пула опроса своих повторов нет.
+    poll_request = MeteredRequest("poll", retries=0)
+    app = (
+        ApplicationBuilder()
+        .token(owner.token)
+        .request(request)
+        .get_updates_request(poll_request)
+        .concurrent_updates(PerUserUpdateProcessor(MAX_CONCURRENT_UPDATES, MAX_PENDING_UPDATES, owner))
+        .post_init(_post_init)
+        .post_stop(_post_stop)
+        .post_shutdown(_post_shutdown)
+        .build()
+    )
+    app.bot_data["tenant"] = owner
+    app.bot_data["http_pools"] = [poll_request, *request.pools]
 
     app.add_handler(CommandHandler("start", start))
-    app.add_handler(CallbackQueryHandler(back_to_menu_handler, pattern="^back_to_menu$"))
-    app.add_handler(CallbackQueryHandler(choose_mode, pattern="^(anon|non_anon)$"))
-    app.add_handler(CallbackQueryHandler(choose_type, pattern="^(text|photo|video|audio)$"))
-    app.add_handler(CallbackQueryHandler(confirm_or_cancel, pattern="^(confirm_send|cancel_send)$"))
-    app.add_handler(CallbackQueryHandler(post_to_channel, pattern="^post_channel"))
-    app.add_handler(CallbackQueryHandler(add_caption_handler, pattern="^add_caption$"))
-    app.add_handler(CallbackQueryHandler(profile_handler, pattern="^profile$"))
-    app.add_handler(CallbackQueryHandler(withdraw_handler, pattern="^withdraw$"))
-    app.add_handler(CallbackQueryHandler(withdraw_confirm_handler, pattern="^withdraw_(confirm|cancel)$"))
-    app.add_handler(CallbackQueryHandler(links_handler, pattern="^links$"))
-    app.add_handler(CallbackQueryHandler(delete_post_handler, pattern="^delete_post$"))
-    app.add_handler(CallbackQueryHandler(delete_confirm_handler, pattern="^delete_(confirm|cancel)$"))
-    app.add_handler(CallbackQueryHandler(admin_panel_handler, pattern="^admin_panel$"))
-    app.add_handler(CallbackQueryHandler(broadcast_start_handler, pattern="^broadcast_start$"))
-    app.add_handler(CallbackQueryHandler(sync_db_handler, pattern="^sync_db$"))
+    app.add_handler(CommandHandler("queue", queue_command))
+    app.add_handler(CommandHandler("notify", notify_command))
+    app.add_handler(CommandHandler("payout_reject", payout_reject_command))
+    app.add_handler(CommandHandler("payout_failed", payout_failed_command))
+    app.add_handler(CommandHandler("history_export", history_export_command))
+    app.add_handler(CallbackQueryHandler(callback_router))
 
     app.add_handler(MessageHandler(filters.ALL & ~filters.COMMAND, handle_message))
+    return app
+
 
+def main() -> None:
+    """Точка входа: инициализация БД, хэндлеров и запуск бота."""
+
+    parser = argparse.ArgumentParser(description="Бот для анонимных постов в канал.")
+    parser.add_argument("--backup", action="store_true", help="снять снимок базы и выйти")
+    parser.add_argument("--restore", type=Path, metavar="SNAPSHOT", help="восстановить базу из снимка и выйти")
+    parser.add_argument("--tenants", type=Path, metavar="CONFIG", help="запустить несколько ботов из JSON-файла")
+    args = parser.parse_args()
+
+    if args.tenants:
+        run_tenants(args.tenants)
+        return
+    DEFAULT_TENANT.prepare()
+    STARTUP.mark("база")
+    if args.backup:
+        snapshot, integrity = create_snapshot()
+        print(f"💾 Снимок базы сохранён: {snapshot} (проверка: {integrity})")
+        return
+    if args.restore:
+        restore_snapshot(args.restore)
+        print(f"♻️ База восстановлена из {args.restore}")
+        return
+    app = build_application(DEFAULT_TENANT)
+    STARTUP.mark("сборка")
     print("🤖 Бот запущен...")
     app.run_polling()
 
 
+STARTUP.mark("импорт")
+
 if __name__ == "__main__":
     main()
 